@@ -0,0 +1,320 @@
+"""Chunked, resumable data backfills.
+
+Backfills walk a table in primary-key order (keyset pagination) and commit one
+chunk at a time, so the write lock is only held for a single chunk and a killed
+process resumes from the last committed key instead of starting over. Progress
+is stored in the ``backfill_progress`` table inside the same transaction as
+each chunk.
+"""
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.config import settings
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+PROGRESS_TABLE = "backfill_progress"
+
+
+def _is_sqlite() -> bool:
+    return settings.database_url.startswith("sqlite")
+
+
+def _ensure_progress_table() -> None:
+    timestamp_type = "DATETIME" if _is_sqlite() else "TIMESTAMP"
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} ("
+            "name VARCHAR PRIMARY KEY, "
+            "last_key VARCHAR NOT NULL DEFAULT '', "
+            "rows_done INTEGER NOT NULL DEFAULT 0, "
+            f"finished_at {timestamp_type})"
+        ))
+
+
+def _load_progress(name: str) -> tuple[str, int, bool]:
+    with engine.connect() as conn:
+        row = conn.execute(
+            text(f"SELECT last_key, rows_done, finished_at FROM {PROGRESS_TABLE} WHERE name = :name"),
+            {"name": name},
+        ).first()
+    if not row:
+        return "", 0, False
+    return row[0] or "", row[1] or 0, row[2] is not None
+
+
+def _save_progress(conn: Connection, name: str, last_key: str, rows_done: int, finished: bool = False) -> None:
+    params = {
+        "name": name,
+        "last_key": last_key,
+        "rows_done": rows_done,
+        "finished_at": datetime.utcnow() if finished else None,
+    }
+    updated = conn.execute(
+        text(
+            f"UPDATE {PROGRESS_TABLE} SET last_key = :last_key, rows_done = :rows_done, "
+            "finished_at = :finished_at WHERE name = :name"
+        ),
+        params,
+    ).rowcount
+    if not updated:
+        conn.execute(
+            text(
+                f"INSERT INTO {PROGRESS_TABLE} (name, last_key, rows_done, finished_at) "
+                "VALUES (:name, :last_key, :rows_done, :finished_at)"
+            ),
+            params,
+        )
+
+
+def run_keyset_backfill(
+    name: str,
+    select_keys_sql: str,
+    apply_chunk: Callable[[Connection, str, str], int],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """
+    Run a resumable backfill and return the number of rows it touched.
+
+    ``select_keys_sql`` must return one ordered key column and accept ``:after``
+    and ``:limit`` bind parameters, e.g.
+    ``SELECT id FROM tasks WHERE ... AND id > :after ORDER BY id LIMIT :limit``.
+    ``apply_chunk`` receives the open transaction and the chunk's first and
+    last key (inclusive) and returns how many rows it updated.
+    """
+    _ensure_progress_table()
+    last_key, rows_done, finished = _load_progress(name)
+    if finished:
+        return 0
+    if last_key:
+        logger.info("Backfill %s: resuming after key %s (%s rows already done)", name, last_key, rows_done)
+
+    started = time.monotonic()
+    touched = 0
+    while True:
+        with engine.begin() as conn:
+            keys = [
+                row[0] for row in conn.execute(
+                    text(select_keys_sql), {"after": last_key, "limit": chunk_size}
+                )
+            ]
+            if keys:
+                updated = apply_chunk(conn, keys[0], keys[-1])
+                last_key = keys[-1]
+                rows_done += updated
+                touched += updated
+            done = len(keys) < chunk_size
+            _save_progress(conn, name, last_key, rows_done, finished=done)
+        if keys:
+            logger.info("Backfill %s: %s rows updated so far (last key %s)", name, rows_done, last_key)
+        if done:
+            break
+
+    logger.info("Backfill %s finished: %s rows in %.2fs", name, touched, time.monotonic() - started)
+    return touched
+
+
+# ---------------------------------------------------------------------------
+# Task time windows
+# ---------------------------------------------------------------------------
+
+_TASK_WINDOW_KEYS_SQL = (
+    "SELECT id FROM tasks WHERE (scheduled_time IS NULL OR deadline IS NULL) "
+    "AND id > :after ORDER BY id LIMIT :limit"
+)
+
+# Same rules as TaskService._normalize_task_window, anchored on created_at.
+_TASK_WINDOW_POSTGRES_SQL = """
+    UPDATE tasks SET
+        scheduled_time = w.start_at,
+        scheduled_date = COALESCE(tasks.scheduled_date, w.start_at),
+        deadline = w.deadline_at,
+        duration = COALESCE(
+            tasks.duration,
+            GREATEST(FLOOR(EXTRACT(EPOCH FROM (w.deadline_at - w.start_at)) / 60)::int, 1)
+        ),
+        is_time_blocked = tasks.scheduled_time IS NOT NULL
+    FROM (
+        SELECT s.id, s.start_at,
+               CASE WHEN COALESCE(s.deadline, s.start_at + INTERVAL '1 hour') <= s.start_at
+                    THEN s.start_at + INTERVAL '1 hour'
+                    ELSE COALESCE(s.deadline, s.start_at + INTERVAL '1 hour')
+               END AS deadline_at
+        FROM (
+            SELECT id, deadline,
+                   COALESCE(scheduled_time, deadline - INTERVAL '1 hour', created_at) AS start_at
+            FROM tasks
+            WHERE id BETWEEN :first_key AND :last_key
+              AND (scheduled_time IS NULL OR deadline IS NULL)
+              AND COALESCE(scheduled_time, deadline, created_at) IS NOT NULL
+        ) s
+    ) w
+    WHERE tasks.id = w.id
+"""
+
+
+def _parse_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _apply_task_window_chunk_sqlite(conn: Connection, first_key: str, last_key: str) -> int:
+    rows = conn.execute(
+        text(
+            "SELECT id, created_at, scheduled_time, deadline FROM tasks "
+            "WHERE id BETWEEN :first_key AND :last_key "
+            "AND (scheduled_time IS NULL OR deadline IS NULL)"
+        ),
+        {"first_key": first_key, "last_key": last_key},
+    ).mappings().all()
+
+    updates = []
+    for row in rows:
+        created_at = _parse_datetime(row["created_at"])
+        scheduled_time = _parse_datetime(row["scheduled_time"])
+        deadline = _parse_datetime(row["deadline"])
+        if created_at is None and scheduled_time is None and deadline is None:
+            continue
+
+        start_at = scheduled_time or (deadline - timedelta(hours=1) if deadline else created_at)
+        deadline_at = deadline or start_at + timedelta(hours=1)
+        if deadline_at <= start_at:
+            deadline_at = start_at + timedelta(hours=1)
+
+        updates.append({
+            "id": row["id"],
+            "scheduled_time": start_at,
+            "deadline": deadline_at,
+            "duration": max(int((deadline_at - start_at).total_seconds() // 60), 1),
+            "is_time_blocked": scheduled_time is not None,
+        })
+
+    if updates:
+        conn.execute(
+            text(
+                "UPDATE tasks SET "
+                "scheduled_time = :scheduled_time, "
+                "scheduled_date = COALESCE(scheduled_date, :scheduled_time), "
+                "deadline = :deadline, "
+                "duration = COALESCE(duration, :duration), "
+                "is_time_blocked = :is_time_blocked "
+                "WHERE id = :id"
+            ),
+            updates,
+        )
+    return len(updates)
+
+
+def _apply_task_window_chunk_postgres(conn: Connection, first_key: str, last_key: str) -> int:
+    return conn.execute(
+        text(_TASK_WINDOW_POSTGRES_SQL), {"first_key": first_key, "last_key": last_key}
+    ).rowcount
+
+
+def backfill_task_time_windows(chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Give every task both a start time and a deadline."""
+    apply_chunk = _apply_task_window_chunk_sqlite if _is_sqlite() else _apply_task_window_chunk_postgres
+    return run_keyset_backfill("task_time_windows", _TASK_WINDOW_KEYS_SQL, apply_chunk, chunk_size=chunk_size)
+
+
+# ---------------------------------------------------------------------------
+# Milestone order
+# ---------------------------------------------------------------------------
+
+_MILESTONE_PROJECT_KEYS_SQL = (
+    "SELECT DISTINCT project_id FROM milestones WHERE project_id > :after "
+    "ORDER BY project_id LIMIT :limit"
+)
+
+# Order by target date (undated last), then id; only fills unset positions.
+_MILESTONE_ORDER_SQL = """
+    UPDATE milestones SET order_index = (
+        SELECT ranked.rn FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY project_id
+                ORDER BY (target_date IS NULL) ASC, target_date ASC, id ASC
+            ) - 1 AS rn
+            FROM milestones
+            WHERE project_id BETWEEN :first_key AND :last_key
+        ) ranked WHERE ranked.id = milestones.id
+    )
+    WHERE project_id BETWEEN :first_key AND :last_key AND (order_index IS NULL OR order_index = 0)
+"""
+
+
+def _apply_milestone_order_chunk(conn: Connection, first_key: str, last_key: str) -> int:
+    return conn.execute(
+        text(_MILESTONE_ORDER_SQL), {"first_key": first_key, "last_key": last_key}
+    ).rowcount
+
+
+def backfill_milestone_order(chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Assign per-project ``order_index`` to milestones that have none."""
+    return run_keyset_backfill(
+        "milestone_order", _MILESTONE_PROJECT_KEYS_SQL, _apply_milestone_order_chunk, chunk_size=chunk_size
+    )
+
+
+# ---------------------------------------------------------------------------
+# Task tags
+# ---------------------------------------------------------------------------
+
+_TASK_TAG_KEYS_SQL = (
+    "SELECT id FROM tasks WHERE tags IS NOT NULL AND tags != '' AND tags != '[]' "
+    "AND id > :after ORDER BY id LIMIT :limit"
+)
+
+
+def _apply_task_tags_chunk(conn: Connection, first_key: str, last_key: str) -> int:
+    rows = conn.execute(
+        text(
+            "SELECT id, user_id, tags FROM tasks WHERE id BETWEEN :first_key AND :last_key "
+            "AND tags IS NOT NULL AND tags != '' AND tags != '[]'"
+        ),
+        {"first_key": first_key, "last_key": last_key},
+    ).all()
+
+    inserts = []
+    for task_id, user_id, raw in rows:
+        try:
+            tags = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(tags, list):
+            continue
+        # Same normalization as TaskService._set_task_tags.
+        for tag in {str(t).strip().lstrip("#").strip() for t in tags} - {""}:
+            inserts.append({"task_id": task_id, "tag": tag, "user_id": user_id})
+
+    # Re-running a chunk (e.g. after a crash) must not hit the primary key.
+    conn.execute(
+        text("DELETE FROM task_tags WHERE task_id BETWEEN :first_key AND :last_key"),
+        {"first_key": first_key, "last_key": last_key},
+    )
+    if inserts:
+        conn.execute(
+            text("INSERT INTO task_tags (task_id, tag, user_id) VALUES (:task_id, :tag, :user_id)"),
+            inserts,
+        )
+    return len(inserts)
+
+
+def backfill_task_tags(chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Populate ``task_tags`` from the JSON ``tasks.tags`` column."""
+    return run_keyset_backfill("task_tags", _TASK_TAG_KEYS_SQL, _apply_task_tags_chunk, chunk_size=chunk_size)
@@ -6,6 +6,21 @@ class Settings(BaseSettings):
     """Application settings loaded from environment variables."""
     
     database_url: str = "sqlite:///./data/person_gift.db"
+
+    # SQLite connection profile (applied as PRAGMAs on every new connection)
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024  # bytes
+    sqlite_cache_size: int = -64000  # negative = KiB, i.e. ~64 MB per connection
+    sqlite_temp_store: str = "MEMORY"
+
+    # Connection pool (server databases such as the docker-compose Postgres)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30  # seconds
+    db_pool_recycle: int = 1800  # seconds
+    db_pool_pre_ping: bool = True
     gemini_api_key: str = ""
     jwt_secret: str = "change-me-in-production"
     jwt_algorithm: str = "HS256"
@@ -20,8 +35,46 @@ class Settings(BaseSettings):
     qwen_base_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"
     qwen_model: str = "qwen-plus"
     
+    # Deadline wheel: precise OPEN -> OVERDUE transitions (hourly sweep stays as backstop)
+    deadline_wheel_enabled: bool = True
+    deadline_horizon_hours: int = 6
+    deadline_reconcile_seconds: int = 120
+    deadline_poll_seconds: int = 10
+
+    # Change feed: tombstones older than this force clients to do a full resync
+    sync_tombstone_retention_days: int = 30
+
+    # SQLite search: how often rows written outside the app get their index text
+    search_reindex_seconds: int = 300
+
     # AI provider: auto | gemini | qwen
     ai_provider: str = "auto"
+    ai_timeout_seconds: float = 120.0  # Per provider call
+    ai_gemini_max_workers: int = 4  # Threads for the blocking Gemini SDK; extra calls queue
+
+    # Judgment cache: identical evidence/bodyfat requests reuse the last provider answer
+    ai_cache_enabled: bool = True
+    ai_cache_ttl_seconds: int = 7 * 24 * 3600
+    ai_cache_max_entries: int = 2048  # In-process LRU
+    ai_cache_shared: bool = False  # Also keep results in the database for other workers
+
+    # Uploads are streamed to disk and refused past this size
+    upload_max_bytes: int = 20 * 1024 * 1024
+
+    # Images are shrunk and re-encoded before being sent to a provider
+    ai_image_max_edge: int = 1568  # Pixels, longest side
+    ai_image_format: str = "JPEG"  # JPEG | WEBP
+    ai_image_quality: int = 85
+    ai_image_passthrough_max_bytes: int = 1024 * 1024  # Small upright images are sent as uploaded
+    ai_image_cache_max_bytes: int = 32 * 1024 * 1024
+
+    # Evidence judging runs in the background; submissions beyond the queue get 503
+    evidence_judge_workers: int = 4
+    evidence_queue_max_pending: int = 200
+    evidence_judge_max_attempts: int = 3
+    evidence_judge_retry_base_seconds: float = 2.0  # Doubled after each failed attempt
+    evidence_judge_lease_seconds: int = 600  # Renewed per attempt; must outlast one attempt (all providers)
+    evidence_recover_seconds: int = 60
     
     class Config:
         env_file = ".env"
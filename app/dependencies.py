@@ -1,8 +1,10 @@
 """User authentication and authorization dependencies."""
+import hashlib
 from datetime import datetime, timedelta
 from typing import Optional
+from zoneinfo import ZoneInfo
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from passlib.context import CryptContext
@@ -11,6 +13,7 @@ from sqlalchemy.orm import Session
 from app.config import settings
 from app.database import get_db
 from app.models.user import User, UserToken, DeviceToken
+from app.services.sync_service import SyncService
 
 # Password hashing
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
@@ -82,6 +85,37 @@ def get_current_user(
     return user
 
 
+def conditional_get(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> str:
+    """
+    Strong ETag for a per-user read endpoint, answering 304 before it runs.
+
+    The tag covers the user's data version (bumped by triggers on every write
+    to the underlying tables), the URL and the current date, since several
+    views are relative to "today". Returns the tag for endpoints that build
+    their own Response.
+    """
+    version = SyncService.get_data_version(db, current_user.id)
+    local_date = datetime.now(ZoneInfo(settings.timezone)).date()
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    raw = f"{current_user.id}|{version}|{local_date}|{datetime.utcnow().date()}|{request.url.path}?{query}"
+    etag = f'"{hashlib.sha256(raw.encode()).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    return etag
+
+
 def get_device_from_token(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
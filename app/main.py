@@ -8,6 +8,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from app.database import init_db
+from app.services.ai_cache import ai_result_cache
+from app.services.evidence_queue import evidence_queue
+from app.services.image_prep import image_preparer
 from app.services.scheduler import start_scheduler, stop_scheduler
 from app.routers import (
     auth,
@@ -25,6 +28,9 @@ from app.routers import (
     dashboard_v2,
     habits,
     project_long_tasks,
+    search,
+    sync,
+    calendar,
 )
 
 logger = logging.getLogger(__name__)
@@ -34,14 +40,16 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """
     Context manager for application startup and shutdown events.
-    Initializes the database and starts the scheduler on startup.
-    Stops the scheduler on shutdown.
+    Initializes the database and starts the scheduler and evidence judging
+    workers on startup. Stops them on shutdown.
     """
     logger.info("Application startup: Initializing database and starting scheduler...")
     init_db()
     start_scheduler()
+    await evidence_queue.start()
     yield
     logger.info("Application shutdown: Stopping scheduler...")
+    await evidence_queue.stop()
     stop_scheduler()
 
 
@@ -104,6 +112,9 @@ app.include_router(dashboard_v2.router)
 # app.include_router(system_tasks.router) # Removed duplicate
 app.include_router(habits.router)
 app.include_router(project_long_tasks.router)
+app.include_router(search.router)
+app.include_router(sync.router)
+app.include_router(calendar.router)
 
 # API-prefixed aliases for frontend calls
 app.include_router(tasks.router, prefix="/api")
@@ -118,6 +129,9 @@ app.include_router(system_tasks.router, prefix="/api")
 app.include_router(habits.router, prefix="/api")
 app.include_router(project_long_tasks.router, prefix="/api")
 app.include_router(dashboard_v2.router, prefix="/api")
+app.include_router(search.router, prefix="/api")
+app.include_router(sync.router, prefix="/api")
+app.include_router(calendar.router, prefix="/api")
 
 
 @app.get("/")
@@ -132,12 +146,33 @@ def root():
 
 @app.get("/health")
 def health_check():
-    """Health check endpoint."""
-    return {"status": "healthy"}
+    """Health check endpoint, with AI judgment cache and image preparation counters."""
+    return {
+        "status": "healthy",
+        "ai_cache": ai_result_cache.stats(),
+        "ai_images": image_preparer.stats(),
+    }
 
 
 
 if __name__ == "__main__":
-    import uvicorn
-    # Use string reference for reload to work
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Personal Sovereignty System API")
+    parser.add_argument(
+        "--migrate-only",
+        action="store_true",
+        help="Apply pending database migrations and exit (run once before starting workers)",
+    )
+    args = parser.parse_args()
+
+    if args.migrate_only:
+        from app.migrations import run_migrations
+
+        logging.basicConfig(level=logging.INFO)
+        applied = run_migrations()
+        logger.info("Migrations complete: %s step(s) applied", applied)
+    else:
+        import uvicorn
+        # Use string reference for reload to work
+        uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,600 @@
+"""Versioned schema migrations.
+
+Each step is numbered and applied at most once; the highest applied number is
+stored in the ``schema_version`` table. When the stored version is current,
+``run_migrations`` returns after a single query without inspecting the schema,
+so worker boots stay cheap. Pending steps run under a process-wide lock
+(``pg_advisory_lock`` on Postgres, a lock file next to the database otherwise)
+so only one process migrates at a time.
+
+Deploys can migrate once before workers start with::
+
+    python -m app.main --migrate-only
+"""
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from app.config import settings
+from app.database import Base, engine
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_TABLE = "schema_version"
+# Arbitrary application-wide key for pg_advisory_lock.
+ADVISORY_LOCK_KEY = 724_311_902
+
+
+def _is_sqlite() -> bool:
+    return settings.database_url.startswith("sqlite")
+
+
+def get_schema_version() -> Optional[int]:
+    """Return the highest applied migration number, or None if never migrated."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text(f"SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}")).scalar()
+    except (OperationalError, ProgrammingError):
+        return None
+
+
+def _ensure_schema_version_table() -> None:
+    timestamp_type = "DATETIME" if _is_sqlite() else "TIMESTAMP"
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ("
+            "version INTEGER PRIMARY KEY, "
+            "name VARCHAR NOT NULL, "
+            f"applied_at {timestamp_type} NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        ))
+
+
+def _record_version(version: int, name: str) -> None:
+    with engine.begin() as conn:
+        conn.execute(
+            text(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, name) VALUES (:version, :name)"),
+            {"version": version, "name": name},
+        )
+
+
+def _lock_file_path() -> str:
+    database = engine.url.database if _is_sqlite() else None
+    if database and database != ":memory:":
+        return f"{database}.migrate.lock"
+    return os.path.join(tempfile.gettempdir(), "person_gift.migrate.lock")
+
+
+@contextmanager
+def _file_lock(path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a+") as handle:
+        try:
+            import fcntl
+        except ImportError:  # Windows
+            import msvcrt
+            handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def migration_lock():
+    """Block until this process is the only one allowed to migrate."""
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            conn.commit()
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                conn.commit()
+        return
+
+    with _file_lock(_lock_file_path()):
+        yield
+
+
+def run_migrations() -> int:
+    """
+    Apply pending migrations and return how many steps ran.
+
+    Fast path: one ``SELECT MAX(version)`` when the schema is already current.
+    """
+    if (get_schema_version() or 0) >= LATEST_VERSION:
+        return 0
+
+    with migration_lock():
+        _ensure_schema_version_table()
+        # Another process may have finished while we waited for the lock.
+        current = get_schema_version() or 0
+        if current >= LATEST_VERSION:
+            return 0
+
+        logger.info("Migrating schema from version %s to %s", current, LATEST_VERSION)
+        from app.models import user, task, project, exemption, device, metric, conversation, study, project_long_task, habit, planning
+        Base.metadata.create_all(bind=engine)
+
+        applied = 0
+        for version, name, step in MIGRATIONS:
+            if version <= current:
+                continue
+            started = time.monotonic()
+            step()
+            _record_version(version, name)
+            applied += 1
+            logger.info("Applied migration %03d_%s in %.2fs", version, name, time.monotonic() - started)
+        return applied
+
+
+# ---------------------------------------------------------------------------
+# Migration steps
+# ---------------------------------------------------------------------------
+
+def _ensure_tasks_long_template_column():
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+
+    columns = [col["name"] for col in inspector.get_columns("tasks")]
+    if "long_task_template_id" in columns:
+        return
+
+    with engine.begin() as conn:
+        if settings.database_url.startswith("sqlite"):
+            conn.execute(text("ALTER TABLE tasks ADD COLUMN long_task_template_id VARCHAR"))
+        else:
+            conn.execute(text("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS long_task_template_id VARCHAR"))
+
+
+def _ensure_habit_evidence_criteria_column():
+    inspector = inspect(engine)
+    if "habit_templates" not in inspector.get_table_names():
+        return
+
+    columns = [col["name"] for col in inspector.get_columns("habit_templates")]
+    if "evidence_criteria" in columns:
+        return
+
+    with engine.begin() as conn:
+        if settings.database_url.startswith("sqlite"):
+            conn.execute(text("ALTER TABLE habit_templates ADD COLUMN evidence_criteria TEXT"))
+        else:
+            conn.execute(text("ALTER TABLE habit_templates ADD COLUMN IF NOT EXISTS evidence_criteria TEXT"))
+
+
+def _ensure_conversation_planning_session_id():
+    inspector = inspect(engine)
+    if "conversation_sessions" not in inspector.get_table_names():
+        return
+
+    columns = [col["name"] for col in inspector.get_columns("conversation_sessions")]
+    if "planning_session_id" in columns:
+        return
+
+    with engine.begin() as conn:
+        if settings.database_url.startswith("sqlite"):
+            conn.execute(text("ALTER TABLE conversation_sessions ADD COLUMN planning_session_id VARCHAR"))
+        else:
+            conn.execute(text("ALTER TABLE conversation_sessions ADD COLUMN IF NOT EXISTS planning_session_id VARCHAR"))
+
+
+def _ensure_tasks_proposal_offset_column():
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+
+    columns = [col["name"] for col in inspector.get_columns("tasks")]
+    if "proposal_offset_days" in columns:
+        return
+
+    with engine.begin() as conn:
+        if settings.database_url.startswith("sqlite"):
+            conn.execute(text("ALTER TABLE tasks ADD COLUMN proposal_offset_days INTEGER"))
+        else:
+            conn.execute(text("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS proposal_offset_days INTEGER"))
+
+
+def _ensure_milestones_proposal_offset_column():
+    inspector = inspect(engine)
+    if "milestones" not in inspector.get_table_names():
+        return
+
+    columns = [col["name"] for col in inspector.get_columns("milestones")]
+    if "proposal_offset_days" in columns:
+        return
+
+    with engine.begin() as conn:
+        if settings.database_url.startswith("sqlite"):
+            conn.execute(text("ALTER TABLE milestones ADD COLUMN proposal_offset_days INTEGER"))
+        else:
+            conn.execute(text("ALTER TABLE milestones ADD COLUMN IF NOT EXISTS proposal_offset_days INTEGER"))
+
+
+def _ensure_tasks_board_lane_columns():
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+
+    columns = [col["name"] for col in inspector.get_columns("tasks")]
+    with engine.begin() as conn:
+        if "board_lane" not in columns:
+            if settings.database_url.startswith("sqlite"):
+                conn.execute(text("ALTER TABLE tasks ADD COLUMN board_lane VARCHAR"))
+            else:
+                conn.execute(text("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS board_lane VARCHAR"))
+        if "board_lane_updated_at" not in columns:
+            if settings.database_url.startswith("sqlite"):
+                conn.execute(text("ALTER TABLE tasks ADD COLUMN board_lane_updated_at DATETIME"))
+            else:
+                conn.execute(text("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS board_lane_updated_at TIMESTAMP"))
+
+
+def _ensure_milestone_order_column():
+    inspector = inspect(engine)
+    if "milestones" not in inspector.get_table_names():
+        return
+
+    columns = [col["name"] for col in inspector.get_columns("milestones")]
+    if "order_index" in columns:
+        return
+
+    with engine.begin() as conn:
+        if settings.database_url.startswith("sqlite"):
+            conn.execute(text("ALTER TABLE milestones ADD COLUMN order_index INTEGER DEFAULT 0"))
+        else:
+            conn.execute(text("ALTER TABLE milestones ADD COLUMN IF NOT EXISTS order_index INTEGER DEFAULT 0"))
+
+
+def _ensure_task_milestone_column():
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+
+    columns = [col["name"] for col in inspector.get_columns("tasks")]
+    if "milestone_id" in columns:
+        return
+
+    with engine.begin() as conn:
+        if settings.database_url.startswith("sqlite"):
+            conn.execute(text("ALTER TABLE tasks ADD COLUMN milestone_id VARCHAR"))
+        else:
+            conn.execute(text("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS milestone_id VARCHAR"))
+
+
+def _ensure_study_quick_start_columns():
+    inspector = inspect(engine)
+    if "study_sessions" not in inspector.get_table_names():
+        return
+
+    columns = [col["name"] for col in inspector.get_columns("study_sessions")]
+    with engine.begin() as conn:
+        if "is_quick_start" not in columns:
+            if settings.database_url.startswith("sqlite"):
+                conn.execute(text("ALTER TABLE study_sessions ADD COLUMN is_quick_start BOOLEAN DEFAULT 0"))
+            else:
+                conn.execute(text("ALTER TABLE study_sessions ADD COLUMN IF NOT EXISTS is_quick_start BOOLEAN DEFAULT FALSE"))
+        if "quick_start_action" not in columns:
+            if settings.database_url.startswith("sqlite"):
+                conn.execute(text("ALTER TABLE study_sessions ADD COLUMN quick_start_action VARCHAR"))
+            else:
+                conn.execute(text("ALTER TABLE study_sessions ADD COLUMN IF NOT EXISTS quick_start_action VARCHAR"))
+        if "quick_start_valid" not in columns:
+            if settings.database_url.startswith("sqlite"):
+                conn.execute(text("ALTER TABLE study_sessions ADD COLUMN quick_start_valid BOOLEAN DEFAULT 0"))
+            else:
+                conn.execute(text("ALTER TABLE study_sessions ADD COLUMN IF NOT EXISTS quick_start_valid BOOLEAN DEFAULT FALSE"))
+        if "quick_start_task_id" not in columns:
+            if settings.database_url.startswith("sqlite"):
+                conn.execute(text("ALTER TABLE study_sessions ADD COLUMN quick_start_task_id VARCHAR"))
+            else:
+                conn.execute(text("ALTER TABLE study_sessions ADD COLUMN IF NOT EXISTS quick_start_task_id VARCHAR"))
+
+
+def _ensure_task_quick_start_columns():
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+
+    columns = [col["name"] for col in inspector.get_columns("tasks")]
+    with engine.begin() as conn:
+        if "is_quick_start" not in columns:
+            if settings.database_url.startswith("sqlite"):
+                conn.execute(text("ALTER TABLE tasks ADD COLUMN is_quick_start BOOLEAN DEFAULT 0"))
+            else:
+                conn.execute(text("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS is_quick_start BOOLEAN DEFAULT FALSE"))
+        if "quick_start_action" not in columns:
+            if settings.database_url.startswith("sqlite"):
+                conn.execute(text("ALTER TABLE tasks ADD COLUMN quick_start_action TEXT"))
+            else:
+                conn.execute(text("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS quick_start_action TEXT"))
+        if "quick_start_session_id" not in columns:
+            if settings.database_url.startswith("sqlite"):
+                conn.execute(text("ALTER TABLE tasks ADD COLUMN quick_start_session_id VARCHAR"))
+            else:
+                conn.execute(text("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS quick_start_session_id VARCHAR"))
+
+
+def _backfill_task_time_windows():
+    from app.backfill import backfill_task_time_windows
+
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+    backfill_task_time_windows()
+
+
+def _backfill_milestone_order():
+    from app.backfill import backfill_milestone_order
+
+    inspector = inspect(engine)
+    if "milestones" not in inspector.get_table_names():
+        return
+    backfill_milestone_order()
+
+
+def _dedupe_long_task_generated_tasks():
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+
+    with engine.begin() as conn:
+        subquery = """
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY long_task_template_id, generated_for_date
+                    ORDER BY created_at ASC, id ASC
+                ) AS rn
+                FROM tasks
+                WHERE long_task_template_id IS NOT NULL AND generated_for_date IS NOT NULL
+            ) ranked WHERE ranked.rn > 1
+        """
+        conn.execute(text(f"UPDATE study_sessions SET task_id = NULL WHERE task_id IN ({subquery})"))
+        conn.execute(text(f"UPDATE study_sessions SET quick_start_task_id = NULL WHERE quick_start_task_id IN ({subquery})"))
+        conn.execute(text(f"UPDATE metric_entries SET task_id = NULL WHERE task_id IN ({subquery})"))
+        conn.execute(text(f"DELETE FROM tasks WHERE id IN ({subquery})"))
+
+
+def _dedupe_habit_generated_tasks():
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+
+    with engine.begin() as conn:
+        subquery = """
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY template_id, generated_for_date
+                    ORDER BY created_at ASC, id ASC
+                ) AS rn
+                FROM tasks
+                WHERE template_id IS NOT NULL AND generated_for_date IS NOT NULL
+            ) ranked WHERE ranked.rn > 1
+        """
+        conn.execute(text(f"UPDATE study_sessions SET task_id = NULL WHERE task_id IN ({subquery})"))
+        conn.execute(text(f"UPDATE study_sessions SET quick_start_task_id = NULL WHERE quick_start_task_id IN ({subquery})"))
+        conn.execute(text(f"UPDATE metric_entries SET task_id = NULL WHERE task_id IN ({subquery})"))
+        conn.execute(text(f"DELETE FROM tasks WHERE id IN ({subquery})"))
+
+
+def _ensure_long_task_daily_unique_index():
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+
+    index_name = "uq_tasks_long_template_generated_for_date"
+    existing_indexes = {idx["name"] for idx in inspector.get_indexes("tasks")}
+    if index_name in existing_indexes:
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} "
+            "ON tasks (long_task_template_id, generated_for_date)"
+        ))
+
+
+def _ensure_habit_daily_unique_index():
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+
+    index_name = "uq_tasks_habit_template_generated_for_date"
+    existing_indexes = {idx["name"] for idx in inspector.get_indexes("tasks")}
+    if index_name in existing_indexes:
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} "
+            "ON tasks (template_id, generated_for_date)"
+        ))
+
+
+# Hot access paths: per-user lists by status/deadline, schedule windows, list
+# ordering, project/milestone rollups and the overdue sweep.
+TASK_INDEXES = [
+    ("ix_tasks_user_status_deadline", "(user_id, status, deadline)", None),
+    ("ix_tasks_user_scheduled_time", "(user_id, scheduled_time)", None),
+    ("ix_tasks_user_created_at", "(user_id, created_at)", None),
+    ("ix_tasks_project_status", "(project_id, status)", None),
+    ("ix_tasks_milestone_id", "(milestone_id)", None),
+    ("ix_tasks_open_deadline", "(deadline)", "status = 'OPEN'"),
+]
+# Postgres can prove IN-list implication for partial indexes; SQLite cannot.
+POSTGRES_TASK_INDEXES = [
+    ("ix_tasks_user_active_deadline", "(user_id, deadline)", "status IN ('OPEN', 'EVIDENCE_SUBMITTED')"),
+]
+
+
+def _ensure_task_hot_path_indexes():
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+
+    indexes = list(TASK_INDEXES)
+    if engine.dialect.name == "postgresql":
+        indexes += POSTGRES_TASK_INDEXES
+
+    existing_indexes = {idx["name"] for idx in inspector.get_indexes("tasks")}
+    with engine.begin() as conn:
+        for index_name, columns, where in indexes:
+            if index_name in existing_indexes:
+                continue
+            where_clause = f" WHERE {where}" if where else ""
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON tasks {columns}{where_clause}"
+            ))
+
+
+def _ensure_user_recurring_cleanup_column():
+    inspector = inspect(engine)
+    if "users" not in inspector.get_table_names():
+        return
+
+    columns = [col["name"] for col in inspector.get_columns("users")]
+    if "last_recurring_cleanup_date" in columns:
+        return
+
+    with engine.begin() as conn:
+        if settings.database_url.startswith("sqlite"):
+            conn.execute(text("ALTER TABLE users ADD COLUMN last_recurring_cleanup_date DATE"))
+        else:
+            conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS last_recurring_cleanup_date DATE"))
+
+
+def _backfill_task_tags():
+    from app.backfill import backfill_task_tags
+    from app.models.task import TaskTag
+
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+    TaskTag.__table__.create(bind=engine, checkfirst=True)
+    backfill_task_tags()
+
+
+def _ensure_search_index():
+    from app.services.search_service import install_search_index
+
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+    install_search_index()
+
+
+def _ensure_sync_change_feed():
+    from app.services.sync_service import install_change_feed
+
+    inspector = inspect(engine)
+    if "tasks" not in inspector.get_table_names():
+        return
+    install_change_feed()
+
+
+def _ensure_data_version_triggers():
+    from app.services.sync_service import install_version_triggers
+
+    inspector = inspect(engine)
+    if "sync_state" not in inspector.get_table_names():
+        return
+    install_version_triggers()
+
+
+def _ensure_calendar_feed_tokens_table():
+    from app.models.user import CalendarFeedToken
+
+    CalendarFeedToken.__table__.create(bind=engine, checkfirst=True)
+
+
+def _ensure_evidence_judge_columns():
+    inspector = inspect(engine)
+    if "task_evidence" not in inspector.get_table_names():
+        return
+
+    columns = [col["name"] for col in inspector.get_columns("task_evidence")]
+    sqlite = settings.database_url.startswith("sqlite")
+    with engine.begin() as conn:
+        for name, ddl in (
+            ("judge_attempts", "INTEGER DEFAULT 0"),
+            ("judge_started_at", "TIMESTAMP"),
+            ("judged_at", "TIMESTAMP"),
+        ):
+            if name in columns:
+                continue
+            if sqlite:
+                conn.execute(text(f"ALTER TABLE task_evidence ADD COLUMN {name} {ddl}"))
+            else:
+                conn.execute(text(f"ALTER TABLE task_evidence ADD COLUMN IF NOT EXISTS {name} {ddl}"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_task_evidence_ai_result ON task_evidence (ai_result)"
+        ))
+
+
+def _ensure_ai_result_cache_table():
+    from app.models.task import AIResultCache
+
+    AIResultCache.__table__.create(bind=engine, checkfirst=True)
+
+
+def _ensure_sql_search_triggers():
+    from app.services.search_service import install_sql_search_triggers
+
+    install_sql_search_triggers()
+
+
+# Append new steps at the end; never renumber or reorder applied ones.
+MIGRATIONS: List[Tuple[int, str, Callable[[], None]]] = [
+    (1, "tasks_long_template_column", _ensure_tasks_long_template_column),
+    (2, "habit_evidence_criteria_column", _ensure_habit_evidence_criteria_column),
+    (3, "conversation_planning_session_id", _ensure_conversation_planning_session_id),
+    (4, "tasks_proposal_offset_column", _ensure_tasks_proposal_offset_column),
+    (5, "milestones_proposal_offset_column", _ensure_milestones_proposal_offset_column),
+    (6, "tasks_board_lane_columns", _ensure_tasks_board_lane_columns),
+    (7, "milestone_order_column", _ensure_milestone_order_column),
+    (8, "task_milestone_column", _ensure_task_milestone_column),
+    (9, "study_quick_start_columns", _ensure_study_quick_start_columns),
+    (10, "task_quick_start_columns", _ensure_task_quick_start_columns),
+    (11, "backfill_task_time_windows", _backfill_task_time_windows),
+    (12, "backfill_milestone_order", _backfill_milestone_order),
+    (13, "dedupe_long_task_generated_tasks", _dedupe_long_task_generated_tasks),
+    (14, "dedupe_habit_generated_tasks", _dedupe_habit_generated_tasks),
+    (15, "long_task_daily_unique_index", _ensure_long_task_daily_unique_index),
+    (16, "habit_daily_unique_index", _ensure_habit_daily_unique_index),
+    (17, "task_hot_path_indexes", _ensure_task_hot_path_indexes),
+    (18, "user_recurring_cleanup_column", _ensure_user_recurring_cleanup_column),
+    (19, "task_tags_backfill", _backfill_task_tags),
+    (20, "search_index", _ensure_search_index),
+    (21, "sync_change_feed", _ensure_sync_change_feed),
+    (22, "data_version_triggers", _ensure_data_version_triggers),
+    (23, "calendar_feed_tokens", _ensure_calendar_feed_tokens_table),
+    (24, "evidence_judge_columns", _ensure_evidence_judge_columns),
+    (25, "ai_result_cache", _ensure_ai_result_cache_table),
+    (26, "sql_search_triggers", _ensure_sql_search_triggers),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
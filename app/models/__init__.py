@@ -1,6 +1,6 @@
 """Models package."""
-from app.models.user import User, UserToken, DeviceToken
-from app.models.task import Task, PlanTemplate, TaskEvidence
+from app.models.user import User, UserToken, CalendarFeedToken, DeviceToken
+from app.models.task import Task, PlanTemplate, TaskEvidence, TaskTag, AIResultCache
 from app.models.project import Project, Milestone
 from app.models.exemption import ExemptionQuota, ExemptionLog, JobLock
 from app.models.device import Device
@@ -10,10 +10,13 @@ from app.models.project_long_task import ProjectLongTaskTemplate
 __all__ = [
     "User",
     "UserToken",
+    "CalendarFeedToken",
     "DeviceToken",
     "Task",
     "PlanTemplate",
     "TaskEvidence",
+    "TaskTag",
+    "AIResultCache",
     "Project",
     "Milestone",
     "ExemptionQuota",
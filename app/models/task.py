@@ -2,7 +2,7 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Boolean, Text
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Boolean, Text, Index
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -27,7 +27,7 @@ class Task(Base):
     scheduled_date = Column(DateTime, nullable=True)  # Which day this task is scheduled
     scheduled_time = Column(DateTime, nullable=True)  # What time it starts
     duration = Column(Integer, nullable=True)  # Duration in minutes
-    is_time_blocked = Column(Boolean, default=False, nullable=False)  # Has time been allocated
+    is_time_blocked = Column(Boolean, default=False, nullable=False)  # Start chosen by the user or the scheduler (False when derived from the deadline)
     
     project_id = Column(String, ForeignKey("projects.id"), nullable=True)
     milestone_id = Column(String, ForeignKey("milestones.id"), nullable=True)
@@ -59,6 +59,7 @@ class Task(Base):
     habit_template = relationship("HabitTemplate", back_populates="tasks")
     long_task_template = relationship("ProjectLongTaskTemplate", back_populates="tasks")
     evidences = relationship("TaskEvidence", back_populates="task", cascade="all, delete-orphan")
+    tag_rows = relationship("TaskTag", back_populates="task", cascade="all, delete-orphan")
 
 
 
@@ -92,10 +93,40 @@ class TaskEvidence(Base):
     evidence_type = Column(String, nullable=False)  # image/text/number
     content = Column(Text, nullable=True)  # For text/number
     image_path = Column(String, nullable=True)  # For image
-    ai_result = Column(String, nullable=True)  # pass/fail
+    ai_result = Column(String, nullable=True, index=True)  # pending/pass/fail
     ai_reason = Column(Text, nullable=True)
     extracted_values = Column(Text, nullable=True)  # JSON string
     submitted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    judge_attempts = Column(Integer, default=0, nullable=False)
+    judge_started_at = Column(DateTime, nullable=True)  # Claim by a judging worker
+    judged_at = Column(DateTime, nullable=True)
     
     # Relationships
     task = relationship("Task", back_populates="evidences")
+
+
+class AIResultCache(Base):
+    """Shared tier of the AI judgment cache (see app.services.ai_cache)."""
+    __tablename__ = "ai_result_cache"
+
+    key = Column(String, primary_key=True)  # sha256 of the request inputs
+    kind = Column(String, nullable=False)  # judge/bodyfat
+    value = Column(Text, nullable=False)  # JSON result
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class TaskTag(Base):
+    """Normalized task tags (mirrors Task.tags) for SQL filtering and counts."""
+    __tablename__ = "task_tags"
+
+    task_id = Column(String, ForeignKey("tasks.id"), primary_key=True)
+    tag = Column(String, primary_key=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+
+    __table_args__ = (
+        Index("ix_task_tags_user_tag", "user_id", "tag"),
+    )
+
+    # Relationships
+    task = relationship("Task", back_populates="tag_rows")
@@ -2,7 +2,7 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, String, DateTime, ForeignKey
+from sqlalchemy import Column, String, DateTime, Date, ForeignKey
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -18,6 +18,8 @@ class User(Base):
     
     # Habit tracking
     last_habit_generation_date = Column(DateTime, nullable=True)
+    # Local date of the last stale recurring-instance cleanup for this user
+    last_recurring_cleanup_date = Column(Date, nullable=True)
     
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
@@ -49,6 +51,16 @@ class UserToken(Base):
     user = relationship("User", back_populates="tokens")
 
 
+class CalendarFeedToken(Base):
+    """Secret token in a user's subscribable iCalendar feed URL."""
+    __tablename__ = "calendar_feed_tokens"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, unique=True)
+    token = Column(String, unique=True, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 class DeviceToken(Base):
     """Device token table."""
     __tablename__ = "device_tokens"
@@ -0,0 +1,68 @@
+"""iCalendar feed router for calendar subscriptions."""
+import hashlib
+
+from fastapi import APIRouter, Depends, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.dependencies import get_current_user
+from app.models.user import User
+from app.schemas.calendar import CalendarFeedTokenResponse
+from app.services.calendar_service import CalendarService
+
+router = APIRouter(prefix="/calendar", tags=["calendar"])
+
+
+@router.post("/token", response_model=CalendarFeedTokenResponse)
+def rotate_feed_token(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Create (or replace) the secret feed URL; the old URL stops working."""
+    token = CalendarService.rotate_token(db, current_user)
+    return CalendarFeedTokenResponse(
+        token=token,
+        url=str(request.base_url).rstrip("/") + f"/calendar/{token}.ics",
+    )
+
+
+@router.delete("/token")
+def revoke_feed_token(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Disable the feed URL."""
+    CalendarService.revoke_token(db, current_user)
+    return {"message": "Calendar feed disabled"}
+
+
+@router.get("/{token}.ics")
+def get_calendar_feed(
+    token: str,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    iCalendar feed of time blocks, deadlines, fixed blocks and long tasks.
+
+    Authenticated by the secret token in the URL, since calendar clients
+    cannot send headers. Answers 304 while the user's data is unchanged.
+    """
+    user_id, version = CalendarService.resolve(db, token)
+    db.close()  # The body is streamed from its own session.
+    etag = f'"{hashlib.sha256(f"{user_id}|{version}".encode()).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            return Response(status_code=304, headers=headers)
+
+    return StreamingResponse(
+        CalendarService.stream(user_id, version),
+        media_type="text/calendar",
+        headers=headers,
+    )
@@ -25,6 +25,7 @@ from app.schemas.conversation import (
 )
 from app.services.conversation_service import conversation_service
 from app.services.planner_service import planner_service
+from app.services.schedule_service import ScheduleService
 from app.routers.planner import _normalize_plan_input
 
 logger = logging.getLogger(__name__)
@@ -81,7 +82,7 @@ async def chat(
         # Process based on stage
         if session.stage == "intent":
             # Recognize intent
-            intent, extracted_info = conversation_service.recognize_intent(request.message)
+            intent, extracted_info = await conversation_service.recognize_intent(request.message)
             session.intent = intent
             collected_info.update(extracted_info)
             
@@ -89,7 +90,7 @@ async def chat(
             
             if intent == "simple_task":
                 # Extract task info
-                task_info = conversation_service.extract_simple_task(request.message)
+                task_info = await conversation_service.extract_simple_task(request.message)
                 
                 # Check for critical info
                 if not task_info.get("deadline"):
@@ -122,18 +123,8 @@ async def chat(
             
             elif intent == "view_schedule":
                 # Fetch today's schedule
-                today = datetime.now().date()
-                tasks = db.query(Task).outerjoin(Project, Task.project_id == Project.id).filter(
-                    Task.user_id == current_user.id,
-                    Task.scheduled_time != None,
-                    or_(Task.project_id.is_(None), Project.status != "PROPOSED")
-                ).all()
-                
-                today_tasks = [
-                    t for t in tasks 
-                    if t.scheduled_time and t.scheduled_time.date() == today
-                ]
-                today_tasks.sort(key=lambda x: x.scheduled_time)
+                today = ScheduleService.local_today()
+                today_tasks = ScheduleService.get_day(db, current_user, today).time_blocks
                 
                 if not today_tasks:
                     ai_message = "今天暂时没有安排具体的日程任务。你可以随时告诉我你想做什么，我帮你安排。"
@@ -160,7 +151,7 @@ async def chat(
 
             elif intent == "complex_project":
                 session.stage = "gathering"
-                info_complete, ai_message = conversation_service.gather_information(
+                info_complete, ai_message = await conversation_service.gather_information(
                     collected_info,
                     messages
                 )
@@ -219,7 +210,7 @@ async def chat(
             # (In MVP, we just save the message and check if ready)
             collected_info["user_answer"] = request.message
             
-            info_complete, ai_message = conversation_service.gather_information(
+            info_complete, ai_message = await conversation_service.gather_information(
                 collected_info,
                 messages
             )
@@ -278,7 +269,7 @@ async def chat(
             planning_message = collected_info.get("goal", request.message)
             planning_message += f"\n\n补充信息：{json.dumps(collected_info, ensure_ascii=False)}"
             
-            plan = _normalize_plan_input(planner_service.generate_plan(planning_message, context))
+            plan = _normalize_plan_input(await planner_service.generate_plan(planning_message, context))
             
             # Create PlanningSession so it can be committed later
             from app.models.planning import PlanningSession
@@ -337,7 +328,7 @@ async def chat(
                 except Exception:
                     pass
 
-                plan = _normalize_plan_input(planner_service.generate_plan(planning_message, context))
+                plan = _normalize_plan_input(await planner_service.generate_plan(planning_message, context))
                 new_planning_session_id = str(uuid.uuid4())
                 new_planning_session = PlanningSession(
                     id=new_planning_session_id,
@@ -382,7 +373,7 @@ async def chat(
                 )
             
             # Call AI to refine
-            refined_plan = _normalize_plan_input(conversation_service.refine_plan(current_plan, request.message))
+            refined_plan = _normalize_plan_input(await conversation_service.refine_plan(current_plan, request.message))
             
             # Update PlanningSession
             planning_session.plan_json = json.dumps(refined_plan, ensure_ascii=False)
@@ -422,7 +413,7 @@ async def chat(
             
             # Recognize intent for new message
             messages = [{"role": "user", "content": request.message}]
-            intent, extracted_info = conversation_service.recognize_intent(request.message)
+            intent, extracted_info = await conversation_service.recognize_intent(request.message)
             new_session.intent = intent
             collected_info = extracted_info
             
@@ -430,7 +421,7 @@ async def chat(
             
             if intent == "simple_task":
                 # Extract and create task
-                task_info = conversation_service.extract_simple_task(request.message)
+                task_info = await conversation_service.extract_simple_task(request.message)
                 task = Task(
                     id=str(uuid.uuid4()),
                     user_id=current_user.id,
@@ -463,7 +454,7 @@ async def chat(
             
             elif intent == "complex_project":
                 new_session.stage = "gathering"
-                info_complete, ai_message = conversation_service.gather_information(
+                info_complete, ai_message = await conversation_service.gather_information(
                     collected_info,
                     messages
                 )
@@ -503,7 +494,7 @@ async def chat(
             else:
                 # question or chat
                 if intent == "question":
-                    answer = conversation_service.answer_question(request.message)
+                    answer = await conversation_service.answer_question(request.message)
                 else:
                     answer = "你好！我可以帮你规划任务和项目。有什么我能帮到你的吗？"
                 
@@ -708,7 +699,7 @@ async def login_greeting(
     )
 
     try:
-        message_text = conversation_service._call_ai(prompt).strip()
+        message_text = (await conversation_service._call_ai(prompt)).strip()
         if not message_text:
             raise ValueError("empty greeting from ai")
     except Exception as e:
@@ -7,7 +7,7 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.database import get_db
 from app.services import auth_service
-from app.dependencies import get_current_user
+from app.dependencies import conditional_get, get_current_user
 from app.models.user import User
 from app.models.project import Project
 from app.models.task import Task
@@ -17,6 +17,7 @@ router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
 @router.get("/projects/strategic")
 def get_strategic_projects(
+    etag: str = Depends(conditional_get),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
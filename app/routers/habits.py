@@ -8,7 +8,7 @@ from sqlalchemy.orm import Session
 
 from app.database import get_db
 from app.models.user import User
-from app.dependencies import get_current_user
+from app.dependencies import conditional_get, get_current_user
 from app.models.habit import HabitTemplate, FixedBlock
 from app.models.project import Project
 from app.models.project_long_task import ProjectLongTaskTemplate
@@ -118,6 +118,7 @@ def delete_habit_template(
 
 @router.get("/fixed-blocks")
 def get_fixed_blocks(
+    etag: str = Depends(conditional_get),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
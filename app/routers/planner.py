@@ -190,7 +190,7 @@ async def generate_plan(
         
         # Generate plan using AI
         logger.info(f"User {current_user.username} requesting plan for: {request.message[:50]}...")
-        plan = planner_service.generate_plan(request.message, context)
+        plan = await planner_service.generate_plan(request.message, context)
         
         # Save to planning_sessions
         session_id = str(uuid.uuid4())
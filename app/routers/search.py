@@ -0,0 +1,41 @@
+"""Search router."""
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.dependencies import get_current_user
+from app.models.user import User
+from app.schemas.search import SearchResponse
+from app.services.search_service import KINDS, SearchService
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+
+@router.get("", response_model=SearchResponse)
+def search(
+    q: str = Query(..., min_length=1, max_length=200, description="Search text (Chinese or words)"),
+    kinds: Optional[str] = Query(None, description=f"Comma-separated subset of: {', '.join(KINDS)}"),
+    limit: int = Query(20, ge=1, le=SearchService.MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Full-text search across the user's tasks, projects, milestones and conversations.
+
+    Results are ranked by relevance (title matches weigh more); pass
+    `next_offset` back as `offset` to fetch the next page.
+    """
+    selected = None
+    if kinds:
+        selected = [k.strip() for k in kinds.split(",") if k.strip()]
+        unknown = [k for k in selected if k not in KINDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown kinds: {', '.join(unknown)}")
+
+    items, next_offset = SearchService.search(
+        db, current_user, q, kinds=selected, limit=limit, offset=offset
+    )
+    return {"query": q, "items": items, "next_offset": next_offset}
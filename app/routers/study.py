@@ -2,7 +2,6 @@
 from datetime import datetime, timedelta
 from typing import List, Optional
 from pydantic import BaseModel
-import json
 from zoneinfo import ZoneInfo
 
 from fastapi import APIRouter, Depends, HTTPException
@@ -11,11 +10,12 @@ from sqlalchemy import func, desc
 
 from app.database import get_db
 from app.config import settings
-from app.dependencies import get_current_user
+from app.dependencies import conditional_get, get_current_user
 from app.models.user import User
 from app.models.study import StudySession, SessionStatus
 from app.models.project import Project
 from app.models.task import Task
+from app.services.task_service import TaskService
 
 router = APIRouter(prefix="/study", tags=["study"])
 
@@ -95,7 +95,6 @@ def _create_quick_start_task(
         status="DONE",
         evidence_type="none",
         evidence_criteria="quick_start_record",
-        tags=json.dumps(["quick_start", "quick_start_pending_fill"], ensure_ascii=False),
         scheduled_date=local_start_dt,
         scheduled_time=local_start_dt,
         deadline=end_dt,
@@ -107,6 +106,7 @@ def _create_quick_start_task(
         is_quick_start=True,
         quick_start_action=session_in.quick_start_action,
     )
+    TaskService._set_task_tags(task, ["quick_start", "quick_start_pending_fill"])
     db.add(task)
     db.flush()
     return task.id
@@ -175,6 +175,7 @@ async def create_session(
 
 @router.get("/stats", response_model=StudyStats)
 async def get_study_stats(
+    etag: str = Depends(conditional_get),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -0,0 +1,33 @@
+"""Change feed router for incremental client sync."""
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.dependencies import get_current_user
+from app.models.user import User
+from app.schemas.sync import SyncChangesResponse
+from app.services.sync_service import SyncService
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+
+@router.get("/changes", response_model=SyncChangesResponse)
+def get_changes(
+    since: Optional[int] = Query(None, ge=0, description="Cursor from the previous response"),
+    limit: int = Query(500, ge=1, le=SyncService.MAX_LIMIT),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get task, project, milestone, habit template and fixed block changes since a cursor.
+
+    - First call (no `since`): returns `reset=true` and the current cursor;
+      load the full lists, then poll with `since=<cursor>`
+    - `changes` holds only the latest upsert or tombstone per entity
+    - `has_more=true`: call again immediately with the returned cursor
+    - `reset=true` later means the cursor is older than the tombstone
+      retention window and the client must reload everything
+    """
+    return SyncService.get_changes(db, current_user, since, limit)
@@ -1,18 +1,25 @@
 """Tasks router."""
+from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, File, UploadFile, Query, Form
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, Query, Form, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 
 from app.database import get_db
-from app.dependencies import get_current_user
+from app.dependencies import conditional_get, get_current_user
 from app.models.user import User
 from app.schemas.task import (
     TaskCreate,
     TaskResponse,
+    TaskBatchRequest,
+    TaskBatchResponse,
+    TagCount,
     TaskEvidenceSubmit,
     TaskEvidenceResponse,
     TaskUpdate,
+    TaskUpdateResponse,
     PlanTemplateCreate,
     PlanTemplateResponse,
 )
@@ -23,8 +30,17 @@ router = APIRouter(prefix="/tasks", tags=["tasks"])
 
 @router.get("", response_model=List[TaskResponse])
 def get_tasks(
+    response: Response,
     filter: Optional[str] = Query(None, description="Filter: active/completed"),
     project_id: Optional[str] = Query(None, description="Filter by project ID"),
+    limit: Optional[int] = Query(None, ge=1, le=TaskService.LIST_MAX_LIMIT, description="Page size; enables pagination"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the previous page's X-Next-Cursor header"),
+    fields: Optional[str] = Query(None, description="Comma-separated TaskResponse fields to return"),
+    tag: Optional[str] = Query(None, description="Only tasks carrying this tag"),
+    date_from: Optional[datetime] = Query(None, alias="from", description="Task window ends at or after this time"),
+    date_to: Optional[datetime] = Query(None, alias="to", description="Task window starts at or before this time"),
+    lane: Optional[str] = Query(None, description="Board lane: IN_PROGRESS/TODO/AUTO"),
+    etag: str = Depends(conditional_get),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -34,8 +50,29 @@ def get_tasks(
     - **active**: OPEN, EVIDENCE_SUBMITTED, OVERDUE
     - **completed**: DONE, EXCUSED
     - **project_id**: Filter by specific project
+    - **limit/cursor**: Keyset pagination on (created_at, id), newest first;
+      the next page's cursor is returned in the `X-Next-Cursor` header
+    - **fields**: Sparse fieldset, e.g. `fields=id,title,status,deadline`
+    - Sends an `ETag`; repeat polls with `If-None-Match` get `304` while nothing changed
     """
-    tasks = TaskService.get_tasks(db, current_user, filter, project_id)
+    page_kwargs = dict(limit=limit, cursor=cursor, tag=tag, date_from=date_from, date_to=date_to, lane=lane)
+
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in TaskResponse.model_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        rows, next_cursor = TaskService.get_task_fields_page(
+            db, current_user, requested, filter, project_id, **page_kwargs
+        )
+        headers = dict(response.headers)
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        return JSONResponse(content=jsonable_encoder(rows), headers=headers)
+
+    tasks, next_cursor = TaskService.get_tasks_page(db, current_user, filter, project_id, **page_kwargs)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return tasks
 
 
@@ -50,6 +87,39 @@ def create_task(
     return task
 
 
+@router.post("/batch", response_model=TaskBatchResponse)
+def batch_tasks(
+    batch: TaskBatchRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Apply many task operations in one request and one transaction.
+
+    - **op**: create / update / schedule / complete
+    - **data**: the body the single-task endpoint takes (`POST /tasks`,
+      `PATCH /tasks/{id}`, `POST /schedule/tasks/{id}/schedule`)
+    - **atomic**: if true, any failure rolls back the whole batch; otherwise
+      each failed item is reported and the rest are committed
+    - **strict**: if true, an operation whose time block overlaps fixed blocks
+      or other tasks fails with 409; otherwise overlaps are listed in `conflicts`
+    """
+    results, committed = TaskService.apply_batch(
+        db, current_user, batch.operations, atomic=batch.atomic, strict=batch.strict
+    )
+    return {"committed": committed, "results": results}
+
+
+@router.get("/tags", response_model=List[TagCount])
+def get_tag_counts(
+    filter: Optional[str] = Query(None, description="Filter: active/completed"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the user's tags with task counts, most used first."""
+    return TaskService.get_tag_counts(db, current_user, filter)
+
+
 @router.get("/{task_id}", response_model=TaskResponse)
 def get_task(
     task_id: str,
@@ -61,16 +131,21 @@ def get_task(
     return task
 
 
-@router.patch("/{task_id}", response_model=TaskResponse)
+@router.patch("/{task_id}", response_model=TaskUpdateResponse)
 def update_task(
     task_id: str,
     updates: TaskUpdate,
+    strict: bool = Query(False, description="Reject a time change that overlaps the schedule (409)"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Update a task (only allowed for PROPOSED project tasks)."""
-    task = TaskService.update_task(db, task_id, current_user, updates.dict(exclude_unset=True))
-    return task
+    task, conflicts = TaskService.update_task(
+        db, task_id, current_user, updates.dict(exclude_unset=True), strict=strict
+    )
+    response = TaskUpdateResponse.model_validate(task)
+    response.conflicts = conflicts
+    return response
 
 
 @router.post("/{task_id}/complete", response_model=TaskResponse)
@@ -88,7 +163,7 @@ async def complete_task(
     return task
 
 
-@router.post("/{task_id}/submit-evidence", response_model=TaskEvidenceResponse)
+@router.post("/{task_id}/submit-evidence", response_model=TaskEvidenceResponse, status_code=202)
 async def submit_evidence(
     task_id: str,
     evidence_type: str = Form(...),
@@ -100,9 +175,12 @@ async def submit_evidence(
     """
     Submit evidence for a task.
     
-    Triggers AI judgment and updates task status accordingly.
+    Returns at once with ai_result "pending" and the task EVIDENCE_SUBMITTED;
+    AI judgment runs in the background and updates task status accordingly.
     - pass -> DONE
     - fail -> OPEN
+    Poll GET /tasks/{task_id}/evidence/{evidence_id} for the result. Responds
+    503 with Retry-After when the judging queue is full.
     """
     evidence_data = TaskEvidenceSubmit(
         evidence_type=evidence_type,
@@ -114,6 +192,17 @@ async def submit_evidence(
     return evidence
 
 
+@router.get("/{task_id}/evidence/{evidence_id}", response_model=TaskEvidenceResponse)
+def get_evidence(
+    task_id: str,
+    evidence_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get an evidence submission and its judgment status."""
+    return TaskService.get_evidence(db, task_id, evidence_id, current_user)
+
+
 # Plan Templates
 
 @router.get("/templates", response_model=List[PlanTemplateResponse])
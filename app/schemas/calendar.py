@@ -0,0 +1,8 @@
+"""Calendar feed schemas."""
+from pydantic import BaseModel
+
+
+class CalendarFeedTokenResponse(BaseModel):
+    """Subscription URL of a user's iCalendar feed."""
+    token: str
+    url: str
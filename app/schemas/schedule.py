@@ -1,7 +1,7 @@
 """Schedule schemas for time blocking."""
 from typing import List, Optional
 from datetime import datetime, date, time
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class TimeBlock(BaseModel):
@@ -56,6 +56,36 @@ class WeeklySchedule(BaseModel):
     daily_schedules: List[DailySchedule]
 
 
+class BusyInterval(BaseModel):
+    """An occupied interval and what occupies it."""
+    start: datetime
+    end: datetime
+    source_type: str  # fixed_block/habit/project_long_task/task
+    source_id: str
+    title: str
+
+
+class FreeInterval(BaseModel):
+    """A free interval, aligned to the occupancy slot size."""
+    start: datetime
+    end: datetime
+
+
+class FreeBusyDay(BaseModel):
+    """Busy and free intervals of one local day."""
+    date: date
+    busy: List[BusyInterval]
+    free: List[FreeInterval]
+
+
+class FreeBusyResponse(BaseModel):
+    """Free/busy view over a date range."""
+    start_date: date
+    end_date: date
+    slot_minutes: int
+    days: List[FreeBusyDay]
+
+
 class ScheduleTaskRequest(BaseModel):
     """Request to schedule a task."""
     scheduled_date: date
@@ -69,3 +99,37 @@ class ScheduleTaskResponse(BaseModel):
     scheduled_time: datetime
     duration: int
     is_time_blocked: bool
+    conflicts: List[BusyInterval] = []  # Overlapping blocks at the new time
+
+
+class AutoPlaceRequest(BaseModel):
+    """Request to pack tasks into free slots."""
+    task_ids: Optional[List[str]] = Field(None, max_length=500)  # None = all open tasks that are not time blocked
+    start_date: Optional[date] = None  # Defaults to today
+    days: int = Field(7, ge=1, le=31)
+    day_start: time = time(8, 0)
+    day_end: time = time(22, 0)
+    commit: bool = False  # Write the placements instead of only proposing them
+
+
+class AutoPlacement(BaseModel):
+    """Proposed time block for a task."""
+    task_id: str
+    title: str
+    scheduled_time: datetime
+    duration: int
+    deadline: Optional[datetime] = None
+
+
+class AutoPlaceSkipped(BaseModel):
+    """Task that could not be placed."""
+    task_id: str
+    title: Optional[str] = None
+    reason: str  # not_found/not_open/proposed_project/deadline_passed/no_free_slot
+
+
+class AutoPlaceResponse(BaseModel):
+    """Result of automatic placement."""
+    placements: List[AutoPlacement]
+    unplaced: List[AutoPlaceSkipped]
+    committed: bool
@@ -0,0 +1,22 @@
+"""Search schemas."""
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class SearchHit(BaseModel):
+    """A single ranked search result."""
+    kind: str  # task/project/milestone/conversation
+    id: str
+    title: str
+    snippet: Optional[str] = None
+    status: Optional[str] = None
+    project_id: Optional[str] = None
+    score: float
+
+
+class SearchResponse(BaseModel):
+    """A page of search results."""
+    query: str
+    items: List[SearchHit]
+    next_offset: Optional[int] = None
@@ -0,0 +1,21 @@
+"""Change feed schemas."""
+from typing import Any, List, Literal, Optional
+
+from pydantic import BaseModel
+
+
+class SyncChange(BaseModel):
+    """Latest change to one entity."""
+    entity: Literal["task", "project", "milestone", "habit_template", "fixed_block"]
+    id: str
+    seq: int
+    op: Literal["upsert", "delete"]
+    data: Optional[dict[str, Any]] = None  # Same shape as the entity's list endpoint; None on delete
+
+
+class SyncChangesResponse(BaseModel):
+    """A page of the change feed."""
+    cursor: int
+    reset: bool  # True: reload full lists, then sync from `cursor`
+    has_more: bool
+    changes: List[SyncChange]
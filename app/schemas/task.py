@@ -1,9 +1,11 @@
 """Task schemas."""
 from datetime import datetime
-from typing import Optional, Literal
+from typing import Any, List, Optional, Literal
 
 from pydantic import BaseModel, Field, field_validator
 
+from app.schemas.schedule import BusyInterval
+
 
 class TaskCreate(BaseModel):
     """Schema for creating a task."""
@@ -80,6 +82,48 @@ class TaskResponse(BaseModel):
         return v
 
 
+class TaskUpdateResponse(TaskResponse):
+    """Schema for an updated task and any schedule overlaps it now has."""
+    conflicts: List[BusyInterval] = []
+
+
+class TaskBatchOperation(BaseModel):
+    """One operation in a batch; ``data`` is a TaskCreate, TaskUpdate or ScheduleTaskRequest body."""
+    op: Literal["create", "update", "schedule", "complete"]
+    task_id: Optional[str] = None  # Required for every op except create
+    data: Optional[dict] = None
+
+
+class TaskBatchRequest(BaseModel):
+    """Schema for a batch of task operations."""
+    operations: List[TaskBatchOperation] = Field(..., min_length=1, max_length=200)
+    atomic: bool = False  # Roll back everything if any operation fails
+    strict: bool = False  # Reject operations whose time block overlaps the schedule
+
+
+class TaskBatchItemResult(BaseModel):
+    """Outcome of one batch operation."""
+    index: int
+    op: str
+    ok: bool
+    status_code: int
+    task_id: Optional[str] = None
+    error: Optional[Any] = None
+    task: Optional[TaskResponse] = None
+    conflicts: List[BusyInterval] = []
+
+
+class TaskBatchResponse(BaseModel):
+    """Schema for a batch response."""
+    committed: bool
+    results: List[TaskBatchItemResult]
+
+
+class TagCount(BaseModel):
+    """Schema for a tag and how many tasks carry it."""
+    tag: str
+    count: int
+
 
 class TaskEvidenceSubmit(BaseModel):
     """Schema for submitting evidence."""
@@ -95,10 +139,12 @@ class TaskEvidenceResponse(BaseModel):
     evidence_type: str
     content: Optional[str]
     image_path: Optional[str]
-    ai_result: Optional[str]
+    ai_result: Optional[str]  # pending until judged, then pass/fail
     ai_reason: Optional[str]
     extracted_values: Optional[str]
     submitted_at: datetime
+    judge_attempts: int = 0
+    judged_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
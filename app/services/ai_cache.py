@@ -0,0 +1,192 @@
+"""Content-addressed cache of AI judgments.
+
+Keys are the SHA-256 of everything that shapes the provider's answer: the
+kind of call, its prompt version, the provider/model chain, and the prompt
+inputs with text normalized (NFKC, collapsed whitespace) and images replaced
+by their content digest, since every upload gets a fresh filename. Entries
+expire after ``settings.ai_cache_ttl_seconds``.
+
+The in-process tier is an LRU of ``settings.ai_cache_max_entries``. With
+``settings.ai_cache_shared`` results are also kept in the ``ai_result_cache``
+table, so other workers and restarts reuse them; shared hits are copied into
+the local tier. Callers store only answers parsed from a provider, never
+error fallbacks. ``get`` and ``put`` may block on the database, so async
+callers run them with ``asyncio.to_thread``.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.task import AIResultCache
+
+logger = logging.getLogger(__name__)
+
+_DIGEST_CHUNK = 64 * 1024
+
+
+def normalize_text(value: Optional[str]) -> str:
+    return " ".join(unicodedata.normalize("NFKC", value or "").split())
+
+
+_digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+_digests_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's content, memoized by path, size and mtime."""
+    stat = os.stat(path)
+    memo_key = (path, stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        digest = _digests.get(memo_key)
+    if digest is not None:
+        return digest
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_DIGEST_CHUNK), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    _memo_digest(memo_key, digest)
+    return digest
+
+
+def remember_file_digest(path: str, digest: str) -> None:
+    """Record a digest computed while the file was written, so it is not re-read."""
+    stat = os.stat(path)
+    _memo_digest((path, stat.st_size, stat.st_mtime_ns), digest)
+
+
+def _memo_digest(memo_key: Tuple[str, int, int], digest: str) -> None:
+    with _digests_lock:
+        _digests[memo_key] = digest
+        while len(_digests) > 1024:
+            _digests.popitem(last=False)
+
+
+def cache_key(kind: str, prompt_version: str, model: str, **inputs: Any) -> str:
+    payload = json.dumps(
+        {"kind": kind, "prompt": prompt_version, "model": model, "inputs": inputs},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AIResultCacheStore:
+    """Two-tier TTL cache of JSON results with hit/miss counters."""
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"local_hits": 0, "shared_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh copy of the cached result, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._counters["local_hits"] += 1
+                    return json.loads(entry[1])
+                del self._entries[key]
+
+        if settings.ai_cache_shared:
+            value = self._shared_get(key)
+            if value is not None:
+                self._remember(key, value)
+                self._count("shared_hits")
+                return json.loads(value)
+
+        self._count("misses")
+        return None
+
+    def put(self, key: str, kind: str, result: Dict[str, Any]) -> None:
+        value = json.dumps(result, ensure_ascii=False)
+        self._remember(key, value)
+        self._count("stores")
+        if settings.ai_cache_shared:
+            self._shared_put(key, kind, value)
+
+    def _remember(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + settings.ai_cache_ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.ai_cache_max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    @staticmethod
+    def _shared_get(key: str) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            row = db.query(AIResultCache.value).filter(
+                AIResultCache.key == key,
+                AIResultCache.expires_at > datetime.utcnow(),
+            ).first()
+            return row.value if row else None
+        except Exception as e:
+            logger.warning(f"AI cache shared lookup failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    @staticmethod
+    def _shared_put(key: str, kind: str, value: str) -> None:
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            db.merge(AIResultCache(
+                key=key, kind=kind, value=value, created_at=now,
+                expires_at=now + timedelta(seconds=settings.ai_cache_ttl_seconds),
+            ))
+            db.commit()
+        except Exception as e:
+            # Another worker may have stored the same key first; either copy is fine.
+            db.rollback()
+            logger.warning(f"AI cache shared store failed: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def purge_expired(db: Session) -> int:
+        """Delete expired rows from the shared tier."""
+        purged = db.query(AIResultCache).filter(
+            AIResultCache.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+        return purged
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+        lookups = counters["local_hits"] + counters["shared_hits"] + counters["misses"]
+        hits = counters["local_hits"] + counters["shared_hits"]
+        return {
+            **counters,
+            "entries": entries,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "shared": settings.ai_cache_shared,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+ai_result_cache = AIResultCacheStore()
@@ -1,20 +1,32 @@
 """AI service with multi-provider support (Gemini + Qwen)."""
+import asyncio
 import json
 import logging
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
 
 from app.config import settings
+from app.services.ai_cache import ai_result_cache, cache_key, file_digest, normalize_text
+from app.services.image_prep import PreparedImage, image_preparer
 
 logger = logging.getLogger(__name__)
 
 
 class AIService:
     """AI service with auto-switching between Gemini and Qwen."""
+
+    # Bump when a prompt changes so cached answers to the old prompt are not reused.
+    JUDGE_PROMPT_VERSION = "judge-v1"
+    BODYFAT_PROMPT_VERSION = "bodyfat-v1"
+    GEMINI_MODEL = "models/gemini-2.0-flash-exp"
     
     def __init__(self):
         """Initialize AI service with configured provider."""
         self.mock_mode = settings.gemini_mock_mode
         self.provider = settings.ai_provider  # auto | gemini | qwen
+        self._gemini_pool = ThreadPoolExecutor(
+            max_workers=settings.ai_gemini_max_workers, thread_name_prefix="gemini"
+        )
         
         # Initialize Gemini
         self.gemini_available = False
@@ -22,7 +34,7 @@ class AIService:
             try:
                 import google.generativeai as genai
                 genai.configure(api_key=settings.gemini_api_key)
-                self.gemini_model = genai.GenerativeModel('models/gemini-2.0-flash-exp')
+                self.gemini_model = genai.GenerativeModel(self.GEMINI_MODEL)
                 self.gemini_available = True
                 logger.info("✅ Gemini API initialized successfully")
             except Exception as e:
@@ -53,79 +65,143 @@ class AIService:
                 available.append("Qwen")
             logger.info(f"🚀 AI Service ready with providers: {', '.join(available)}")
     
-    def _call_ai(self, prompt: str, image_path: Optional[str] = None) -> str:
+    def _providers_to_try(self) -> List[str]:
         """
-        Call AI with automatic provider switching.
-        
-        Tries providers in this order based on configuration:
+        Providers in call order based on configuration:
         - auto: Gemini first, then Qwen fallback
         - gemini: Only Gemini (fail if unavailable)
         - qwen: Only Qwen (fail if unavailable)
         """
+        if self.provider == "gemini":
+            return ["gemini"]
+        if self.provider == "qwen":
+            return ["qwen"]
+        providers = []
+        if self.gemini_available:
+            providers.append("gemini")
+        if self.qwen_available:
+            providers.append("qwen")
+        return providers
+
+    def model_signature(self) -> str:
+        """Providers and models a call may be answered by, in call order."""
+        models = {"gemini": self.GEMINI_MODEL, "qwen": settings.qwen_model}
+        return ",".join(f"{name}:{models[name]}" for name in self._providers_to_try())
+
+    async def _result_cache_key(self, kind: str, prompt_version: str, use_cache: bool,
+                                image_path: Optional[str] = None, **inputs: Any) -> Optional[str]:
+        """Cache key for a call, or None when caching is off for it."""
+        if not (use_cache and settings.ai_cache_enabled):
+            return None
+        image = await asyncio.to_thread(file_digest, image_path) if image_path else None
+        return cache_key(kind, prompt_version, self.model_signature(), image=image, **inputs)
+
+    def _gemini_generate(self, prompt: str, image: Optional[PreparedImage] = None) -> str:
+        """Blocking Gemini call; run it in ``_gemini_pool`` from async code."""
+        if image:
+            response = self.gemini_model.generate_content([prompt, image.gemini_part])
+        else:
+            response = self.gemini_model.generate_content(prompt)
+        return response.text.strip()
+
+    def _should_try_next(self, provider_name: str, error: Exception, providers_to_try: List[str]) -> bool:
+        error_str = str(error)
+        logger.warning(f"⚠️ {provider_name.capitalize()} API failed: {error_str}")
+
+        # Check if it's a rate limit error
+        if "429" in error_str or "quota" in error_str.lower() or "rate" in error_str.lower():
+            logger.warning(f"🔄 {provider_name.capitalize()} rate limited, trying next provider...")
+            return True
+
+        # For other errors, also try next provider if available
+        if len(providers_to_try) > 1:
+            logger.warning(f"🔄 Trying next provider...")
+            return True
+        return False
+
+    def _call_ai(self, prompt: str, image_path: Optional[str] = None) -> str:
+        """
+        Call AI with automatic provider switching (blocking).
+
+        Request handlers must use ``_call_ai_async``; this is for scripts and
+        other code that runs outside the event loop.
+        """
         if self.mock_mode:
             return ""  # Mock mode handled separately
-        
-        providers_to_try = []
-        
-        if self.provider == "gemini":
-            providers_to_try = ["gemini"]
-        elif self.provider == "qwen":
-            providers_to_try = ["qwen"]
-        else:  # auto
-            if self.gemini_available:
-                providers_to_try.append("gemini")
-            if self.qwen_available:
-                providers_to_try.append("qwen")
-        
+
+        providers_to_try = self._providers_to_try()
         last_error = None
-        
+        image = image_preparer.prepare(image_path) if image_path else None
+
         for provider_name in providers_to_try:
             try:
                 if provider_name == "gemini" and self.gemini_available:
                     logger.info("🔵 Calling Gemini API...")
-                    if image_path:
-                        from PIL import Image
-                        img = Image.open(image_path)
-                        response = self.gemini_model.generate_content([prompt, img])
-                    else:
-                        response = self.gemini_model.generate_content(prompt)
-                    return response.text.strip()
-                
+                    return self._gemini_generate(prompt, image)
+
                 elif provider_name == "qwen" and self.qwen_available:
                     logger.info("🟠 Calling Qwen API...")
-                    if image_path:
-                        # Convert image to base64 for Qwen
-                        import base64
-                        with open(image_path, "rb") as img_file:
-                            img_base64 = base64.b64encode(img_file.read()).decode()
-                        image_url = f"data:image/jpeg;base64,{img_base64}"
-                        return self.qwen_client.generate_with_image(prompt, image_url)
+                    if image:
+                        return self.qwen_client.generate_with_image(prompt, image.data_url)
                     else:
                         return self.qwen_client.generate_text(prompt)
-                
+
             except Exception as e:
-                error_str = str(e)
-                logger.warning(f"⚠️ {provider_name.capitalize()} API failed: {error_str}")
                 last_error = e
-                
-                # Check if it's a rate limit error
-                if "429" in error_str or "quota" in error_str.lower() or "rate" in error_str.lower():
-                    logger.warning(f"🔄 {provider_name.capitalize()} rate limited, trying next provider...")
+                if self._should_try_next(provider_name, e, providers_to_try):
                     continue
-                
-                # For other errors, also try next provider if available
-                if len(providers_to_try) > 1:
-                    logger.warning(f"🔄 Trying next provider...")
+                raise
+
+        # All providers failed
+        if last_error:
+            raise last_error
+        else:
+            raise RuntimeError("No AI providers available")
+
+    async def _call_ai_async(self, prompt: str, image_path: Optional[str] = None) -> str:
+        """
+        Call AI with automatic provider switching without blocking the event loop.
+
+        Qwen goes through the SDK's async client. The Gemini SDK is blocking,
+        so its calls run in a bounded thread pool (``ai_gemini_max_workers``);
+        calls beyond that queue instead of starving the default executor.
+        """
+        if self.mock_mode:
+            return ""  # Mock mode handled separately
+
+        providers_to_try = self._providers_to_try()
+        last_error = None
+        loop = asyncio.get_running_loop()
+        image = await asyncio.to_thread(image_preparer.prepare, image_path) if image_path else None
+
+        for provider_name in providers_to_try:
+            try:
+                if provider_name == "gemini" and self.gemini_available:
+                    logger.info("🔵 Calling Gemini API...")
+                    return await asyncio.wait_for(
+                        loop.run_in_executor(self._gemini_pool, self._gemini_generate, prompt, image),
+                        timeout=settings.ai_timeout_seconds,
+                    )
+
+                elif provider_name == "qwen" and self.qwen_available:
+                    logger.info("🟠 Calling Qwen API...")
+                    if image:
+                        return await self.qwen_client.agenerate_with_image(prompt, image.data_url)
+                    else:
+                        return await self.qwen_client.agenerate_text(prompt)
+
+            except Exception as e:
+                last_error = e
+                if self._should_try_next(provider_name, e, providers_to_try):
                     continue
-                else:
-                    raise
-        
+                raise
+
         # All providers failed
         if last_error:
             raise last_error
         else:
             raise RuntimeError("No AI providers available")
-    
+
     def _extract_json(self, text: str) -> Dict[str, Any]:
         """Extract JSON from AI response with robust error handling."""
         original_text = text
@@ -190,10 +266,17 @@ class AIService:
         evidence_type: str,
         evidence_criteria: str,
         evidence_content: Optional[str] = None,
-        image_path: Optional[str] = None
+        image_path: Optional[str] = None,
+        raise_errors: bool = False,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
         Judge task evidence using AI (Gemini or Qwen with auto-fallback).
+
+        Provider errors become a "fail" result unless ``raise_errors`` is set,
+        in which case they propagate so the caller can retry. Answers are
+        cached by content (see ``app.services.ai_cache``) unless ``use_cache``
+        is False.
         
         Returns:
             {
@@ -206,6 +289,18 @@ class AIService:
             return self._mock_judge_evidence(task_title, evidence_type, evidence_content)
         
         try:
+            key = await self._result_cache_key(
+                "judge", self.JUDGE_PROMPT_VERSION, use_cache, image_path,
+                title=normalize_text(task_title),
+                evidence_type=evidence_type,
+                criteria=normalize_text(evidence_criteria),
+                content=normalize_text(evidence_content),
+            )
+            if key:
+                cached = await asyncio.to_thread(ai_result_cache.get, key)
+                if cached is not None:
+                    return cached
+
             # Construct prompt
             prompt = f"""You are a strict task completion judge. Your role is to verify if the submitted evidence meets the criteria.
 
@@ -231,12 +326,16 @@ Please analyze if the evidence meets the criteria. Respond in JSON format:
 """
             
             # Call AI with auto-switching
-            result_text = self._call_ai(prompt, image_path)
+            result_text = await self._call_ai_async(prompt, image_path)
             result = self._extract_json(result_text)
+            if key and isinstance(result, dict) and result.get("result") in ("pass", "fail"):
+                await asyncio.to_thread(ai_result_cache.put, key, "judge", result)
             return result
             
         except Exception as e:
             logger.error(f"Error in judge_evidence: {e}")
+            if raise_errors:
+                raise
             return {
                 "result": "fail",
                 "reason": f"AI判定出错: {str(e)}",
@@ -309,7 +408,7 @@ Respond in JSON format:
 }}
 """
             
-            result_text = self._call_ai(prompt)
+            result_text = await self._call_ai_async(prompt)
             result = self._extract_json(result_text)
             return result
             
@@ -345,10 +444,11 @@ Respond in JSON format:
     async def estimate_bodyfat(
         self,
         image_path: str,
-        user_info: Optional[str] = None
+        user_info: Optional[str] = None,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
-        Estimate body fat from image.
+        Estimate body fat from image (cached by image content unless ``use_cache`` is False).
         
         Returns:
             {
@@ -361,6 +461,15 @@ Respond in JSON format:
             return self._mock_estimate_bodyfat()
         
         try:
+            key = await self._result_cache_key(
+                "bodyfat", self.BODYFAT_PROMPT_VERSION, use_cache, image_path,
+                user_info=normalize_text(user_info),
+            )
+            if key:
+                cached = await asyncio.to_thread(ai_result_cache.get, key)
+                if cached is not None:
+                    return cached
+
             prompt = f"""You are a fitness expert. Estimate the body fat percentage of the person in this image.
 User Info (if available): {user_info or "Not provided"}
 
@@ -375,7 +484,7 @@ Respond in JSON format:
             
             
             # Use unified AI call handling
-            result_text = self._call_ai(prompt, image_path)
+            result_text = await self._call_ai_async(prompt, image_path)
             result_text = result_text.strip()
             
             # Try to extract JSON
@@ -385,6 +494,8 @@ Respond in JSON format:
                 result_text = result_text[json_start:json_end].strip()
             
             result = json.loads(result_text)
+            if key and isinstance(result, dict) and result.get("estimated_bodyfat") is not None:
+                await asyncio.to_thread(ai_result_cache.put, key, "bodyfat", result)
             return result
         except Exception as e:
             logger.error(f"Error in estimate_bodyfat: {e}")
@@ -0,0 +1,351 @@
+"""Subscribable iCalendar (RFC 5545) feed of a user's schedule.
+
+The feed holds one VEVENT per time-blocked task, one per open deadline that
+is not already the end of its task's block, and one recurring VEVENT (RRULE)
+per fixed block and per long-task template of an active project; tasks
+generated from an exported long-task template are left out so they do not
+show twice. Times are local wall-clock times tagged with
+``settings.timezone``, which the feed defines in a VTIMEZONE component.
+
+The body is produced by a generator over ``yield_per`` queries, so memory
+stays flat however long the task history is. Rendered feeds up to
+``MAX_CACHED_BYTES`` are kept in a small LRU keyed by the user's data
+version, which every write to the exported tables bumps.
+"""
+import logging
+import secrets
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from fastapi import HTTPException
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.habit import FixedBlock
+from app.models.project import Project
+from app.models.project_long_task import ProjectLongTaskTemplate
+from app.models.task import Task
+from app.models.user import CalendarFeedToken, User
+from app.services.occupancy import parse_hhmm, parse_weekdays
+from app.services.sync_service import SyncService
+
+logger = logging.getLogger(__name__)
+
+PRODID = "-//Person Gift//Schedule Feed//EN"
+WEEKDAY_CODES = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+FLUSH_BYTES = 16 * 1024
+MAX_CACHED_BYTES = 1024 * 1024
+
+
+def _escape(value) -> str:
+    return (
+        str(value or "")
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Fold a content line to 75 octets, never splitting a UTF-8 character."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    current, size, limit = [], 0, 75
+    for char in line:
+        width = len(char.encode("utf-8"))
+        if size + width > limit:
+            parts.append("".join(current))
+            current, size, limit = [], 0, 74  # continuation lines start with a space
+        current.append(char)
+        size += width
+    parts.append("".join(current))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _local(value: datetime) -> str:
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def _utc_offset(offset: timedelta) -> str:
+    minutes = int(offset.total_seconds() // 60)
+    sign = "-" if minutes < 0 else "+"
+    return f"{sign}{abs(minutes) // 60:02d}{abs(minutes) % 60:02d}"
+
+
+@lru_cache(maxsize=8)
+def _vtimezone(tzid: str, last_year: int) -> Tuple[str, ...]:
+    """
+    VTIMEZONE lines for ``tzid`` (RFC 5545 3.6.5), required for every TZID used.
+
+    Offset changes from 1970 through ``last_year`` are found by scanning
+    day by day and bisecting to the minute; changes with the same offsets
+    and name share one observance, listed with RDATE.
+    """
+    tz = ZoneInfo(tzid)
+
+    def at(minute: int) -> datetime:
+        return datetime.fromtimestamp(minute * 60, tz)
+
+    start = 0
+    end = int(datetime(last_year + 1, 1, 1, tzinfo=ZoneInfo("UTC")).timestamp()) // 60
+    initial = at(start)
+    observances = {
+        ("STANDARD", initial.utcoffset(), initial.utcoffset(), initial.tzname()): [datetime(1970, 1, 1)],
+    }
+    minute, before = start, initial.utcoffset()
+    while minute < end:
+        step = min(minute + 24 * 60, end)
+        if at(step).utcoffset() != before:
+            low, high = minute, step
+            while high - low > 1:
+                middle = (low + high) // 2
+                if at(middle).utcoffset() == before:
+                    low = middle
+                else:
+                    high = middle
+            after = at(high)
+            kind = "DAYLIGHT" if after.dst() else "STANDARD"
+            local_start = datetime.utcfromtimestamp(high * 60) + before  # Wall time in the old offset
+            observances.setdefault((kind, before, after.utcoffset(), after.tzname()), []).append(local_start)
+            before = after.utcoffset()
+            step = high
+        minute = step
+
+    lines = ["BEGIN:VTIMEZONE\r\n", _fold(f"TZID:{tzid}")]
+    for (kind, offset_from, offset_to, name), starts in observances.items():
+        lines.append(f"BEGIN:{kind}\r\n")
+        lines.append(f"DTSTART:{_local(starts[0])}\r\n")
+        if len(starts) > 1:
+            lines.append(_fold("RDATE:" + ",".join(_local(value) for value in starts[1:])))
+        lines.append(f"TZOFFSETFROM:{_utc_offset(offset_from)}\r\n")
+        lines.append(f"TZOFFSETTO:{_utc_offset(offset_to)}\r\n")
+        if name:
+            lines.append(_fold(f"TZNAME:{_escape(name)}"))
+        lines.append(f"END:{kind}\r\n")
+    lines.append("END:VTIMEZONE\r\n")
+    return tuple(lines)
+
+
+class _FeedCache:
+    """LRU of rendered feeds keyed by ``(user_id, data_version)``."""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, int]) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key: Tuple[str, int], body: bytes) -> None:
+        with self._lock:
+            # Older versions of the same user's feed are never asked for again.
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                del self._entries[stale]
+            self._entries[key] = body
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+feed_cache = _FeedCache()
+
+
+class CalendarService:
+    """Feed tokens and feed rendering."""
+
+    @staticmethod
+    def rotate_token(db: Session, user: User) -> str:
+        """Issue a new feed token, invalidating the previous URL."""
+        row = db.query(CalendarFeedToken).filter(CalendarFeedToken.user_id == user.id).first()
+        token = secrets.token_urlsafe(32)
+        if row:
+            row.token = token
+            row.created_at = datetime.utcnow()
+        else:
+            db.add(CalendarFeedToken(user_id=user.id, token=token))
+        db.commit()
+        logger.info(f"Issued calendar feed token for user {user.id}")
+        return token
+
+    @staticmethod
+    def revoke_token(db: Session, user: User) -> None:
+        db.query(CalendarFeedToken).filter(CalendarFeedToken.user_id == user.id).delete()
+        db.commit()
+
+    @staticmethod
+    def resolve(db: Session, token: str) -> Tuple[str, int]:
+        """Return ``(user_id, data_version)`` for a feed token."""
+        row = db.query(CalendarFeedToken).filter(CalendarFeedToken.token == token).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Calendar feed not found")
+        return row.user_id, SyncService.get_data_version(db, row.user_id)
+
+    @staticmethod
+    def stream(user_id: str, version: int) -> Iterator[bytes]:
+        """Yield the feed body, from cache or rendered in ``FLUSH_BYTES`` chunks."""
+        key = (user_id, version)
+        cached = feed_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        kept: Optional[List[bytes]] = []
+        kept_size = 0
+        buffer: List[str] = []
+        buffered = 0
+        db = SessionLocal()
+        try:
+            for line in CalendarService._lines(db, user_id):
+                buffer.append(line)
+                buffered += len(line)
+                if buffered >= FLUSH_BYTES:
+                    chunk = "".join(buffer).encode("utf-8")
+                    buffer, buffered = [], 0
+                    if kept is not None:
+                        kept_size += len(chunk)
+                        if kept_size <= MAX_CACHED_BYTES:
+                            kept.append(chunk)
+                        else:
+                            kept = None
+                    yield chunk
+        finally:
+            db.close()
+        chunk = "".join(buffer).encode("utf-8")
+        yield chunk
+        if kept is not None and kept_size + len(chunk) <= MAX_CACHED_BYTES:
+            feed_cache.put(key, b"".join(kept) + chunk)
+
+    @staticmethod
+    def _lines(db: Session, user_id: str) -> Iterator[str]:
+        tz = ZoneInfo(settings.timezone)
+        tzid = settings.timezone
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+
+        def event(uid: str, summary: str, start: datetime, end: Optional[datetime],
+                  extra: Tuple[str, ...] = (), description: Optional[str] = None) -> Iterator[str]:
+            yield "BEGIN:VEVENT\r\n"
+            yield _fold(f"UID:{uid}@person-gift")
+            yield f"DTSTAMP:{stamp}\r\n"
+            yield f"DTSTART;TZID={tzid}:{_local(start)}\r\n"
+            if end is not None:
+                yield f"DTEND;TZID={tzid}:{_local(end)}\r\n"
+            for line in extra:
+                yield _fold(line)
+            yield _fold(f"SUMMARY:{_escape(summary)}")
+            if description:
+                yield _fold(f"DESCRIPTION:{_escape(description)}")
+            yield "END:VEVENT\r\n"
+
+        def first_on_or_after(day: date, weekdays) -> Optional[date]:
+            for offset in range(7):
+                candidate = day + timedelta(days=offset)
+                if candidate.weekday() in weekdays:
+                    return candidate
+            return None
+
+        def window(day: date, start: int, end: int) -> Tuple[datetime, datetime]:
+            midnight = datetime.combine(day, datetime.min.time())
+            if end <= start:
+                end += 24 * 60  # Overnight block
+            return midnight + timedelta(minutes=start), midnight + timedelta(minutes=end)
+
+        yield "BEGIN:VCALENDAR\r\n"
+        yield "VERSION:2.0\r\n"
+        yield f"PRODID:{PRODID}\r\n"
+        yield "CALSCALE:GREGORIAN\r\n"
+        yield "METHOD:PUBLISH\r\n"
+        yield "X-WR-CALNAME:Person Gift\r\n"
+        yield f"X-WR-TIMEZONE:{tzid}\r\n"
+        yield from _vtimezone(tzid, datetime.now(tz).year + 10)
+
+        for block in db.query(FixedBlock).filter(FixedBlock.user_id == user_id).all():
+            start, end = parse_hhmm(block.start_time), parse_hhmm(block.end_time)
+            weekdays = sorted(parse_weekdays(block.days_of_week))
+            created = block.created_at.replace(tzinfo=ZoneInfo("UTC")).astimezone(tz).date()
+            first = first_on_or_after(created, weekdays) if weekdays else None
+            if start is None or end is None or first is None:
+                continue
+            starts_at, ends_at = window(first, start, end)
+            byday = ",".join(WEEKDAY_CODES[day] for day in weekdays)
+            yield from event(
+                f"fixed-block-{block.id}", block.title, starts_at, ends_at,
+                (f"RRULE:FREQ=WEEKLY;BYDAY={byday}", "TRANSP:OPAQUE"),
+            )
+
+        exported_templates = set()
+        templates = db.query(ProjectLongTaskTemplate, Project.title).join(
+            Project, Project.id == ProjectLongTaskTemplate.project_id
+        ).filter(
+            ProjectLongTaskTemplate.user_id == user_id,
+            Project.status == "ACTIVE",
+            ProjectLongTaskTemplate.is_hidden == False,
+        ).all()
+        for template, project_title in templates:
+            start = parse_hhmm(template.default_start_time)
+            end = parse_hhmm(template.default_end_time or template.default_due_time)
+            if start is None or end is None or not template.started_at:
+                continue
+            first_day = template.started_at.date()
+            last_day = first_day + timedelta(days=max(template.total_cycle_days, 1) - 1)
+            until_local = datetime.combine(last_day, datetime.max.time().replace(microsecond=0))
+            until = until_local.replace(tzinfo=tz).astimezone(ZoneInfo("UTC")).strftime("%Y%m%dT%H%M%SZ")
+            if template.frequency_mode == "specific_days":
+                weekdays = sorted(parse_weekdays(template.days_of_week))
+                first = first_on_or_after(first_day, weekdays) if weekdays else None
+                byday = ",".join(WEEKDAY_CODES[day] for day in weekdays)
+                rule = f"RRULE:FREQ=WEEKLY;BYDAY={byday};UNTIL={until}"
+            else:
+                first = first_day
+                rule = f"RRULE:FREQ=DAILY;INTERVAL={max(template.interval_days or 1, 1)};UNTIL={until}"
+            if first is None or first > last_day:
+                continue
+            starts_at, ends_at = window(first, start, end)
+            exported_templates.add(template.id)
+            yield from event(
+                f"long-task-{template.id}", template.title, starts_at, ends_at, (rule,),
+                description=project_title,
+            )
+
+        tasks = db.query(Task).outerjoin(Project, Task.project_id == Project.id).filter(
+            Task.user_id == user_id,
+            Task.status != "EXCUSED",
+            or_(Task.scheduled_time.isnot(None), Task.deadline.isnot(None)),
+            or_(Task.project_id.is_(None), Project.status != "PROPOSED"),
+        ).with_entities(
+            Task.id, Task.title, Task.status, Task.scheduled_time, Task.duration,
+            Task.deadline, Task.long_task_template_id,
+        ).order_by(Task.id).yield_per(500)
+        for row in tasks:
+            if row.long_task_template_id in exported_templates:
+                continue
+            block_end = None
+            if row.scheduled_time is not None:
+                block_end = row.scheduled_time + timedelta(minutes=row.duration or 60)
+                summary = f"✅ {row.title}" if row.status == "DONE" else row.title
+                yield from event(f"task-{row.id}", summary, row.scheduled_time, block_end)
+            if (
+                row.deadline is not None
+                and row.status in ("OPEN", "EVIDENCE_SUBMITTED", "OVERDUE")
+                and row.deadline != block_end
+            ):
+                yield from event(f"deadline-{row.id}", f"⏰ 截止: {row.title}", row.deadline, None)
+
+        yield "END:VCALENDAR\r\n"
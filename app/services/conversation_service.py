@@ -180,13 +180,13 @@ class ConversationService:
         
         logger.info("Conversation service initialized using AIService")
     
-    def _call_ai(self, prompt: str) -> str:
-        """Call AI using the shared ai_service _call_ai method."""
+    async def _call_ai(self, prompt: str) -> str:
+        """Call AI using the shared ai_service without blocking the event loop."""
         if self.mock_mode:
             return ""
-        return self.ai_service._call_ai(prompt)
+        return await self.ai_service._call_ai_async(prompt)
     
-    def recognize_intent(self, message: str) -> Tuple[str, Dict[str, Any]]:
+    async def recognize_intent(self, message: str) -> Tuple[str, Dict[str, Any]]:
         """
         Recognize user intent from message.
         
@@ -204,7 +204,7 @@ class ConversationService:
 
         try:
             prompt = f"{INTENT_RECOGNITION_PROMPT}\n\n用户消息：{message}"
-            response_text = self._call_ai(prompt)
+            response_text = await self._call_ai(prompt)
             result = self.ai_service._extract_json(response_text)
             
             intent = result.get("intent", "chat")
@@ -217,7 +217,7 @@ class ConversationService:
             logger.error(f"Intent recognition failed: {e}")
             return "chat", {}
     
-    def gather_information(
+    async def gather_information(
         self,
         collected_info: Dict[str, Any],
         conversation_history: List[Dict[str, str]]
@@ -241,7 +241,7 @@ class ConversationService:
             for msg in conversation_history[-4:]:  # Last 4 messages
                 prompt += f"{msg['role']}: {msg['content']}\n"
             
-            response_text = self._call_ai(prompt)
+            response_text = await self._call_ai(prompt)
             result = self.ai_service._extract_json(response_text)
             
             info_complete = result.get("info_complete", False)
@@ -253,7 +253,7 @@ class ConversationService:
             logger.error(f"Information gathering failed: {e}")
             return True, "好的，让我开始规划。"
     
-    def extract_simple_task(self, message: str) -> Dict[str, Any]:
+    async def extract_simple_task(self, message: str) -> Dict[str, Any]:
         """Extract task information from message."""
         if self.mock_mode:
             return self._mock_extract_simple_task(message)
@@ -266,7 +266,7 @@ class ConversationService:
             )
             
             
-            response_text = self._call_ai(prompt)
+            response_text = await self._call_ai(prompt)
             logger.info(f"[DEBUG] Qwen response for task extraction: {repr(response_text)}")
             task_info = self.ai_service._extract_json(response_text)
             
@@ -276,7 +276,7 @@ class ConversationService:
             logger.error(f"Task extraction failed: {e}")
             raise ValueError(f"无法提取任务信息: {str(e)}")
     
-    def answer_question(self, message: str) -> str:
+    async def answer_question(self, message: str) -> str:
         """Answer a user question."""
         if self.mock_mode:
             # Better mock responses
@@ -292,14 +292,14 @@ class ConversationService:
         
         try:
             prompt = QUESTION_ANSWER_PROMPT.format(message=message)
-            response_text = self._call_ai(prompt)
+            response_text = await self._call_ai(prompt)
             return response_text.strip()
         
         except Exception as e:
             logger.error(f"Question answering failed: {e}")
             return "抱歉，我暂时无法回答这个问题。"
     
-    def refine_plan(self, current_plan: Dict[str, Any], message: str) -> Dict[str, Any]:
+    async def refine_plan(self, current_plan: Dict[str, Any], message: str) -> Dict[str, Any]:
         """Refine an existing plan based on user message."""
         if self.mock_mode:
             # Simple mock: append message to description to show change
@@ -323,7 +323,7 @@ class ConversationService:
                 message=message
             )
             
-            response_text = self._call_ai(prompt)
+            response_text = await self._call_ai(prompt)
             result = self.ai_service._extract_json(response_text)
             return result
             
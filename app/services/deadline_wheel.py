@@ -0,0 +1,259 @@
+"""In-process deadline timer that flips tasks to OVERDUE at their deadline.
+
+A min-heap holds the upcoming deadlines (``settings.deadline_horizon_hours``
+ahead) of OPEN tasks. A single timer thread sleeps until the earliest one and
+marks every due task OVERDUE in one guarded UPDATE, using the same SQL filter
+as the hourly sweep (day passes, PROPOSED projects). Only the worker holding
+the ``deadline_wheel_leader`` lease in ``job_locks`` runs timers; the lease
+and the heap are refreshed from the database by a periodic reconcile job, and
+the hourly sweep remains as a backstop.
+
+``track`` updates the heap directly on the leader. Tasks created or changed on
+other workers are picked up by the leader's poll, which every
+``settings.deadline_poll_seconds`` loads the OPEN deadlines falling due before
+the next poll (an indexed range scan), so such tasks flip at most about one
+poll interval late instead of waiting for the next reconcile.
+"""
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.exemption import JobLock
+from app.models.task import Task
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK_NAME = "deadline_wheel_leader"
+
+
+class DeadlineWheel:
+    """Min-heap of task deadlines with lazy deletion."""
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, str]] = []
+        self._deadlines: Dict[str, datetime] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._owner = f"{os.getenv('HOSTNAME', 'unknown')}_{os.getpid()}"
+        self._next_poll: Optional[datetime] = None
+        self.is_leader = False
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="deadline-wheel", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self.is_leader:
+            self._release_leadership()
+
+    # ------------------------------------------------------------------
+    # Tracking
+    # ------------------------------------------------------------------
+
+    def track(self, task: Task) -> None:
+        """Add, move or drop a task's timer after it was created or changed."""
+        if not self.is_leader:
+            return  # The leader's poll picks it up before it falls due.
+        horizon = datetime.utcnow() + timedelta(hours=settings.deadline_horizon_hours)
+        with self._cond:
+            if task.status != "OPEN" or task.deadline is None or task.deadline > horizon:
+                self._deadlines.pop(task.id, None)
+                return
+            self._push(task.id, task.deadline)
+            self._cond.notify()
+
+    def _push(self, task_id: str, deadline: datetime) -> None:
+        if self._deadlines.get(task_id) == deadline:
+            return
+        self._deadlines[task_id] = deadline
+        heapq.heappush(self._heap, (deadline, task_id))
+
+    def _replace_all(self, entries: List[Tuple[datetime, str]]) -> None:
+        with self._cond:
+            self._deadlines = {task_id: deadline for deadline, task_id in entries}
+            self._heap = [(deadline, task_id) for task_id, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+            self._cond.notify()
+
+    def _pop_due(self, now: datetime) -> List[str]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, task_id = heapq.heappop(self._heap)
+            # Skip stale entries left behind by track()/_replace_all().
+            if self._deadlines.get(task_id) == deadline:
+                del self._deadlines[task_id]
+                due.append(task_id)
+        return due
+
+    # ------------------------------------------------------------------
+    # Timer thread
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = datetime.utcnow()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    if self.is_leader and (self._next_poll is None or self._next_poll <= now):
+                        break
+                    wake_at = [self._heap[0][0]] if self._heap else []
+                    if self.is_leader:
+                        wake_at.append(self._next_poll)
+                    timeout = (min(wake_at) - now).total_seconds() if wake_at else None
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                due = self._pop_due(datetime.utcnow())
+            if self.is_leader and (self._next_poll is None or self._next_poll <= datetime.utcnow()):
+                try:
+                    self._poll()
+                except Exception as e:
+                    logger.error(f"Error polling task deadlines: {e}")
+                    self._next_poll = datetime.utcnow() + timedelta(seconds=settings.deadline_poll_seconds)
+            if due:
+                try:
+                    self._fire(due)
+                except Exception as e:
+                    logger.error(f"Error firing task deadlines: {e}")
+
+    def _fire(self, task_ids: List[str]) -> int:
+        from app.services.task_service import TaskService
+
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            result = db.execute(
+                update(Task)
+                .where(Task.id.in_(task_ids), TaskService._overdue_candidate_filter(now))
+                .values(status="OVERDUE", updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            logger.info("Deadline wheel marked %s of %s due task(s) OVERDUE", result.rowcount, len(task_ids))
+            return result.rowcount
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _poll(self) -> int:
+        """Load OPEN deadlines due before the next poll, so other workers' changes are not late."""
+        now = datetime.utcnow()
+        self._next_poll = now + timedelta(seconds=settings.deadline_poll_seconds)
+        lookback = now - timedelta(seconds=settings.deadline_poll_seconds * 2)
+        db = SessionLocal()
+        try:
+            rows = db.query(Task.id, Task.deadline).filter(
+                Task.status == "OPEN",
+                Task.deadline.isnot(None),
+                Task.deadline > lookback,
+                Task.deadline <= self._next_poll,
+            ).all()
+        finally:
+            db.close()
+        with self._cond:
+            for task_id, deadline in rows:
+                self._push(task_id, deadline)
+        return len(rows)
+
+    # ------------------------------------------------------------------
+    # Leadership and reconciliation
+    # ------------------------------------------------------------------
+
+    def _acquire_leadership(self, db) -> bool:
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=settings.deadline_reconcile_seconds * 3)
+        # Conditional UPDATE so two workers can't both take an expired lease.
+        renewed = db.query(JobLock).filter(
+            JobLock.job_name == LEADER_LOCK_NAME,
+            or_(JobLock.locked_by == self._owner, JobLock.locked_until <= now),
+        ).update(
+            {"locked_by": self._owner, "locked_until": lease_until, "locked_at": now},
+            synchronize_session=False,
+        )
+        if renewed:
+            db.commit()
+            return True
+        if db.query(JobLock.job_name).filter(JobLock.job_name == LEADER_LOCK_NAME).first():
+            db.rollback()
+            return False
+
+        db.add(JobLock(job_name=LEADER_LOCK_NAME, locked_by=self._owner, locked_until=lease_until, locked_at=now))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return False
+        return True
+
+    def _release_leadership(self) -> None:
+        db = SessionLocal()
+        try:
+            db.query(JobLock).filter(
+                JobLock.job_name == LEADER_LOCK_NAME,
+                JobLock.locked_by == self._owner,
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error releasing deadline wheel leadership: {e}")
+            db.rollback()
+        finally:
+            db.close()
+        self.is_leader = False
+
+    def reconcile(self) -> int:
+        """Renew the leader lease and reload upcoming OPEN deadlines from the database."""
+        db = SessionLocal()
+        try:
+            was_leader = self.is_leader
+            self.is_leader = self._acquire_leadership(db)
+            if not self.is_leader:
+                if was_leader:
+                    logger.info("Deadline wheel lost leadership")
+                    self._replace_all([])
+                return 0
+
+            now = datetime.utcnow()
+            horizon = now + timedelta(hours=settings.deadline_horizon_hours)
+            # Older misses (e.g. day-pass exempt tasks) are left to the hourly sweep.
+            lookback = now - timedelta(seconds=settings.deadline_reconcile_seconds * 2)
+            rows = db.query(Task.id, Task.deadline).filter(
+                Task.status == "OPEN",
+                Task.deadline.isnot(None),
+                Task.deadline > lookback,
+                Task.deadline <= horizon,
+            ).all()
+            self._replace_all([(deadline, task_id) for task_id, deadline in rows])
+            if not was_leader:
+                logger.info("Deadline wheel acquired leadership (%s)", self._owner)
+            logger.debug("Deadline wheel tracking %s task deadline(s)", len(rows))
+            return len(rows)
+        finally:
+            db.close()
+
+
+deadline_wheel = DeadlineWheel()
@@ -0,0 +1,205 @@
+"""Background AI judging of submitted evidence.
+
+``TaskService.submit_evidence`` stores evidence as ``pending`` and enqueues
+its id; ``settings.evidence_judge_workers`` asyncio workers judge it and apply
+the DONE/OPEN transition. The queue is bounded: once
+``settings.evidence_queue_max_pending`` judgments are waiting, new
+submissions get 503 with ``Retry-After`` before anything is saved.
+
+A worker claims an evidence row with a guarded UPDATE on
+``judge_started_at`` and renews the claim before every attempt, so the same
+row is never judged twice at once, even with several server processes; the
+lease (``settings.evidence_judge_lease_seconds``) only has to outlast a
+single attempt. Provider errors are retried with exponential
+backoff; after ``settings.evidence_judge_max_attempts`` the evidence fails
+with the error as its reason. Rows left pending by a restart, a full queue or
+an expired claim are re-enqueued by a periodic recovery pass.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, or_, update
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.task import TaskEvidence
+from app.services.task_service import TaskService
+
+logger = logging.getLogger(__name__)
+
+
+class EvidenceJudgeQueue:
+    """Bounded queue of evidence ids served by a fixed pool of workers."""
+
+    RETRY_AFTER_SECONDS = 15
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=settings.evidence_queue_max_pending)
+        self._tasks = [
+            asyncio.create_task(self._worker(n), name=f"evidence-judge-{n}")
+            for n in range(max(settings.evidence_judge_workers, 1))
+        ]
+        self._tasks.append(asyncio.create_task(self._recover_loop(), name="evidence-recover"))
+        logger.info(f"Evidence judging started with {settings.evidence_judge_workers} workers")
+
+    async def stop(self) -> None:
+        """Cancel the workers; unfinished evidence stays pending for the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def check_capacity(self) -> None:
+        """Raise 503 when the queue is full."""
+        if self.running and self._queue.full():
+            raise HTTPException(
+                status_code=503,
+                detail="证据判定队列已满，请稍后重试",
+                headers={"Retry-After": str(self.RETRY_AFTER_SECONDS)},
+            )
+
+    def enqueue(self, evidence_id: str) -> bool:
+        """Queue an evidence id; False when the workers are not running.
+
+        A submission that loses the race for the last slot stays pending and is
+        picked up by the recovery pass.
+        """
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait(evidence_id)
+        except asyncio.QueueFull:
+            logger.warning(f"Evidence queue full; {evidence_id} left for recovery")
+        return True
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            evidence_id = await self._queue.get()
+            try:
+                await self._judge(evidence_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Evidence worker {n} failed on {evidence_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _claim(db, evidence_id: str, held_since: Optional[datetime] = None) -> Optional[datetime]:
+        """
+        Start one judging attempt; return the new claim time, or None if the claim is lost.
+
+        The first attempt takes the row when nobody holds a live claim; each
+        retry renews the claim only if ``judge_started_at`` is still the value
+        this worker set, so a row re-taken after an expired lease is dropped
+        instead of judged twice. The attempt counter moves in the same UPDATE.
+        """
+        now = datetime.utcnow()
+        if held_since is None:
+            stale = now - timedelta(seconds=settings.evidence_judge_lease_seconds)
+            held = or_(TaskEvidence.judge_started_at.is_(None), TaskEvidence.judge_started_at < stale)
+        else:
+            held = TaskEvidence.judge_started_at == held_since
+        claimed = db.execute(
+            update(TaskEvidence)
+            .where(TaskEvidence.id == evidence_id, TaskEvidence.ai_result == "pending", held)
+            .values(judge_started_at=now, judge_attempts=func.coalesce(TaskEvidence.judge_attempts, 0) + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return now if claimed == 1 else None
+
+    @staticmethod
+    def _commit_if_held(db, evidence_id: str, claimed_at: datetime) -> bool:
+        """Commit the judgment only if this worker still holds the claim; else discard it."""
+        held = db.execute(
+            update(TaskEvidence)
+            .where(TaskEvidence.id == evidence_id, TaskEvidence.judge_started_at == claimed_at)
+            .values(judge_started_at=claimed_at)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        if held:
+            db.commit()
+        else:
+            db.rollback()
+            logger.warning(f"Judging claim on evidence {evidence_id} expired; result discarded")
+        return held
+
+    async def _judge(self, evidence_id: str) -> None:
+        db = SessionLocal()
+        try:
+            claimed_at = None
+            max_attempts = max(settings.evidence_judge_max_attempts, 1)
+            for attempt in range(1, max_attempts + 1):
+                claimed_at = self._claim(db, evidence_id, claimed_at)
+                if claimed_at is None:
+                    if attempt > 1:
+                        logger.warning(f"Lost the judging claim on evidence {evidence_id}; stopping")
+                    return
+                evidence = db.get(TaskEvidence, evidence_id)
+                try:
+                    await TaskService.judge_evidence(db, evidence)
+                    self._commit_if_held(db, evidence_id, claimed_at)
+                    return
+                except Exception as e:
+                    db.rollback()
+                    if attempt == max_attempts:
+                        TaskService.record_judgment_error(db, db.get(TaskEvidence, evidence_id), e)
+                        self._commit_if_held(db, evidence_id, claimed_at)
+                        return
+                    delay = settings.evidence_judge_retry_base_seconds * 2 ** (attempt - 1)
+                    logger.warning(
+                        f"Judging evidence {evidence_id} failed (attempt {attempt}/{max_attempts}), "
+                        f"retrying in {delay:.0f}s: {e}"
+                    )
+                    await asyncio.sleep(delay)
+        finally:
+            db.close()
+
+    async def _recover_loop(self) -> None:
+        while True:
+            try:
+                self.recover()
+            except Exception as e:
+                logger.error(f"Evidence recovery pass failed: {e}")
+            await asyncio.sleep(settings.evidence_recover_seconds)
+
+    def recover(self) -> int:
+        """Enqueue pending evidence nobody is judging, oldest first, up to free capacity."""
+        free = self._queue.maxsize - self._queue.qsize()
+        if free <= 0:
+            return 0
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=settings.evidence_judge_lease_seconds)
+        db = SessionLocal()
+        try:
+            rows = db.query(TaskEvidence.id).filter(
+                TaskEvidence.ai_result == "pending",
+                # Fresh submissions are already queued
+                TaskEvidence.submitted_at < now - timedelta(seconds=settings.evidence_recover_seconds),
+                or_(TaskEvidence.judge_started_at.is_(None), TaskEvidence.judge_started_at < stale),
+            ).order_by(TaskEvidence.submitted_at.asc()).limit(free).all()
+        finally:
+            db.close()
+        for (evidence_id,) in rows:
+            self._queue.put_nowait(evidence_id)
+        if rows:
+            logger.info(f"Re-enqueued {len(rows)} pending evidence for judging")
+        return len(rows)
+
+
+evidence_queue = EvidenceJudgeQueue()
@@ -74,7 +74,7 @@ class HabitService:
 
     def cleanup_duplicate_generated_tasks(self, db: Session, user_id: Optional[str] = None) -> int:
         """Keep only one habit-generated task per (template_id, generated_for_date)."""
-        query = db.query(Task).filter(
+        query = db.query(Task.id, Task.template_id, Task.generated_for_date).filter(
             Task.template_id.isnot(None),
             Task.generated_for_date.isnot(None),
         ).order_by(Task.template_id.asc(), Task.generated_for_date.asc(), Task.created_at.asc(), Task.id.asc())
@@ -82,34 +82,21 @@ class HabitService:
             query = query.filter(Task.user_id == user_id)
 
         seen = set()
-        to_delete: list[Task] = []
-        for task in query.all():
-            key = (task.template_id, task.generated_for_date)
+        to_delete: list[str] = []
+        for task_id, template_id, generated_for_date in query.all():
+            key = (template_id, generated_for_date)
             if key in seen:
-                to_delete.append(task)
+                to_delete.append(task_id)
             else:
                 seen.add(key)
 
         if not to_delete:
             return 0
 
-        for task in to_delete:
-            from app.models.study import StudySession
-            from app.models.metric import MetricEntry
-            
-            db.query(StudySession).filter(StudySession.task_id == task.id).update(
-                {"task_id": None}, synchronize_session=False
-            )
-            db.query(StudySession).filter(StudySession.quick_start_task_id == task.id).update(
-                {"quick_start_task_id": None}, synchronize_session=False
-            )
-            db.query(MetricEntry).filter(MetricEntry.task_id == task.id).update(
-                {"task_id": None}, synchronize_session=False
-            )
-            db.delete(task)
+        deleted = TaskService.detach_and_delete_tasks(db, to_delete)
         db.commit()
-        logger.warning("Deduplicated %s duplicate habit-generated tasks", len(to_delete))
-        return len(to_delete)
+        logger.warning("Deduplicated %s duplicate habit-generated tasks", deleted)
+        return deleted
 
     def process_daily_habits(self, db: Session, user_id: str, today: datetime = None) -> int:
         """
@@ -215,7 +202,7 @@ class HabitService:
         scheduled_time, deadline = TaskService._normalize_task_window(scheduled_time, deadline, now=today)
         duration = max(int((deadline - scheduled_time).total_seconds() // 60), 1)
 
-        db.add(Task(
+        task = Task(
             user_id=user_id,
             title=habit.title,
             status="OPEN",
@@ -228,8 +215,9 @@ class HabitService:
             evidence_criteria=habit.evidence_criteria,
             template_id=habit.id,
             generated_for_date=start_of_day,
-            tags=json.dumps(["习惯"], ensure_ascii=False),
-        ))
+        )
+        TaskService._set_task_tags(task, ["习惯"])
+        db.add(task)
 
 
 habit_service = HabitService()
@@ -0,0 +1,157 @@
+"""Image preprocessing for multimodal AI calls.
+
+Uploads are phone photos of several MB; providers only need a model-sized
+image. ``prepare`` decodes an upload once (JPEG is decoded at reduced scale
+via ``draft``), applies its EXIF orientation, shrinks it to
+``settings.ai_image_max_edge`` and re-encodes it as
+``settings.ai_image_format`` at ``settings.ai_image_quality``. The original
+bytes are kept when they are already small enough and need no rotation.
+
+Prepared images are cached by upload content digest, so judging and body-fat
+estimation of the same photo decode it only once. Each preparation logs its
+byte savings and latency; totals are in ``stats()``.
+"""
+import base64
+import io
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+from PIL import Image, ImageOps
+
+from app.config import settings
+from app.services.ai_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+PASSTHROUGH_FORMATS = {"JPEG", "PNG", "WEBP"}
+EXIF_ORIENTATION = 0x0112
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    digest: str
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode()}"
+
+    @property
+    def gemini_part(self) -> Dict[str, Any]:
+        """Inline blob accepted by ``GenerativeModel.generate_content``."""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+class ImagePreparer:
+    """Prepares images for upload to a provider, with a byte-bounded LRU."""
+
+    def __init__(self):
+        self._entries: "OrderedDict[Tuple, PreparedImage]" = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"prepared": 0, "cache_hits": 0, "bytes_in": 0, "bytes_out": 0, "prepare_ms": 0.0}
+
+    def prepare(self, path: str) -> PreparedImage:
+        """Return the provider-ready version of the image at ``path``."""
+        digest = file_digest(path)
+        target = settings.ai_image_format.upper()
+        key = (digest, settings.ai_image_max_edge, target, settings.ai_image_quality)
+        with self._lock:
+            prepared = self._entries.get(key)
+            if prepared is not None:
+                self._entries.move_to_end(key)
+                self._counters["cache_hits"] += 1
+                return prepared
+
+        started = time.perf_counter()
+        with open(path, "rb") as f:
+            original = f.read()
+        prepared = self._encode(original, digest, target)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        logger.info(
+            f"Prepared image {digest[:12]}: {len(original)} -> {len(prepared.data)} bytes "
+            f"({prepared.width}x{prepared.height} {prepared.mime_type}) in {elapsed_ms:.0f} ms"
+        )
+        with self._lock:
+            self._counters["prepared"] += 1
+            self._counters["bytes_in"] += len(original)
+            self._counters["bytes_out"] += len(prepared.data)
+            self._counters["prepare_ms"] += elapsed_ms
+            if key not in self._entries:
+                self._entries[key] = prepared
+                self._cached_bytes += len(prepared.data)
+            while self._cached_bytes > settings.ai_image_cache_max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._cached_bytes -= len(evicted.data)
+        return prepared
+
+    @staticmethod
+    def _encode(original: bytes, digest: str, target: str) -> PreparedImage:
+        max_edge = settings.ai_image_max_edge
+        img = Image.open(io.BytesIO(original))
+        source_format = img.format
+        source_size = img.size
+        rotated = img.getexif().get(EXIF_ORIENTATION, 1) != 1
+        if source_format == "JPEG":
+            img.draft("RGB", (max_edge, max_edge))
+        if rotated:
+            img = ImageOps.exif_transpose(img)
+
+        if (
+            not rotated
+            and source_format in PASSTHROUGH_FORMATS
+            and max(source_size) <= max_edge
+            and len(original) <= settings.ai_image_passthrough_max_bytes
+        ):
+            return PreparedImage(
+                data=original,
+                mime_type=Image.MIME[source_format],
+                width=source_size[0],
+                height=source_size[1],
+                original_bytes=len(original),
+                digest=digest,
+            )
+
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        if target == "WEBP":
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        else:
+            target = "JPEG"
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, format=target, quality=settings.ai_image_quality, optimize=True)
+        return PreparedImage(
+            data=out.getvalue(),
+            mime_type=Image.MIME[target],
+            width=img.width,
+            height=img.height,
+            original_bytes=len(original),
+            digest=digest,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["cached"] = len(self._entries)
+        counters["prepare_ms"] = round(counters["prepare_ms"], 1)
+        counters["bytes_saved"] = counters["bytes_in"] - counters["bytes_out"]
+        return counters
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._cached_bytes = 0
+
+
+image_preparer = ImagePreparer()
@@ -14,6 +14,7 @@ from app.models.user import User
 from app.schemas.metric import MetricEntryCreate
 from app.services.ai_service import ai_service
 from app.services.task_service import TaskService
+from app.services.upload_service import save_image_upload
 
 logger = logging.getLogger(__name__)
 
@@ -39,19 +40,7 @@ class MetricService:
         
         # Handle bodyfat AI estimation
         if data.metric_type == "bodyfat" and image_file:
-            import os
-            import uuid
-            
-            # Save image
-            upload_dir = "uploads"
-            os.makedirs(upload_dir, exist_ok=True)
-            file_extension = image_file.filename.split(".")[-1]
-            image_filename = f"bodyfat_{uuid.uuid4()}.{file_extension}"
-            image_path = os.path.join(upload_dir, image_filename)
-            
-            with open(image_path, "wb") as f:
-                content = await image_file.read()
-                f.write(content)
+            image_path = (await save_image_upload(image_file, prefix="bodyfat_")).path
             
             # Call AI
             ai_result = await ai_service.estimate_bodyfat(image_path, user.username)
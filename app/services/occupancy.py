@@ -0,0 +1,427 @@
+"""Per-user free/busy occupancy built from recurring blocks and dated tasks.
+
+Recurring sources -- fixed blocks, enabled habits and the time windows of
+long tasks in active projects -- are parsed once into weekday rules; fixed
+blocks are also precomputed as one 5-minute slot bitset per weekday (bit *i*
+covers minutes ``[5i, 5i + 5)`` of the local day). Dated tasks are loaded per
+local day into start-sorted interval lists, so an overlap check is a bisect
+plus a scan of the few intervals that can reach the window.
+
+A habit or long task only projects onto days it has not already been
+generated for; its generated task is counted instead. Interval habits with a
+period above one day have no fixed weekdays and only count once generated.
+
+Indexes are cached per user and keyed by ``SyncService.get_data_version``,
+which every write to these tables bumps. Only read-only requests should use
+the cache: a version seen inside an uncommitted write may be rolled back and
+handed out again for different data.
+"""
+import json
+import logging
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.models.habit import FixedBlock, HabitTemplate
+from app.models.project import Project
+from app.models.project_long_task import ProjectLongTaskTemplate
+from app.models.task import Task
+from app.services.sync_service import SyncService
+
+logger = logging.getLogger(__name__)
+
+SLOT_MINUTES = 5
+DAY_MINUTES = 24 * 60
+SLOTS_PER_DAY = DAY_MINUTES // SLOT_MINUTES
+FULL_DAY_MASK = (1 << SLOTS_PER_DAY) - 1
+ALL_WEEKDAYS = frozenset(range(7))
+
+
+def parse_hhmm(value: Optional[str]) -> Optional[int]:
+    """Parse ``"HH:MM"`` into minutes after midnight."""
+    try:
+        hours, minutes = map(int, str(value).split(":")[:2])
+    except (TypeError, ValueError):
+        return None
+    if not (0 <= hours <= 24 and 0 <= minutes < 60):
+        return None
+    return min(hours * 60 + minutes, DAY_MINUTES)
+
+
+def parse_weekdays(raw: Optional[str]) -> FrozenSet[int]:
+    try:
+        days = json.loads(raw) if raw else []
+    except (TypeError, ValueError):
+        return frozenset()
+    if not isinstance(days, list):
+        return frozenset()
+    return frozenset(day for day in days if isinstance(day, int) and 0 <= day <= 6)
+
+
+def slot_mask(start: int, end: int) -> int:
+    """Bitset of the slots touched by minutes ``[start, end)``."""
+    first = max(start, 0) // SLOT_MINUTES
+    last = -(-min(end, DAY_MINUTES) // SLOT_MINUTES)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def free_ranges(mask: int) -> List[Tuple[int, int]]:
+    """Minute ranges of the runs of free slots in a day bitset."""
+    free = ~mask & FULL_DAY_MASK
+    ranges = []
+    while free:
+        first = (free & -free).bit_length() - 1
+        run = free >> first
+        length = ((run + 1) & ~run).bit_length() - 1
+        ranges.append((first * SLOT_MINUTES, (first + length) * SLOT_MINUTES))
+        free &= ~(((1 << length) - 1) << first)
+    return ranges
+
+
+def first_fit(mask: int, slots: int, low: int = 0, high: int = SLOTS_PER_DAY) -> Optional[int]:
+    """First slot ``i`` in ``[low, high - slots]`` starting ``slots`` free slots in a row."""
+    if slots <= 0 or high - low < slots:
+        return None
+    starts = ~mask & FULL_DAY_MASK
+    span = 1
+    while span < slots:  # bit i stays set while slots i .. i + span - 1 are free
+        step = min(span, slots - span)
+        starts &= starts >> step
+        span += step
+    starts &= ((1 << (high - slots + 1)) - 1) & ~((1 << low) - 1)
+    if not starts:
+        return None
+    return (starts & -starts).bit_length() - 1
+
+
+@dataclass
+class Busy:
+    """An occupied interval of one local day, in minutes after midnight."""
+    day: date
+    start: int
+    end: int
+    source_type: str  # fixed_block/habit/project_long_task/task
+    source_id: str
+    title: str
+
+    @property
+    def start_at(self) -> datetime:
+        return datetime.combine(self.day, datetime.min.time()) + timedelta(minutes=self.start)
+
+    @property
+    def end_at(self) -> datetime:
+        return datetime.combine(self.day, datetime.min.time()) + timedelta(minutes=self.end)
+
+
+@dataclass
+class RecurringRule:
+    """A daily time window repeated on some weekdays, optionally within a date range."""
+    source_type: str
+    source_id: str
+    title: str
+    start: int
+    end: int
+    weekdays: FrozenSet[int]
+    first_day: Optional[date] = None
+    last_day: Optional[date] = None
+
+    def occurs_on(self, day: date) -> bool:
+        if day.weekday() not in self.weekdays:
+            return False
+        if self.first_day and day < self.first_day:
+            return False
+        return not (self.last_day and day > self.last_day)
+
+    def segments(self, day: date) -> List[Busy]:
+        """Parts of the rule on ``day``; a window ending at or before its start runs overnight."""
+        overnight = self.end <= self.start
+        result = []
+        if overnight and self.occurs_on(day - timedelta(days=1)) and self.end > 0:
+            result.append(Busy(day, 0, self.end, self.source_type, self.source_id, self.title))
+        if self.occurs_on(day):
+            end = DAY_MINUTES if overnight else self.end
+            result.append(Busy(day, self.start, end, self.source_type, self.source_id, self.title))
+        return result
+
+
+class DayIntervals:
+    """Start-sorted busy intervals of one local day."""
+
+    __slots__ = ("starts", "items", "max_length", "template_ids")
+
+    def __init__(self, items: Optional[List[Busy]] = None, template_ids: Optional[Set[str]] = None):
+        self.items: List[Busy] = sorted(items or [], key=lambda item: (item.start, item.end))
+        self.starts: List[int] = [item.start for item in self.items]
+        self.max_length = max((item.end - item.start for item in self.items), default=0)
+        self.template_ids: Set[str] = template_ids or set()
+
+    def add(self, item: Busy) -> None:
+        index = bisect_left(self.starts, item.start)
+        self.starts.insert(index, item.start)
+        self.items.insert(index, item)
+        self.max_length = max(self.max_length, item.end - item.start)
+
+    def remove(self, source_id: str) -> None:
+        keep = [item for item in self.items if item.source_id != source_id]
+        if len(keep) != len(self.items):
+            self.items = keep
+            self.starts = [item.start for item in keep]
+
+    def overlapping(self, start: int, end: int, exclude_id: Optional[str] = None) -> List[Busy]:
+        """Intervals intersecting ``[start, end)``; only starts within ``max_length`` are scanned."""
+        low = bisect_left(self.starts, start - self.max_length + 1)
+        high = bisect_left(self.starts, end)
+        return [
+            item for item in self.items[low:high]
+            if item.end > start and item.source_id != exclude_id
+        ]
+
+    def mask(self) -> int:
+        result = 0
+        for item in self.items:
+            result |= slot_mask(item.start, item.end)
+        return result
+
+
+class UserOccupancy:
+    """Occupancy of one user at one data version."""
+
+    def __init__(self, user_id: str, version: int, fixed_rules: List[RecurringRule],
+                 template_rules: List[RecurringRule]):
+        self.user_id = user_id
+        self.version = version
+        self.fixed_rules = fixed_rules
+        self.template_rules = template_rules
+        self.days: Dict[date, DayIntervals] = {}
+        self._lock = threading.RLock()
+        self._fixed_masks = [0] * 7
+        for weekday in range(7):
+            probe = date(2024, 1, 1) + timedelta(days=weekday)  # 2024-01-01 is a Monday
+            for rule in fixed_rules:
+                for segment in rule.segments(probe):
+                    self._fixed_masks[weekday] |= slot_mask(segment.start, segment.end)
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def ensure_days(self, db: Session, start_date: date, end_date: date) -> None:
+        """Load dated tasks for every missing day in the range with one query."""
+        with self._lock:
+            missing = [
+                start_date + timedelta(days=offset)
+                for offset in range((end_date - start_date).days + 1)
+                if start_date + timedelta(days=offset) not in self.days
+            ]
+            if not missing:
+                return
+            first, last = missing[0], missing[-1]
+            window_start = datetime.combine(first, datetime.min.time())
+            window_end = datetime.combine(last, datetime.min.time()) + timedelta(days=1)
+
+            # One day of look-back catches tasks running past midnight into the window.
+            rows = db.query(Task).outerjoin(Project, Task.project_id == Project.id).filter(
+                Task.user_id == self.user_id,
+                Task.scheduled_time >= window_start - timedelta(days=1),
+                Task.scheduled_time < window_end,
+                Task.status != "EXCUSED",
+                or_(Task.project_id.is_(None), Project.status != "PROPOSED"),
+            ).with_entities(
+                Task.id, Task.title, Task.scheduled_time, Task.duration,
+                Task.template_id, Task.long_task_template_id,
+            ).all()
+
+            items: Dict[date, List[Busy]] = {}
+            templates: Dict[date, Set[str]] = {}
+            for row in rows:
+                for segment in task_segments(row.id, row.title, row.scheduled_time, row.duration):
+                    if first <= segment.day <= last:
+                        items.setdefault(segment.day, []).append(segment)
+                day = row.scheduled_time.date()
+                for template_id in (row.template_id, row.long_task_template_id):
+                    if template_id:
+                        templates.setdefault(day, set()).add(template_id)
+
+            for offset in range((last - first).days + 1):
+                day = first + timedelta(days=offset)
+                self.days[day] = DayIntervals(items.get(day), templates.get(day))
+
+    def place_task(self, task_id: str, title: str, start_at: Optional[datetime],
+                   duration: Optional[int]) -> None:
+        """Move a task's block within the loaded days, so later checks in the same write see it."""
+        with self._lock:
+            for day_index in self.days.values():
+                day_index.remove(task_id)
+            if start_at is None:
+                return
+            for segment in task_segments(task_id, title, start_at, duration):
+                if segment.day in self.days:
+                    self.days[segment.day].add(segment)
+
+    # ------------------------------------------------------------------
+    # Queries (days must be loaded with ``ensure_days`` first)
+    # ------------------------------------------------------------------
+
+    def recurring(self, day: date) -> List[Busy]:
+        generated = self.days[day].template_ids
+        result = []
+        for rule in self.fixed_rules:
+            result.extend(rule.segments(day))
+        for rule in self.template_rules:
+            if rule.source_id not in generated:
+                result.extend(rule.segments(day))
+        return result
+
+    def busy(self, day: date) -> List[Busy]:
+        """Everything occupying ``day``, sorted by start."""
+        items = self.recurring(day) + list(self.days[day].items)
+        items.sort(key=lambda item: (item.start, item.end))
+        return items
+
+    def busy_mask(self, day: date, exclude_task_ids: Optional[Set[str]] = None) -> int:
+        if exclude_task_ids:
+            day_mask = 0
+            for item in self.days[day].items:
+                if item.source_id not in exclude_task_ids:
+                    day_mask |= slot_mask(item.start, item.end)
+        else:
+            day_mask = self.days[day].mask()
+        mask = self._fixed_masks[day.weekday()] | day_mask
+        generated = self.days[day].template_ids
+        for rule in self.template_rules:
+            if rule.source_id not in generated:
+                for segment in rule.segments(day):
+                    mask |= slot_mask(segment.start, segment.end)
+        return mask
+
+    def conflicts(self, start_at: datetime, end_at: datetime,
+                  exclude_task_id: Optional[str] = None) -> List[Busy]:
+        """Busy intervals overlapping ``[start_at, end_at)``."""
+        result = []
+        for segment in task_segments(exclude_task_id or "", "", start_at, None, end_at=end_at):
+            day_index = self.days[segment.day]
+            result.extend(day_index.overlapping(segment.start, segment.end, exclude_task_id))
+            generated = day_index.template_ids
+            for rule in self.fixed_rules + self.template_rules:
+                if rule.source_type != "fixed_block" and rule.source_id in generated:
+                    continue
+                for item in rule.segments(segment.day):
+                    if item.start < segment.end and item.end > segment.start:
+                        result.append(item)
+        return result
+
+
+def task_segments(task_id: str, title: str, start_at: datetime, duration: Optional[int],
+                  end_at: Optional[datetime] = None) -> List[Busy]:
+    """Split a task's ``[start, start + duration)`` into per-day pieces."""
+    if end_at is None:
+        end_at = start_at + timedelta(minutes=duration or 60)
+    segments = []
+    day = start_at.date()
+    while True:
+        midnight = datetime.combine(day, datetime.min.time())
+        start = max(int((start_at - midnight).total_seconds() // 60), 0)
+        end = min(-(-int((end_at - midnight).total_seconds()) // 60), DAY_MINUTES)
+        if end > start:
+            segments.append(Busy(day, start, end, "task", task_id, title))
+        day += timedelta(days=1)
+        if datetime.combine(day, datetime.min.time()) >= end_at:
+            return segments
+
+
+class OccupancyCache:
+    """LRU of per-user occupancy indexes, validated against the data version."""
+
+    def __init__(self, max_users: int = 256):
+        self.max_users = max_users
+        self._entries: "OrderedDict[str, UserOccupancy]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, user_id: str, cached: bool = True) -> UserOccupancy:
+        """Return the user's index, rebuilding it if their data changed.
+
+        Pass ``cached=False`` inside write transactions to get a private index.
+        """
+        version = SyncService.get_data_version(db, user_id)
+        if cached:
+            with self._lock:
+                entry = self._entries.get(user_id)
+                if entry is not None and entry.version == version:
+                    self._entries.move_to_end(user_id)
+                    return entry
+        entry = self._build(db, user_id, version)
+        if cached:
+            with self._lock:
+                self._entries[user_id] = entry
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _build(db: Session, user_id: str, version: int) -> UserOccupancy:
+        fixed_rules = []
+        for block in db.query(FixedBlock).filter(FixedBlock.user_id == user_id).all():
+            start, end = parse_hhmm(block.start_time), parse_hhmm(block.end_time)
+            if start is None or end is None:
+                continue
+            fixed_rules.append(RecurringRule(
+                "fixed_block", block.id, block.title, start, end, parse_weekdays(block.days_of_week)
+            ))
+
+        template_rules = []
+        habits = db.query(HabitTemplate).filter(
+            HabitTemplate.user_id == user_id,
+            HabitTemplate.enabled == True,
+        ).all()
+        for habit in habits:
+            rule = _template_rule("habit", habit)
+            if rule:
+                template_rules.append(rule)
+
+        long_tasks = db.query(ProjectLongTaskTemplate).join(
+            Project, Project.id == ProjectLongTaskTemplate.project_id
+        ).filter(
+            ProjectLongTaskTemplate.user_id == user_id,
+            Project.status == "ACTIVE",
+            ProjectLongTaskTemplate.is_hidden == False,
+        ).all()
+        for template in long_tasks:
+            rule = _template_rule("project_long_task", template)
+            if rule and template.started_at:
+                rule.first_day = template.started_at.date()
+                rule.last_day = rule.first_day + timedelta(days=max(template.total_cycle_days, 1) - 1)
+            if rule:
+                template_rules.append(rule)
+
+        return UserOccupancy(user_id, version, fixed_rules, template_rules)
+
+
+def _template_rule(source_type: str, template) -> Optional[RecurringRule]:
+    """Weekday rule for a habit or long-task template with a start/end window."""
+    start = parse_hhmm(template.default_start_time)
+    end = parse_hhmm(template.default_end_time or template.default_due_time)
+    if start is None or end is None:
+        return None
+    if template.frequency_mode == "specific_days":
+        weekdays = parse_weekdays(template.days_of_week)
+    elif (template.interval_days or 1) <= 1:
+        weekdays = ALL_WEEKDAYS
+    else:
+        return None
+    return RecurringRule(source_type, template.id, template.title, start, end, weekdays)
+
+
+occupancy = OccupancyCache()
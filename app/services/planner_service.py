@@ -86,7 +86,7 @@ class PlannerService:
         
         logger.info("Planner service initialized using AIService with auto-switching")
     
-    def generate_plan(
+    async def generate_plan(
         self,
         message: str,
         context: Optional[Dict[str, Any]] = None
@@ -129,7 +129,7 @@ class PlannerService:
                 logger.info(f"Generating plan (attempt {attempt + 1}/2) for: {message[:50]}...")
                 
                 # Call AI with auto-switching
-                response_text = self.ai_service._call_ai(full_prompt)
+                response_text = await self.ai_service._call_ai_async(full_prompt)
                 logger.debug(f"AI response: {response_text[:200]}...")
                 
                 # Try to extract JSON from response
@@ -148,7 +148,7 @@ class ProjectLongTaskService:
         Keep only one task per (long_task_template_id, generated_for_date).
         Prefer earliest created task to keep history stable.
         """
-        query = db.query(Task).filter(
+        query = db.query(Task.id, Task.long_task_template_id, Task.generated_for_date).filter(
             Task.long_task_template_id.isnot(None),
             Task.generated_for_date.isnot(None),
         ).order_by(Task.long_task_template_id.asc(), Task.generated_for_date.asc(), Task.created_at.asc(), Task.id.asc())
@@ -156,36 +156,22 @@ class ProjectLongTaskService:
         if template_id:
             query = query.filter(Task.long_task_template_id == template_id)
 
-        tasks = query.all()
         seen = set()
         to_delete = []
-        for task in tasks:
-            key = (task.long_task_template_id, task.generated_for_date)
+        for task_id, long_task_template_id, generated_for_date in query.all():
+            key = (long_task_template_id, generated_for_date)
             if key in seen:
-                to_delete.append(task)
+                to_delete.append(task_id)
             else:
                 seen.add(key)
 
         if not to_delete:
             return 0
 
-        for task in to_delete:
-            from app.models.study import StudySession
-            from app.models.metric import MetricEntry
-            
-            db.query(StudySession).filter(StudySession.task_id == task.id).update(
-                {"task_id": None}, synchronize_session=False
-            )
-            db.query(StudySession).filter(StudySession.quick_start_task_id == task.id).update(
-                {"quick_start_task_id": None}, synchronize_session=False
-            )
-            db.query(MetricEntry).filter(MetricEntry.task_id == task.id).update(
-                {"task_id": None}, synchronize_session=False
-            )
-            db.delete(task)
+        deleted = TaskService.detach_and_delete_tasks(db, to_delete)
         db.commit()
-        logger.warning("Deduplicated %s duplicate long-task generated tasks", len(to_delete))
-        return len(to_delete)
+        logger.warning("Deduplicated %s duplicate long-task generated tasks", deleted)
+        return deleted
 
     def _within_cycle(self, template: ProjectLongTaskTemplate, today: datetime) -> bool:
         if not template.started_at:
@@ -290,8 +276,8 @@ class ProjectLongTaskService:
             evidence_criteria=template.evidence_criteria,
             long_task_template_id=template.id,
             generated_for_date=start_of_day,
-            tags=json.dumps(["长期任务"], ensure_ascii=False),
         )
+        TaskService._set_task_tags(new_task, ["长期任务"])
         db.add(new_task)
         return 1
 
@@ -1,7 +1,7 @@
 """Qwen API client using OpenAI SDK compatibility."""
 import logging
 from typing import Optional, List, Dict, Any
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from app.config import settings
 
@@ -18,7 +18,14 @@ class QwenClient:
         
         self.client = OpenAI(
             api_key=settings.qwen_api_key,
-            base_url=settings.qwen_base_url
+            base_url=settings.qwen_base_url,
+            timeout=settings.ai_timeout_seconds,
+        )
+        # Used from request handlers so model calls do not block the event loop.
+        self.async_client = AsyncOpenAI(
+            api_key=settings.qwen_api_key,
+            base_url=settings.qwen_base_url,
+            timeout=settings.ai_timeout_seconds,
         )
         self.model = settings.qwen_model
         logger.info(f"Qwen client initialized with model: {self.model}")
@@ -104,6 +111,58 @@ class QwenClient:
             raise
 
 
+    async def agenerate_text(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> str:
+        """Async version of ``generate_text``."""
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            content = response.choices[0].message.content
+            logger.info(f"Qwen API call successful, generated {len(content)} chars")
+            return content
+        except Exception as e:
+            logger.error(f"Qwen API error: {e}")
+            raise
+
+    async def agenerate_with_image(
+        self,
+        prompt: str,
+        image_url: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> str:
+        """Async version of ``generate_with_image``."""
+        try:
+            response = await self.async_client.chat.completions.create(
+                model="qwen-vl-max",  # Force VL model for images
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": prompt},
+                            {"type": "image_url", "image_url": {"url": image_url}}
+                        ]
+                    }
+                ],
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            content = response.choices[0].message.content
+            logger.info("Qwen vision API call successful")
+            return content
+        except Exception as e:
+            logger.error(f"Qwen vision API error: {e}")
+            raise
+
+
 # Singleton instance
 qwen_client: Optional[QwenClient] = None
 
@@ -0,0 +1,276 @@
+"""Date-range schedule queries shared by the schedule router and chat."""
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+from zoneinfo import ZoneInfo
+
+from fastapi import HTTPException
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.project import Project
+from app.models.task import Task
+from app.models.user import User
+from app.schemas.schedule import (
+    AutoPlacement,
+    AutoPlaceRequest,
+    AutoPlaceResponse,
+    AutoPlaceSkipped,
+    BusyInterval,
+    DailySchedule,
+    DueTask,
+    FreeBusyDay,
+    FreeBusyResponse,
+    FreeInterval,
+    ScheduleTaskRequest,
+    TimeBlock,
+)
+from app.services.occupancy import (
+    SLOT_MINUTES,
+    SLOTS_PER_DAY,
+    first_fit,
+    free_ranges,
+    occupancy,
+    slot_mask,
+)
+from app.services.task_service import TaskService
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduleService:
+    """Schedule views over a local-day window."""
+
+    MAX_RANGE_DAYS = 92
+    DUE_STATUSES = ("OPEN", "EVIDENCE_SUBMITTED")
+
+    @staticmethod
+    def local_today() -> date:
+        """Today in ``settings.timezone`` (task times are stored as local wall-clock time)."""
+        return datetime.now(ZoneInfo(settings.timezone)).date()
+
+    @staticmethod
+    def check_range(start_date: date, end_date: date) -> int:
+        """Validate an inclusive date range and return its length in days."""
+        if end_date < start_date:
+            raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+        day_count = (end_date - start_date).days + 1
+        if day_count > ScheduleService.MAX_RANGE_DAYS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Date range is limited to {ScheduleService.MAX_RANGE_DAYS} days",
+            )
+        return day_count
+
+    @staticmethod
+    def get_days(db: Session, user: User, start_date: date, end_date: date) -> List[DailySchedule]:
+        """
+        Time blocks and due tasks for every day in ``[start_date, end_date]``.
+
+        Runs two range queries (one on ``scheduled_time``, one on ``deadline``,
+        both covered by per-user indexes) and buckets the ordered rows by day
+        in a single pass.
+        """
+        day_count = ScheduleService.check_range(start_date, end_date)
+        window_start = datetime.combine(start_date, datetime.min.time())
+        window_end = window_start + timedelta(days=day_count)
+        visible = or_(Task.project_id.is_(None), Project.status != "PROPOSED")
+        base = db.query(Task).outerjoin(Project, Task.project_id == Project.id)
+
+        blocks = base.filter(
+            Task.user_id == user.id,
+            Task.scheduled_time >= window_start,
+            Task.scheduled_time < window_end,
+            visible,
+        ).with_entities(
+            Task.id, Task.title, Task.scheduled_time, Task.duration,
+            Task.status, Task.evidence_type, Task.project_id,
+        ).order_by(Task.scheduled_time.asc()).all()
+
+        due = base.filter(
+            Task.user_id == user.id,
+            Task.status.in_(ScheduleService.DUE_STATUSES),
+            Task.deadline >= window_start,
+            Task.deadline < window_end,
+            visible,
+        ).with_entities(
+            Task.id, Task.title, Task.status, Task.deadline, Task.project_id,
+        ).order_by(Task.deadline.asc()).all()
+
+        days: Dict[date, DailySchedule] = {
+            start_date + timedelta(days=offset): DailySchedule(
+                date=start_date + timedelta(days=offset), time_blocks=[], due_tasks=[]
+            )
+            for offset in range(day_count)
+        }
+        for row in blocks:
+            days[row.scheduled_time.date()].time_blocks.append(TimeBlock(
+                task_id=row.id,
+                title=row.title,
+                scheduled_time=row.scheduled_time,
+                duration=row.duration or 60,
+                status=row.status,
+                evidence_type=row.evidence_type,
+                project_id=row.project_id,
+            ))
+        for row in due:
+            days[row.deadline.date()].due_tasks.append(DueTask(
+                task_id=row.id,
+                title=row.title,
+                status=row.status,
+                deadline=row.deadline,
+                project_id=row.project_id,
+            ))
+        return list(days.values())
+
+    @staticmethod
+    def get_day(db: Session, user: User, day: date) -> DailySchedule:
+        return ScheduleService.get_days(db, user, day, day)[0]
+
+    @staticmethod
+    def get_free_busy(db: Session, user: User, start_date: date, end_date: date) -> FreeBusyResponse:
+        """Busy intervals by source and free slot runs for every day in the range."""
+        day_count = ScheduleService.check_range(start_date, end_date)
+        index = occupancy.get(db, user.id)
+        index.ensure_days(db, start_date, end_date)
+
+        days = []
+        for offset in range(day_count):
+            day = start_date + timedelta(days=offset)
+            midnight = datetime.combine(day, datetime.min.time())
+            days.append(FreeBusyDay(
+                date=day,
+                busy=[
+                    BusyInterval(
+                        start=item.start_at,
+                        end=item.end_at,
+                        source_type=item.source_type,
+                        source_id=item.source_id,
+                        title=item.title,
+                    )
+                    for item in index.busy(day)
+                ],
+                free=[
+                    FreeInterval(
+                        start=midnight + timedelta(minutes=start),
+                        end=midnight + timedelta(minutes=end),
+                    )
+                    for start, end in free_ranges(index.busy_mask(day))
+                ],
+            ))
+        return FreeBusyResponse(
+            start_date=start_date, end_date=end_date, slot_minutes=SLOT_MINUTES, days=days
+        )
+
+    @staticmethod
+    def auto_place(db: Session, user: User, request: AutoPlaceRequest) -> AutoPlaceResponse:
+        """
+        Pack tasks into free slots, earliest deadline first.
+
+        Each day of the horizon is a busy bitset (fixed blocks, habits, long
+        tasks, other time blocks, hours outside ``day_start``-``day_end`` and
+        the past), and a task takes the first run of free slots long enough
+        for its duration that ends by its deadline. Tasks being placed do not
+        block themselves, so listed tasks that already have a block are moved.
+
+        Without ``task_ids`` the candidates are open tasks that are not time
+        blocked: their start was derived from the deadline (or the creation
+        time) rather than chosen, or their block was removed.
+        """
+        tz_now = datetime.now(ZoneInfo(settings.timezone)).replace(tzinfo=None)
+        # Deadlines are checked on the same clock as the overdue sweep.
+        utc_now = datetime.utcnow()
+        start_date = max(request.start_date or tz_now.date(), tz_now.date())
+        end_date = start_date + timedelta(days=request.days - 1)
+
+        query = db.query(Task, Project.status).outerjoin(Project, Task.project_id == Project.id).filter(
+            Task.user_id == user.id
+        )
+        if request.task_ids is None:
+            rows = query.filter(
+                Task.status == "OPEN",
+                Task.is_time_blocked.is_(False),
+                or_(Task.project_id.is_(None), Project.status != "PROPOSED"),
+            ).all()
+        else:
+            rows = query.filter(Task.id.in_(set(request.task_ids))).all()
+
+        unplaced: List[AutoPlaceSkipped] = []
+        found = {task.id for task, _ in rows}
+        for task_id in dict.fromkeys(request.task_ids or []):
+            if task_id not in found:
+                unplaced.append(AutoPlaceSkipped(task_id=task_id, reason="not_found"))
+
+        candidates = []
+        for task, project_status in rows:
+            if task.status != "OPEN":
+                unplaced.append(AutoPlaceSkipped(task_id=task.id, title=task.title, reason="not_open"))
+            elif project_status == "PROPOSED":
+                unplaced.append(AutoPlaceSkipped(task_id=task.id, title=task.title, reason="proposed_project"))
+            elif task.deadline is not None and task.deadline <= utc_now:
+                unplaced.append(AutoPlaceSkipped(task_id=task.id, title=task.title, reason="deadline_passed"))
+            else:
+                candidates.append(task)
+        candidates.sort(key=lambda t: (t.deadline is None, t.deadline or datetime.max, -(t.duration or 60), t.created_at))
+
+        index = occupancy.get(db, user.id, cached=not request.commit)
+        index.ensure_days(db, start_date, end_date)
+        moving = {task.id for task in candidates}
+        day_start = request.day_start.hour * 60 + request.day_start.minute
+        day_end = request.day_end.hour * 60 + request.day_end.minute or 24 * 60
+        if day_end <= day_start:
+            raise HTTPException(status_code=400, detail="day_end must be after day_start")
+        outside = ~slot_mask(day_start, day_end) & ((1 << SLOTS_PER_DAY) - 1)
+        masks = {}
+        for offset in range(request.days):
+            day = start_date + timedelta(days=offset)
+            masks[day] = index.busy_mask(day, moving) | outside
+        if start_date == tz_now.date():
+            minutes_now = tz_now.hour * 60 + tz_now.minute + (1 if tz_now.second else 0)
+            masks[start_date] |= slot_mask(0, minutes_now)
+
+        placements: List[AutoPlacement] = []
+        for task in candidates:
+            duration = task.duration or 60
+            slots = -(-duration // SLOT_MINUTES)
+            slot = None
+            for offset in range(request.days):
+                day = start_date + timedelta(days=offset)
+                high = SLOTS_PER_DAY
+                if task.deadline is not None:
+                    if day > task.deadline.date():
+                        break
+                    if day == task.deadline.date():
+                        high = (task.deadline.hour * 60 + task.deadline.minute) // SLOT_MINUTES
+                slot = first_fit(masks[day], slots, 0, high)
+                if slot is not None:
+                    masks[day] |= ((1 << slots) - 1) << slot
+                    placements.append(AutoPlacement(
+                        task_id=task.id,
+                        title=task.title,
+                        scheduled_time=datetime.combine(day, datetime.min.time())
+                        + timedelta(minutes=slot * SLOT_MINUTES),
+                        duration=duration,
+                        deadline=task.deadline,
+                    ))
+                    break
+            if slot is None:
+                unplaced.append(AutoPlaceSkipped(task_id=task.id, title=task.title, reason="no_free_slot"))
+
+        if request.commit and placements:
+            tasks = {task.id: task for task in candidates}
+            for placement in placements:
+                TaskService._apply_schedule(db, tasks[placement.task_id], user, ScheduleTaskRequest(
+                    scheduled_date=placement.scheduled_time.date(),
+                    scheduled_time=placement.scheduled_time.time(),
+                    duration=placement.duration,
+                ))
+            db.commit()
+            logger.info(f"Auto-placed {len(placements)} tasks for user {user.id}")
+
+        return AutoPlaceResponse(
+            placements=placements,
+            unplaced=unplaced,
+            committed=bool(request.commit and placements),
+        )
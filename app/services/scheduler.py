@@ -7,15 +7,20 @@ from zoneinfo import ZoneInfo
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from sqlalchemy.orm import Session
 
 from app.config import settings
 from app.database import SessionLocal
 from app.models.exemption import JobLock
 from app.models.task import PlanTemplate, Task
+from app.services.ai_cache import AIResultCacheStore
 from app.services.task_service import TaskService
+from app.services.deadline_wheel import deadline_wheel
 from app.services.project_long_task_service import project_long_task_service
 from app.services.reminder_service import process_all_daily_reminders
+from app.services.search_service import reindex_stale_documents
+from app.services.sync_service import SyncService
 
 logger = logging.getLogger(__name__)
 
@@ -176,6 +181,81 @@ def update_overdue_tasks():
         db.close()
 
 
+def reconcile_deadline_wheel():
+    """
+    Renew deadline wheel leadership and resync its timers with the database.
+
+    Runs every settings.deadline_reconcile_seconds.
+    """
+    try:
+        deadline_wheel.reconcile()
+    except Exception as e:
+        logger.error(f"Error reconciling deadline wheel: {e}")
+
+
+def cleanup_stale_recurring_tasks():
+    """
+    Delete unfinished recurring-generated tasks from previous days.
+
+    Runs every day at 00:01 in the configured timezone, keeping the cleanup
+    off the request path. Per-user watermarks make reruns a no-op.
+    """
+    db = SessionLocal()
+    try:
+        if not acquire_job_lock(db, "recurring_cleanup"):
+            logger.info("Skipping recurring cleanup - already running")
+            return
+        deleted = TaskService.run_daily_recurring_cleanup(db)
+        logger.info(f"Recurring cleanup completed: {deleted} stale tasks removed")
+    except Exception as e:
+        logger.error(f"Error in recurring cleanup: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def purge_sync_tombstones():
+    """Drop change feed tombstones past the retention window (daily at 03:30)."""
+    db = SessionLocal()
+    try:
+        if not acquire_job_lock(db, "sync_tombstone_purge"):
+            logger.info("Skipping sync tombstone purge - already running")
+            return
+        purged = SyncService.purge_tombstones(db)
+        logger.info(f"Sync tombstone purge completed: {purged} tombstones removed")
+    except Exception as e:
+        logger.error(f"Error in sync tombstone purge: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def purge_ai_result_cache():
+    """Drop expired rows from the shared AI judgment cache (daily at 03:45)."""
+    db = SessionLocal()
+    try:
+        if not acquire_job_lock(db, "ai_result_cache_purge"):
+            logger.info("Skipping AI result cache purge - already running")
+            return
+        purged = AIResultCacheStore.purge_expired(db)
+        logger.info(f"AI result cache purge completed: {purged} entries removed")
+    except Exception as e:
+        logger.error(f"Error in AI result cache purge: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def reindex_search_documents():
+    """Index search text for rows written outside the app (SQLite only)."""
+    try:
+        indexed = reindex_stale_documents()
+        if indexed:
+            logger.info(f"Search reindex completed: {indexed} documents indexed")
+    except Exception as e:
+        logger.error(f"Error in search reindex: {e}")
+
+
 def generate_project_long_tasks():
     """
     Generate daily tasks from project long task templates.
@@ -243,6 +323,56 @@ def start_scheduler():
         replace_existing=True
     )
     
+    # Stale recurring instance cleanup: Every day at 00:01
+    scheduler.add_job(
+        cleanup_stale_recurring_tasks,
+        trigger=CronTrigger(
+            hour=0,
+            minute=1,
+            timezone=settings.timezone
+        ),
+        id='cleanup_stale_recurring_tasks',
+        name='Cleanup stale recurring tasks',
+        replace_existing=True
+    )
+
+    # Change feed tombstone purge: Every day at 03:30
+    scheduler.add_job(
+        purge_sync_tombstones,
+        trigger=CronTrigger(
+            hour=3,
+            minute=30,
+            timezone=settings.timezone
+        ),
+        id='purge_sync_tombstones',
+        name='Purge sync tombstones',
+        replace_existing=True
+    )
+
+    # Shared AI judgment cache purge: Every day at 03:45
+    if settings.ai_cache_shared:
+        scheduler.add_job(
+            purge_ai_result_cache,
+            trigger=CronTrigger(
+                hour=3,
+                minute=45,
+                timezone=settings.timezone
+            ),
+            id='purge_ai_result_cache',
+            name='Purge AI result cache',
+            replace_existing=True
+        )
+
+    # Search index text for rows written by other connections
+    if settings.database_url.startswith("sqlite"):
+        scheduler.add_job(
+            reindex_search_documents,
+            trigger=IntervalTrigger(seconds=settings.search_reindex_seconds),
+            id='reindex_search_documents',
+            name='Reindex search documents',
+            replace_existing=True
+        )
+
     # Daily Reminder: Every day at 09:00
     scheduler.add_job(
         run_daily_reminders_job,
@@ -269,6 +399,18 @@ def start_scheduler():
         replace_existing=True
     )
     
+    # Deadline wheel reconciliation / leader lease renewal
+    if settings.deadline_wheel_enabled:
+        scheduler.add_job(
+            reconcile_deadline_wheel,
+            trigger=IntervalTrigger(seconds=settings.deadline_reconcile_seconds),
+            id='reconcile_deadline_wheel',
+            name='Reconcile deadline wheel',
+            replace_existing=True,
+            next_run_time=datetime.now(ZoneInfo(settings.timezone)),
+        )
+        deadline_wheel.start()
+    
     scheduler.start()
 
     logger.info("Scheduler started")
@@ -277,4 +419,6 @@ def start_scheduler():
 def stop_scheduler():
     """Stop the background scheduler."""
     scheduler.shutdown()
+    if settings.deadline_wheel_enabled:
+        deadline_wheel.stop()
     logger.info("Scheduler stopped")
@@ -0,0 +1,507 @@
+"""Full-text search over tasks, projects, milestones and conversations.
+
+Every searchable row has one entry in ``search_docs`` (kind, ref_id, user_id),
+maintained by database triggers on the source tables. Text is indexed as CJK
+bigrams plus words (see ``app.text_search``), so Chinese queries work without
+a segmenter.
+
+Postgres keeps a weighted ``tsvector`` column with a GIN index, computed by
+plpgsql trigger functions. SQLite keeps the text in an FTS5 table keyed by
+``search_docs.id``; its triggers are plain SQL, so any connection (the
+``sqlite3`` shell, maintenance scripts) can still write to the source tables.
+They only keep ``search_docs`` in step and bump its ``stale`` counter; the
+bigram text is written from Python, by a session ``after_flush`` hook for rows
+the app writes (same transaction) and by ``reindex_stale_documents`` for
+everything else.
+"""
+import logging
+from dataclasses import dataclass
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, event, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.backfill import run_keyset_backfill
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.models.conversation import ConversationSession
+from app.models.project import Milestone, Project
+from app.models.task import Task
+from app.models.user import User
+from app.text_search import bigram_text, message_text, query_tokens
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class _Source:
+    kind: str
+    table: str
+    title: str  # SQL expressions over the row alias "{row}"
+    body: str
+    user_id: str
+    columns: Tuple[str, ...]  # UPDATE OF columns that re-index the row
+    messages: bool = False  # body is a JSON message list; only its "content" fields are indexed
+
+    def pg_body(self, row: str) -> str:
+        body = self.body.format(row=row)
+        return f"search_message_text({body})" if self.messages else body
+
+    def index_text(self, title: Optional[str], body: Optional[str]) -> Tuple[str, str]:
+        """Title and body as written to the SQLite FTS table."""
+        return bigram_text(title), bigram_text(message_text(body) if self.messages else body)
+
+
+SOURCES = (
+    _Source(
+        "task", "tasks",
+        "{row}.title",
+        "COALESCE({row}.description, '') || ' ' || COALESCE({row}.evidence_criteria, '')",
+        "{row}.user_id",
+        ("title", "description", "evidence_criteria", "user_id"),
+    ),
+    _Source(
+        "project", "projects",
+        "{row}.title",
+        "COALESCE({row}.description, '')",
+        "{row}.user_id",
+        ("title", "description", "user_id"),
+    ),
+    _Source(
+        "milestone", "milestones",
+        "{row}.title",
+        "COALESCE({row}.description, '')",
+        "COALESCE((SELECT p.user_id FROM projects p WHERE p.id = {row}.project_id), '')",
+        ("title", "description", "project_id"),
+    ),
+    _Source(
+        "conversation", "conversation_sessions",
+        "''",
+        "{row}.messages",
+        "{row}.user_id",
+        ("messages", "user_id"),
+        messages=True,
+    ),
+)
+KINDS = tuple(source.kind for source in SOURCES)
+
+
+def _is_sqlite() -> bool:
+    return settings.database_url.startswith("sqlite")
+
+
+# ---------------------------------------------------------------------------
+# Schema (installed by migration step "search_index")
+# ---------------------------------------------------------------------------
+
+_SQLITE_TABLES = (
+    "CREATE TABLE IF NOT EXISTS search_docs ("
+    "id INTEGER PRIMARY KEY, kind VARCHAR NOT NULL, ref_id VARCHAR NOT NULL, "
+    "user_id VARCHAR NOT NULL, stale INTEGER NOT NULL DEFAULT 0, UNIQUE (kind, ref_id))",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(title, body, tokenize = 'unicode61')",
+)
+
+_POSTGRES_FUNCTIONS = (
+    r"""
+    CREATE OR REPLACE FUNCTION search_bigrams(src text) RETURNS text AS $$
+    DECLARE
+        run text;
+        tokens text[] := '{}';
+        i int;
+    BEGIN
+        IF src IS NULL THEN
+            RETURN '';
+        END IF;
+        FOR run IN
+            SELECT m[1] FROM regexp_matches(
+                lower(src),
+                '([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[^[:space:][:punct:]\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+)',
+                'g'
+            ) AS m
+        LOOP
+            IF run ~ '^[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]' AND char_length(run) > 1 THEN
+                FOR i IN 1 .. char_length(run) - 1 LOOP
+                    tokens := tokens || substr(run, i, 2);
+                END LOOP;
+                tokens := tokens || substr(run, char_length(run), 1);
+            ELSE
+                tokens := tokens || run;
+            END IF;
+        END LOOP;
+        RETURN array_to_string(tokens, ' ');
+    END
+    $$ LANGUAGE plpgsql IMMUTABLE
+    """,
+    r"""
+    CREATE OR REPLACE FUNCTION search_message_text(src text) RETURNS text AS $$
+    BEGIN
+        RETURN COALESCE(
+            (SELECT string_agg(COALESCE(m ->> 'content', ''), E'\n') FROM json_array_elements(src::json) AS m),
+            ''
+        );
+    EXCEPTION WHEN others THEN
+        RETURN '';
+    END
+    $$ LANGUAGE plpgsql IMMUTABLE
+    """,
+)
+
+_POSTGRES_TABLES = (
+    "CREATE TABLE IF NOT EXISTS search_docs ("
+    "id BIGSERIAL PRIMARY KEY, kind VARCHAR NOT NULL, ref_id VARCHAR NOT NULL, "
+    "user_id VARCHAR NOT NULL, tsv TSVECTOR NOT NULL, UNIQUE (kind, ref_id))",
+    "CREATE INDEX IF NOT EXISTS ix_search_docs_tsv ON search_docs USING GIN (tsv)",
+)
+
+
+def _pg_tsvector(source: _Source, row: str) -> str:
+    return (
+        f"setweight(to_tsvector('simple', search_bigrams({source.title.format(row=row)})), 'A') || "
+        f"setweight(to_tsvector('simple', search_bigrams({source.pg_body(row)})), 'B')"
+    )
+
+
+def _sqlite_triggers(source: _Source) -> List[str]:
+    """Plain-SQL bookkeeping triggers; the FTS text itself is written by ``_reindex_sqlite``."""
+    kind, table = source.kind, source.table
+    doc_id = f"(SELECT id FROM search_docs WHERE kind = '{kind}' AND ref_id = OLD.id)"
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS search_{kind}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO search_docs (kind, ref_id, user_id, stale)
+            VALUES ('{kind}', NEW.id, {source.user_id.format(row="NEW")}, 1);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS search_{kind}_au AFTER UPDATE OF {", ".join(source.columns)} ON {table} BEGIN
+            UPDATE search_docs SET user_id = {source.user_id.format(row="NEW")}, stale = stale + 1
+            WHERE kind = '{kind}' AND ref_id = NEW.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS search_{kind}_ad AFTER DELETE ON {table} BEGIN
+            DELETE FROM search_fts WHERE rowid = {doc_id};
+            DELETE FROM search_docs WHERE kind = '{kind}' AND ref_id = OLD.id;
+        END
+        """,
+    ]
+
+
+def _reindex_sqlite(
+    conn: Connection,
+    source: _Source,
+    ref_ids: Optional[Iterable[str]] = None,
+    *,
+    id_range: Optional[Tuple[str, str]] = None,
+    limit: Optional[int] = None,
+) -> int:
+    """
+    Write the FTS text of stale docs of one kind and return how many were written.
+
+    A doc is marked fresh only if its ``stale`` counter is unchanged since it
+    was read, so a write that lands in between leaves it for the next pass.
+    """
+    sql = (
+        f"SELECT d.id, d.stale, {source.title.format(row='t')}, {source.body.format(row='t')} "
+        f"FROM search_docs d JOIN {source.table} t ON t.id = d.ref_id "
+        "WHERE d.kind = :kind AND d.stale > 0"
+    )
+    params: Dict[str, object] = {"kind": source.kind}
+    statement_params = []
+    if ref_ids is not None:
+        sql += " AND d.ref_id IN :ref_ids"
+        params["ref_ids"] = list(ref_ids)
+        statement_params.append(bindparam("ref_ids", expanding=True))
+    if id_range is not None:
+        sql += " AND t.id BETWEEN :first_key AND :last_key"
+        params["first_key"], params["last_key"] = id_range
+    if limit:
+        sql += " ORDER BY d.id LIMIT :limit"
+        params["limit"] = limit
+    rows = conn.execute(text(sql).bindparams(*statement_params), params).all()
+    if not rows:
+        return 0
+
+    doc_ids = [row[0] for row in rows]
+    conn.execute(
+        text("DELETE FROM search_fts WHERE rowid IN :doc_ids").bindparams(bindparam("doc_ids", expanding=True)),
+        {"doc_ids": doc_ids},
+    )
+    documents = []
+    for doc_id, _, title, body in rows:
+        title_text, body_text = source.index_text(title, body)
+        documents.append({"id": doc_id, "title": title_text, "body": body_text})
+    conn.execute(text("INSERT INTO search_fts (rowid, title, body) VALUES (:id, :title, :body)"), documents)
+    conn.execute(
+        text("UPDATE search_docs SET stale = 0 WHERE id = :id AND stale = :stale"),
+        [{"id": row[0], "stale": row[1]} for row in rows],
+    )
+    return len(rows)
+
+
+def reindex_stale_documents(batch_size: int = 500) -> int:
+    """Index rows changed outside the app (raw SQL, bulk updates); SQLite only."""
+    if not _is_sqlite():
+        return 0
+    total = 0
+    for source in SOURCES:
+        while True:
+            with engine.begin() as conn:
+                written = _reindex_sqlite(conn, source, limit=batch_size)
+            total += written
+            if written < batch_size:
+                break
+    return total
+
+
+_INDEXED_MODELS = {
+    Task: "task",
+    Project: "project",
+    Milestone: "milestone",
+    ConversationSession: "conversation",
+}
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _index_flushed_rows(session: Session, flush_context) -> None:
+    """Index rows this flush inserted or updated, inside the same transaction."""
+    if not _is_sqlite():
+        return
+    touched: Dict[str, set] = {}
+    for obj in chain(session.new, session.dirty):
+        kind = _INDEXED_MODELS.get(type(obj))
+        if kind and obj.id:
+            touched.setdefault(kind, set()).add(obj.id)
+    if not touched:
+        return
+    conn = session.connection()
+    for source in SOURCES:
+        if source.kind in touched:
+            _reindex_sqlite(conn, source, touched[source.kind])
+
+
+def _postgres_triggers(source: _Source) -> List[str]:
+    kind, table = source.kind, source.table
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION search_index_{kind}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                DELETE FROM search_docs WHERE kind = '{kind}' AND ref_id = OLD.id;
+                RETURN OLD;
+            END IF;
+            INSERT INTO search_docs (kind, ref_id, user_id, tsv)
+            VALUES ('{kind}', NEW.id, {source.user_id.format(row="NEW")}, {_pg_tsvector(source, "NEW")})
+            ON CONFLICT (kind, ref_id) DO UPDATE SET user_id = EXCLUDED.user_id, tsv = EXCLUDED.tsv;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS search_index_{kind} ON {table}",
+        f"""
+        CREATE TRIGGER search_index_{kind}
+        AFTER INSERT OR DELETE OR UPDATE OF {", ".join(source.columns)} ON {table}
+        FOR EACH ROW EXECUTE FUNCTION search_index_{kind}()
+        """,
+    ]
+
+
+def _backfill_chunk(source: _Source):
+    def apply_chunk(conn: Connection, first_key: str, last_key: str) -> int:
+        params = {"first_key": first_key, "last_key": last_key}
+        user_id = source.user_id.format(row="t")
+        if not _is_sqlite():
+            return conn.execute(text(
+                f"INSERT INTO search_docs (kind, ref_id, user_id, tsv) "
+                f"SELECT '{source.kind}', t.id, {user_id}, {_pg_tsvector(source, 't')} "
+                f"FROM {source.table} t WHERE t.id BETWEEN :first_key AND :last_key "
+                "ON CONFLICT (kind, ref_id) DO NOTHING"
+            ), params).rowcount
+
+        # Rows written since the triggers were installed already have a doc.
+        inserted = conn.execute(text(
+            f"INSERT INTO search_docs (kind, ref_id, user_id, stale) "
+            f"SELECT '{source.kind}', t.id, {user_id}, 1 FROM {source.table} t "
+            "WHERE t.id BETWEEN :first_key AND :last_key AND NOT EXISTS ("
+            f"SELECT 1 FROM search_docs d WHERE d.kind = '{source.kind}' AND d.ref_id = t.id)"
+        ), params).rowcount
+        _reindex_sqlite(conn, source, id_range=(first_key, last_key))
+        return inserted
+
+    return apply_chunk
+
+
+def install_search_index() -> int:
+    """Create the index tables, functions and triggers, then index existing rows."""
+    with engine.begin() as conn:
+        if _is_sqlite():
+            statements = list(_SQLITE_TABLES)
+            for source in SOURCES:
+                statements.extend(_sqlite_triggers(source))
+        else:
+            statements = list(_POSTGRES_FUNCTIONS) + list(_POSTGRES_TABLES)
+            for source in SOURCES:
+                statements.extend(_postgres_triggers(source))
+        for statement in statements:
+            conn.exec_driver_sql(statement)
+
+    indexed = 0
+    for source in SOURCES:
+        indexed += run_keyset_backfill(
+            f"search_index_{source.kind}",
+            f"SELECT id FROM {source.table} WHERE id > :after ORDER BY id LIMIT :limit",
+            _backfill_chunk(source),
+        )
+    return indexed
+
+
+def install_sql_search_triggers() -> None:
+    """
+    Replace SQLite search triggers that called Python functions with plain-SQL ones.
+
+    Earlier installs tokenized inside the triggers through functions that only
+    exist on app connections, so other connections could not write to the
+    indexed tables. Existing FTS text is kept; docs start out fresh.
+    """
+    if not _is_sqlite():
+        return
+    with engine.begin() as conn:
+        columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(search_docs)")]
+        if not columns:
+            return
+        if "stale" not in columns:
+            conn.exec_driver_sql("ALTER TABLE search_docs ADD COLUMN stale INTEGER NOT NULL DEFAULT 0")
+        for source in SOURCES:
+            for suffix in ("ai", "au", "ad"):
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS search_{source.kind}_{suffix}")
+            for statement in _sqlite_triggers(source):
+                conn.exec_driver_sql(statement)
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+_SQLITE_SEARCH_SQL = """
+    SELECT d.kind, d.ref_id, -bm25(search_fts, 4.0, 1.0) AS score
+    FROM search_fts JOIN search_docs d ON d.id = search_fts.rowid
+    WHERE search_fts MATCH :match AND d.user_id = :user_id AND d.kind IN :kinds
+    ORDER BY bm25(search_fts, 4.0, 1.0)
+    LIMIT :limit OFFSET :offset
+"""
+
+_POSTGRES_SEARCH_SQL = """
+    SELECT d.kind, d.ref_id, ts_rank(d.tsv, q) AS score
+    FROM search_docs d, to_tsquery('simple', :match) AS q
+    WHERE d.tsv @@ q AND d.user_id = :user_id AND d.kind IN :kinds
+    ORDER BY score DESC, d.id
+    LIMIT :limit OFFSET :offset
+"""
+
+class SearchService:
+    """Ranked full-text search over a user's data."""
+
+    MAX_LIMIT = 100
+    SNIPPET_CHARS = 120
+
+    @staticmethod
+    def _match_expression(tokens: List[Tuple[str, bool]]) -> str:
+        """AND all query tokens, marking prefix matches in the backend's syntax."""
+        if _is_sqlite():
+            return " ".join(f'"{token}"' + ("*" if prefix else "") for token, prefix in tokens)
+        return " & ".join(f"'{token}'" + (":*" if prefix else "") for token, prefix in tokens)
+
+    @staticmethod
+    def _snippet(value: Optional[str], tokens: List[str]) -> Optional[str]:
+        if not value:
+            return None
+        lowered = value.lower()
+        positions = [pos for pos in (lowered.find(token) for token in tokens) if pos >= 0]
+        start = max(min(positions) - SearchService.SNIPPET_CHARS // 4, 0) if positions else 0
+        snippet = value[start:start + SearchService.SNIPPET_CHARS].strip()
+        return ("…" if start else "") + snippet + ("…" if start + SearchService.SNIPPET_CHARS < len(value) else "")
+
+    @staticmethod
+    def _hydrate(db: Session, hits: List[Tuple[str, str, float]], tokens: List[str]) -> List[dict]:
+        """Load display fields for the hits with one query per kind."""
+        ids_by_kind: Dict[str, List[str]] = {}
+        for kind, ref_id, _ in hits:
+            ids_by_kind.setdefault(kind, []).append(ref_id)
+
+        details: Dict[Tuple[str, str], dict] = {}
+        if ids_by_kind.get("task"):
+            for row in db.query(
+                Task.id, Task.title, Task.description, Task.status, Task.project_id
+            ).filter(Task.id.in_(ids_by_kind["task"])):
+                details[("task", row.id)] = {
+                    "title": row.title, "snippet": SearchService._snippet(row.description, tokens),
+                    "status": row.status, "project_id": row.project_id,
+                }
+        if ids_by_kind.get("project"):
+            for row in db.query(
+                Project.id, Project.title, Project.description, Project.status
+            ).filter(Project.id.in_(ids_by_kind["project"])):
+                details[("project", row.id)] = {
+                    "title": row.title, "snippet": SearchService._snippet(row.description, tokens),
+                    "status": row.status, "project_id": row.id,
+                }
+        if ids_by_kind.get("milestone"):
+            for row in db.query(
+                Milestone.id, Milestone.title, Milestone.description, Milestone.status, Milestone.project_id
+            ).filter(Milestone.id.in_(ids_by_kind["milestone"])):
+                details[("milestone", row.id)] = {
+                    "title": row.title, "snippet": SearchService._snippet(row.description, tokens),
+                    "status": row.status, "project_id": row.project_id,
+                }
+        if ids_by_kind.get("conversation"):
+            for row in db.query(
+                ConversationSession.id, ConversationSession.messages, ConversationSession.stage
+            ).filter(ConversationSession.id.in_(ids_by_kind["conversation"])):
+                content = message_text(row.messages)
+                details[("conversation", row.id)] = {
+                    "title": (content.split("\n", 1)[0][:60] or "对话"),
+                    "snippet": SearchService._snippet(content, tokens),
+                    "status": row.stage, "project_id": None,
+                }
+
+        items = []
+        for kind, ref_id, score in hits:
+            detail = details.get((kind, ref_id))
+            if detail:  # Skip rows deleted between the two queries.
+                items.append({"kind": kind, "id": ref_id, "score": round(float(score), 4), **detail})
+        return items
+
+    @staticmethod
+    def search(
+        db: Session,
+        user: User,
+        q: str,
+        *,
+        kinds: Optional[List[str]] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> Tuple[List[dict], Optional[int]]:
+        """Return ranked hits for ``q`` and the offset of the next page (None on the last page)."""
+        tokens = query_tokens(q)
+        if not tokens:
+            return [], None
+
+        limit = max(1, min(limit, SearchService.MAX_LIMIT))
+        statement = text(_SQLITE_SEARCH_SQL if _is_sqlite() else _POSTGRES_SEARCH_SQL).bindparams(
+            bindparam("kinds", expanding=True)
+        )
+        rows = db.execute(statement, {
+            "match": SearchService._match_expression(tokens),
+            "user_id": user.id,
+            "kinds": list(kinds or KINDS),
+            "limit": limit + 1,
+            "offset": offset,
+        }).all()
+
+        next_offset = offset + limit if len(rows) > limit else None
+        hits = [(row[0], row[1], row[2]) for row in rows[:limit]]
+        terms = [token for token, _ in tokens]
+        return SearchService._hydrate(db, hits, terms), next_offset
+
@@ -0,0 +1,316 @@
+"""Per-user change feed for incremental client sync.
+
+Database triggers on the synced tables bump a per-user counter in
+``sync_state`` and upsert one row per entity into ``sync_changes`` with the new
+sequence number (and a tombstone flag on delete). Because the counter row is
+updated inside the writing transaction, a user's sequence numbers become
+visible in commit order, so "everything with seq > cursor" never skips a
+change. Only the latest change per entity is kept, so a sync costs
+O(entities changed since the cursor) regardless of how often they changed.
+"""
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import engine
+from app.models.habit import FixedBlock, HabitTemplate
+from app.models.project import Milestone, Project
+from app.models.task import Task
+from app.models.user import User
+from app.schemas.project import MilestoneResponse, ProjectResponse
+from app.schemas.task import TaskResponse
+
+logger = logging.getLogger(__name__)
+
+# entity name -> (table, owner expression over the row alias "{row}")
+SYNCED_TABLES: Dict[str, Tuple[str, str]] = {
+    "task": ("tasks", "{row}.user_id"),
+    "project": ("projects", "{row}.user_id"),
+    "milestone": ("milestones", "(SELECT p.user_id FROM projects p WHERE p.id = {row}.project_id)"),
+    "habit_template": ("habit_templates", "{row}.user_id"),
+    "fixed_block": ("fixed_blocks", "{row}.user_id"),
+}
+# Tables that don't appear in the feed but still bump the user's data version
+# (used for ETags on views built from them).
+VERSION_ONLY_TABLES: Dict[str, str] = {
+    "study_sessions": "{row}.user_id",
+    "project_long_task_templates": "{row}.user_id",
+}
+_MODELS = {
+    "task": Task,
+    "project": Project,
+    "milestone": Milestone,
+    "habit_template": HabitTemplate,
+    "fixed_block": FixedBlock,
+}
+
+
+def _is_sqlite() -> bool:
+    return settings.database_url.startswith("sqlite")
+
+
+# ---------------------------------------------------------------------------
+# Schema (installed by migration step "sync_change_feed")
+# ---------------------------------------------------------------------------
+
+_SQLITE_TABLES = (
+    "CREATE TABLE IF NOT EXISTS sync_state ("
+    "user_id VARCHAR PRIMARY KEY, seq INTEGER NOT NULL DEFAULT 0, purged_seq INTEGER NOT NULL DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS sync_changes ("
+    "entity VARCHAR NOT NULL, entity_id VARCHAR NOT NULL, user_id VARCHAR NOT NULL, "
+    "seq INTEGER NOT NULL, deleted BOOLEAN NOT NULL DEFAULT 0, changed_at DATETIME NOT NULL, "
+    "PRIMARY KEY (entity, entity_id))",
+    "CREATE INDEX IF NOT EXISTS ix_sync_changes_user_seq ON sync_changes (user_id, seq)",
+)
+
+_POSTGRES_TABLES = (
+    "CREATE TABLE IF NOT EXISTS sync_state ("
+    "user_id VARCHAR PRIMARY KEY, seq BIGINT NOT NULL DEFAULT 0, purged_seq BIGINT NOT NULL DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS sync_changes ("
+    "entity VARCHAR NOT NULL, entity_id VARCHAR NOT NULL, user_id VARCHAR NOT NULL, "
+    "seq BIGINT NOT NULL, deleted BOOLEAN NOT NULL DEFAULT FALSE, changed_at TIMESTAMP NOT NULL, "
+    "PRIMARY KEY (entity, entity_id))",
+    "CREATE INDEX IF NOT EXISTS ix_sync_changes_user_seq ON sync_changes (user_id, seq)",
+)
+
+_POSTGRES_FUNCTION = """
+    CREATE OR REPLACE FUNCTION sync_record_change() RETURNS trigger AS $$
+    DECLARE
+        rec record;
+        owner varchar;
+        next_seq bigint;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            rec := OLD;
+        ELSE
+            rec := NEW;
+        END IF;
+        IF TG_TABLE_NAME = 'milestones' THEN
+            SELECT p.user_id INTO owner FROM projects p WHERE p.id = rec.project_id;
+        ELSE
+            owner := rec.user_id;
+        END IF;
+        IF owner IS NULL THEN
+            RETURN NULL;
+        END IF;
+
+        INSERT INTO sync_state (user_id, seq) VALUES (owner, 1)
+        ON CONFLICT (user_id) DO UPDATE SET seq = sync_state.seq + 1
+        RETURNING seq INTO next_seq;
+
+        INSERT INTO sync_changes (entity, entity_id, user_id, seq, deleted, changed_at)
+        VALUES (TG_ARGV[0], rec.id, owner, next_seq, TG_OP = 'DELETE', timezone('utc', now()))
+        ON CONFLICT (entity, entity_id) DO UPDATE SET
+            user_id = EXCLUDED.user_id, seq = EXCLUDED.seq,
+            deleted = EXCLUDED.deleted, changed_at = EXCLUDED.changed_at;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+
+def _sqlite_triggers(entity: str, table: str, owner: str) -> List[str]:
+    statements = []
+    for event, row, deleted in (("INSERT", "NEW", 0), ("UPDATE", "NEW", 0), ("DELETE", "OLD", 1)):
+        user_id = owner.format(row=row)
+        statements.append(f"""
+        CREATE TRIGGER IF NOT EXISTS sync_{table}_{event.lower()} AFTER {event} ON {table}
+        WHEN {user_id} IS NOT NULL
+        BEGIN
+            INSERT INTO sync_state (user_id, seq) VALUES ({user_id}, 1)
+            ON CONFLICT (user_id) DO UPDATE SET seq = seq + 1;
+            INSERT INTO sync_changes (entity, entity_id, user_id, seq, deleted, changed_at)
+            VALUES (
+                '{entity}', {row}.id, {user_id},
+                (SELECT seq FROM sync_state WHERE user_id = {user_id}), {deleted}, datetime('now')
+            )
+            ON CONFLICT (entity, entity_id) DO UPDATE SET
+                user_id = excluded.user_id, seq = excluded.seq,
+                deleted = excluded.deleted, changed_at = excluded.changed_at;
+        END
+        """)
+    return statements
+
+
+def install_change_feed() -> None:
+    """Create the change feed tables and the triggers on every synced table."""
+    with engine.begin() as conn:
+        if _is_sqlite():
+            statements = list(_SQLITE_TABLES)
+            for entity, (table, owner) in SYNCED_TABLES.items():
+                statements.extend(_sqlite_triggers(entity, table, owner))
+        else:
+            statements = list(_POSTGRES_TABLES) + [_POSTGRES_FUNCTION]
+            for entity, (table, _) in SYNCED_TABLES.items():
+                statements.append(f"DROP TRIGGER IF EXISTS sync_{table} ON {table}")
+                statements.append(
+                    f"CREATE TRIGGER sync_{table} AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                    f"FOR EACH ROW EXECUTE FUNCTION sync_record_change('{entity}')"
+                )
+        for statement in statements:
+            conn.exec_driver_sql(statement)
+
+
+_POSTGRES_VERSION_FUNCTION = """
+    CREATE OR REPLACE FUNCTION sync_bump_version() RETURNS trigger AS $$
+    DECLARE
+        owner varchar;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            owner := OLD.user_id;
+        ELSE
+            owner := NEW.user_id;
+        END IF;
+        IF owner IS NOT NULL THEN
+            INSERT INTO sync_state (user_id, seq) VALUES (owner, 1)
+            ON CONFLICT (user_id) DO UPDATE SET seq = sync_state.seq + 1;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+
+def install_version_triggers() -> None:
+    """Bump ``sync_state.seq`` on writes to the version-only tables."""
+    with engine.begin() as conn:
+        if _is_sqlite():
+            statements = []
+            for table, owner in VERSION_ONLY_TABLES.items():
+                for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+                    user_id = owner.format(row=row)
+                    statements.append(f"""
+                    CREATE TRIGGER IF NOT EXISTS sync_{table}_{event.lower()} AFTER {event} ON {table}
+                    WHEN {user_id} IS NOT NULL
+                    BEGIN
+                        INSERT INTO sync_state (user_id, seq) VALUES ({user_id}, 1)
+                        ON CONFLICT (user_id) DO UPDATE SET seq = seq + 1;
+                    END
+                    """)
+        else:
+            statements = [_POSTGRES_VERSION_FUNCTION]
+            for table in VERSION_ONLY_TABLES:
+                statements.append(f"DROP TRIGGER IF EXISTS sync_{table} ON {table}")
+                statements.append(
+                    f"CREATE TRIGGER sync_{table} AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                    "FOR EACH ROW EXECUTE FUNCTION sync_bump_version()"
+                )
+        for statement in statements:
+            conn.exec_driver_sql(statement)
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+def _plain_row(obj) -> dict:
+    """Column dict with JSON day lists decoded, matching the habits router."""
+    data = {column.name: getattr(obj, column.name) for column in obj.__table__.columns}
+    if isinstance(data.get("days_of_week"), str):
+        try:
+            data["days_of_week"] = json.loads(data["days_of_week"])
+        except ValueError:
+            data["days_of_week"] = []
+    return data
+
+
+_SERIALIZERS = {
+    "task": lambda obj: TaskResponse.model_validate(obj).model_dump(),
+    "project": lambda obj: ProjectResponse.model_validate(obj).model_dump(),
+    "milestone": lambda obj: MilestoneResponse.model_validate(obj).model_dump(exclude={"is_unlocked"}),
+    "habit_template": _plain_row,
+    "fixed_block": _plain_row,
+}
+
+
+class SyncService:
+    """Read side of the change feed."""
+
+    MAX_LIMIT = 1000
+
+    @staticmethod
+    def get_state(db: Session, user_id: str) -> Tuple[int, int]:
+        """Return the user's current ``(seq, purged_seq)``."""
+        row = db.execute(
+            text("SELECT seq, purged_seq FROM sync_state WHERE user_id = :user_id"), {"user_id": user_id}
+        ).first()
+        return (int(row[0]), int(row[1])) if row else (0, 0)
+
+    @staticmethod
+    def get_data_version(db: Session, user_id: str) -> int:
+        """Counter bumped by every write to the user's synced or version-only rows."""
+        return SyncService.get_state(db, user_id)[0]
+
+    @staticmethod
+    def get_changes(db: Session, user: User, since: Optional[int], limit: int = 500) -> dict:
+        """
+        Return upserts and tombstones with ``seq > since``, oldest first.
+
+        A missing ``since``, or one older than the purged tombstone horizon, yields
+        ``reset=True`` with the current cursor: the client reloads the full
+        lists and then syncs from that cursor.
+        """
+        current_seq, purged_seq = SyncService.get_state(db, user.id)
+        if since is None or since < purged_seq or since > current_seq:
+            return {"cursor": current_seq, "reset": True, "has_more": False, "changes": []}
+
+        limit = max(1, min(limit, SyncService.MAX_LIMIT))
+        rows = db.execute(
+            text(
+                "SELECT entity, entity_id, seq, deleted FROM sync_changes "
+                "WHERE user_id = :user_id AND seq > :since ORDER BY seq LIMIT :limit"
+            ),
+            {"user_id": user.id, "since": since, "limit": limit + 1},
+        ).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        # One query per entity type for the rows that still exist.
+        wanted: Dict[str, List[str]] = {}
+        for entity, entity_id, _, deleted in rows:
+            if not deleted and entity in _MODELS:
+                wanted.setdefault(entity, []).append(entity_id)
+        loaded: Dict[Tuple[str, str], object] = {}
+        for entity, ids in wanted.items():
+            model = _MODELS[entity]
+            for obj in db.query(model).filter(model.id.in_(ids)).all():
+                loaded[(entity, obj.id)] = obj
+
+        changes = []
+        for entity, entity_id, seq, deleted in rows:
+            obj = loaded.get((entity, entity_id))
+            if deleted or obj is None:
+                changes.append({"entity": entity, "id": entity_id, "seq": seq, "op": "delete", "data": None})
+            else:
+                changes.append({
+                    "entity": entity, "id": entity_id, "seq": seq, "op": "upsert",
+                    "data": _SERIALIZERS[entity](obj),
+                })
+
+        cursor = rows[-1][2] if rows else since
+        return {"cursor": cursor, "reset": False, "has_more": has_more, "changes": changes}
+
+    @staticmethod
+    def purge_tombstones(db: Session, now: Optional[datetime] = None) -> int:
+        """Drop old tombstones and advance each affected user's ``purged_seq``."""
+        cutoff = (now or datetime.utcnow()) - timedelta(days=settings.sync_tombstone_retention_days)
+        params = {"cutoff": cutoff}
+        deleted_flag = "1" if _is_sqlite() else "TRUE"
+        db.execute(text(
+            "UPDATE sync_state SET purged_seq = ("
+            "SELECT MAX(c.seq) FROM sync_changes c "
+            f"WHERE c.user_id = sync_state.user_id AND c.deleted = {deleted_flag} AND c.changed_at < :cutoff"
+            ") WHERE EXISTS ("
+            "SELECT 1 FROM sync_changes c "
+            f"WHERE c.user_id = sync_state.user_id AND c.deleted = {deleted_flag} AND c.changed_at < :cutoff)"
+        ), params)
+        purged = db.execute(text(
+            f"DELETE FROM sync_changes WHERE deleted = {deleted_flag} AND changed_at < :cutoff"
+        ), params).rowcount
+        db.commit()
+        return purged
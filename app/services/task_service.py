@@ -1,58 +1,105 @@
 """Task service for task business logic."""
+import base64
 import json
+from collections import Counter
 from datetime import datetime, date, time, timedelta
+from time import monotonic
+from types import SimpleNamespace
 from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo
 import logging
 
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import and_, exists, func, or_, update
 from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
 
-from app.models.task import Task, TaskEvidence, PlanTemplate
+from app.config import settings
+from app.models.task import Task, TaskEvidence, PlanTemplate, TaskTag
 from app.models.project import Project, Milestone
 from app.models.user import User
-from app.schemas.task import TaskCreate, TaskEvidenceSubmit
+from app.schemas.schedule import BusyInterval, ScheduleTaskRequest
+from app.schemas.task import TaskCreate, TaskEvidenceSubmit, TaskUpdate
 from app.services.ai_service import ai_service
+from app.services.deadline_wheel import deadline_wheel
+from app.services.occupancy import UserOccupancy, occupancy
+from app.services.upload_service import save_image_upload
 
 logger = logging.getLogger(__name__)
 
 
-class TaskService:
-    """Task business logic service."""
+class MilestoneGateResolver:
+    """
+    Per-request milestone lock resolver.
 
-    IN_PROGRESS_LIMIT = 5
-    FROZEN_AFTER_DAYS = 14
-    TERMINAL_STATUSES = {"DONE", "EXCUSED"}
+    Loads every project referenced by a batch of tasks in one query and the
+    milestones of the active ones in a second query, then answers lock/unlock
+    questions for any task in the batch from memory.
+    """
 
-    @staticmethod
-    def _is_task_milestone_unlocked(db: Session, task: Task, project: Optional[Project] = None) -> bool:
+    def __init__(self, db: Session):
+        self.db = db
+        self._projects: dict[str, Optional[Project]] = {}
+        self._unlock_flags: dict[str, dict[str, bool]] = {}
+
+    def add_project(self, project: Project) -> None:
+        self._projects.setdefault(project.id, project)
+
+    def load_projects(self, project_ids) -> "MilestoneGateResolver":
+        missing = {pid for pid in project_ids if pid} - set(self._projects)
+        if missing:
+            found = {p.id: p for p in self.db.query(Project).filter(Project.id.in_(missing)).all()}
+            for project_id in missing:
+                self._projects[project_id] = found.get(project_id)
+        return self
+
+    def invalidate(self, project_id: Optional[str]) -> None:
+        """Forget cached unlock flags after a project's milestones changed."""
+        self._unlock_flags.pop(project_id, None)
+
+    def load(self, tasks: List[Task]) -> "MilestoneGateResolver":
+        self.load_projects(t.project_id for t in tasks)
+
+        gated_ids = {
+            t.project_id for t in tasks
+            if t.project_id and t.milestone_id and t.project_id not in self._unlock_flags
+        }
+        active_ids = [
+            pid for pid in gated_ids
+            if self._projects.get(pid) is not None and self._projects[pid].status == "ACTIVE"
+        ]
+        if active_ids:
+            from app.services.project_service import ProjectService
+
+            by_project: dict[str, list[Milestone]] = {pid: [] for pid in active_ids}
+            for milestone in self.db.query(Milestone).filter(Milestone.project_id.in_(active_ids)).all():
+                by_project[milestone.project_id].append(milestone)
+            for project_id, milestones in by_project.items():
+                self._unlock_flags[project_id] = ProjectService._milestone_unlock_flags(milestones)
+        return self
+
+    def project(self, project_id: Optional[str]) -> Optional[Project]:
+        if not project_id:
+            return None
+        return self._projects.get(project_id)
+
+    def is_unlocked(self, task: Task) -> bool:
         if not task.project_id or not task.milestone_id:
             return True
-        proj = project or db.query(Project).filter(Project.id == task.project_id).first()
-        if not proj or proj.status != "ACTIVE":
+        project = self.project(task.project_id)
+        if not project or project.status != "ACTIVE":
             return True
+        return self._unlock_flags.get(task.project_id, {}).get(task.milestone_id, True)
 
-        milestones = db.query(Milestone).filter(
-            Milestone.project_id == task.project_id
-        ).order_by(Milestone.order_index.asc(), Milestone.id.asc()).all()
-        prior_blocked = False
-        for milestone in milestones:
-            unlocked = not prior_blocked
-            if milestone.id == task.milestone_id:
-                return unlocked
-            if milestone.status != "ACHIEVED":
-                prior_blocked = True
-        return True
-
-    @staticmethod
-    def _sync_task_locked_state(db: Session, task: Task) -> bool:
-        """Synchronize task LOCKED/Open state for active project milestone tasks."""
+    def sync_locked_state(self, task: Task) -> bool:
+        """Apply LOCKED/OPEN for active project milestone tasks; return True if changed."""
         if not task.project_id or not task.milestone_id or task.status in TaskService.TERMINAL_STATUSES:
             return False
-        project = db.query(Project).filter(Project.id == task.project_id).first()
+        project = self.project(task.project_id)
         if not project or project.status != "ACTIVE":
             return False
-        unlocked = TaskService._is_task_milestone_unlocked(db, task, project)
+        unlocked = self.is_unlocked(task)
         target_status = None
         if unlocked:
             if task.status == "LOCKED":
@@ -68,6 +115,29 @@ class TaskService:
         task.status = target_status
         return True
 
+
+class TaskService:
+    """Task business logic service."""
+
+    IN_PROGRESS_LIMIT = 5
+    FROZEN_AFTER_DAYS = 14
+    TERMINAL_STATUSES = {"DONE", "EXCUSED"}
+
+    @staticmethod
+    def _is_task_milestone_unlocked(db: Session, task: Task, project: Optional[Project] = None) -> bool:
+        gate = MilestoneGateResolver(db)
+        if project is not None:
+            gate.add_project(project)
+        gate.load([task])
+        return gate.is_unlocked(task)
+
+    @staticmethod
+    def _sync_task_locked_state(db: Session, task: Task) -> bool:
+        """Synchronize task LOCKED/Open state for active project milestone tasks."""
+        gate = MilestoneGateResolver(db)
+        gate.load([task])
+        return gate.sync_locked_state(task)
+
     @staticmethod
     def _sync_project_milestone_status_from_task(db: Session, task: Task) -> None:
         """Auto-complete milestone and unlock next milestone when all milestone tasks are done."""
@@ -113,14 +183,18 @@ class TaskService:
         *,
         project_id: Optional[str],
         milestone_id: Optional[str],
+        milestones: Optional[dict[str, Optional[Milestone]]] = None,
     ) -> Optional[Milestone]:
         if milestone_id is None:
             return None
 
-        milestone = db.query(Milestone).join(Project, Milestone.project_id == Project.id).filter(
-            Milestone.id == milestone_id,
-            Project.user_id == user.id,
-        ).first()
+        if milestones is not None and milestone_id in milestones:
+            milestone = milestones[milestone_id]
+        else:
+            milestone = db.query(Milestone).join(Project, Milestone.project_id == Project.id).filter(
+                Milestone.id == milestone_id,
+                Project.user_id == user.id,
+            ).first()
         if not milestone:
             raise HTTPException(status_code=404, detail="Milestone not found")
 
@@ -163,11 +237,12 @@ class TaskService:
 
     @staticmethod
     def _apply_task_window(task: Task, start_at: Optional[datetime], deadline_at: Optional[datetime]) -> None:
+        # Only a chosen start blocks time; a derived one leaves the task unscheduled.
+        task.is_time_blocked = start_at is not None
         start_at, deadline_at = TaskService._normalize_task_window(start_at, deadline_at)
         task.scheduled_time = start_at
         task.scheduled_date = start_at
         task.deadline = deadline_at
-        task.is_time_blocked = True
         duration_minutes = int((deadline_at - start_at).total_seconds() // 60)
         task.duration = max(duration_minutes, 1)
 
@@ -193,28 +268,79 @@ class TaskService:
         if user_id:
             query = query.filter(Task.user_id == user_id)
 
-        stale_tasks = query.all()
-        if not stale_tasks:
+        stale_ids = [row[0] for row in query.with_entities(Task.id).all()]
+        if not stale_ids:
             return 0
 
-        for task in stale_tasks:
-            from app.models.study import StudySession
-            from app.models.metric import MetricEntry
-            
-            db.query(StudySession).filter(StudySession.task_id == task.id).update(
+        deleted = TaskService.detach_and_delete_tasks(db, stale_ids)
+        db.commit()
+        logger.info("Deleted %s stale unfinished recurring-generated task(s)", deleted)
+        return deleted
+
+    DELETE_CHUNK_SIZE = 500
+
+    @staticmethod
+    def detach_and_delete_tasks(db: Session, task_ids, chunk_size: Optional[int] = None) -> int:
+        """
+        Delete tasks in bulk after nulling the rows that reference them.
+
+        Per chunk: three UPDATEs detach study sessions and metric entries, the
+        tasks' evidence and tag rows are removed (the ORM cascade does this for
+        single deletes), then one DELETE removes the tasks. Does not commit.
+        """
+        from app.models.study import StudySession
+        from app.models.metric import MetricEntry
+
+        ids = list(dict.fromkeys(task_ids))
+        size = chunk_size or TaskService.DELETE_CHUNK_SIZE
+        deleted = 0
+        for start in range(0, len(ids), size):
+            chunk = ids[start:start + size]
+            db.query(StudySession).filter(StudySession.task_id.in_(chunk)).update(
                 {"task_id": None}, synchronize_session=False
             )
-            db.query(StudySession).filter(StudySession.quick_start_task_id == task.id).update(
+            db.query(StudySession).filter(StudySession.quick_start_task_id.in_(chunk)).update(
                 {"quick_start_task_id": None}, synchronize_session=False
             )
-            db.query(MetricEntry).filter(MetricEntry.task_id == task.id).update(
+            db.query(MetricEntry).filter(MetricEntry.task_id.in_(chunk)).update(
                 {"task_id": None}, synchronize_session=False
             )
-            db.delete(task)
-            
+            evidence_ids = db.query(TaskEvidence.id).filter(TaskEvidence.task_id.in_(chunk))
+            db.query(MetricEntry).filter(MetricEntry.evidence_id.in_(evidence_ids.scalar_subquery())).update(
+                {"evidence_id": None}, synchronize_session=False
+            )
+            db.query(TaskEvidence).filter(TaskEvidence.task_id.in_(chunk)).delete(synchronize_session=False)
+            db.query(TaskTag).filter(TaskTag.task_id.in_(chunk)).delete(synchronize_session=False)
+            deleted += db.query(Task).filter(Task.id.in_(chunk)).delete(synchronize_session="fetch")
+        return deleted
+
+    @staticmethod
+    def run_daily_recurring_cleanup(db: Session, now: Optional[datetime] = None) -> int:
+        """
+        Run stale recurring-instance cleanup for users not yet cleaned today.
+
+        Each user's ``last_recurring_cleanup_date`` watermark (local date in
+        ``settings.timezone``) limits the cleanup to once per user per day, so
+        repeated calls from the scheduler are a single cheap query.
+        """
+        local_now = now or datetime.now(ZoneInfo(settings.timezone)).replace(tzinfo=None)
+        today = local_now.date()
+        due_filter = or_(
+            User.last_recurring_cleanup_date.is_(None),
+            User.last_recurring_cleanup_date < today,
+        )
+        due_user_ids = [row[0] for row in db.query(User.id).filter(due_filter).all()]
+        if not due_user_ids:
+            return 0
+
+        deleted = 0
+        for user_id in due_user_ids:
+            deleted += TaskService.cleanup_stale_recurring_instances(db, user_id=user_id, now=local_now)
+        db.query(User).filter(User.id.in_(due_user_ids), due_filter).update(
+            {"last_recurring_cleanup_date": today}, synchronize_session=False
+        )
         db.commit()
-        logger.info("Deleted %s stale unfinished recurring-generated task(s)", len(stale_tasks))
-        return len(stale_tasks)
+        return deleted
 
     @staticmethod
     def _task_tags(task: Task) -> list[str]:
@@ -232,6 +358,34 @@ class TaskService:
                 return []
         return []
 
+    @staticmethod
+    def _normalize_tag(tag) -> str:
+        return str(tag).strip().lstrip("#").strip()
+
+    @staticmethod
+    def _set_task_tags(task: Task, tags: Optional[list]) -> None:
+        """Write Task.tags (JSON) and keep the task_tags rows in sync."""
+        tags = list(tags or [])
+        task.tags = json.dumps(tags, ensure_ascii=False) if tags else "[]"
+
+        wanted = {TaskService._normalize_tag(t) for t in tags} - {""}
+        for row in list(task.tag_rows):
+            if row.tag not in wanted:
+                task.tag_rows.remove(row)
+        existing = {row.tag for row in task.tag_rows}
+        for tag in sorted(wanted - existing):
+            task.tag_rows.append(TaskTag(tag=tag, user_id=task.user_id))
+
+    @staticmethod
+    def get_tag_counts(db: Session, user: User, filter_type: Optional[str] = None) -> List[dict]:
+        """Per-tag task counts for the user, computed with one GROUP BY."""
+        query = db.query(TaskTag.tag, func.count(TaskTag.task_id)).filter(TaskTag.user_id == user.id)
+        if filter_type in {"active", "completed"}:
+            statuses = ["OPEN", "EVIDENCE_SUBMITTED", "OVERDUE"] if filter_type == "active" else ["DONE", "EXCUSED"]
+            query = query.join(Task, Task.id == TaskTag.task_id).filter(Task.status.in_(statuses))
+        rows = query.group_by(TaskTag.tag).order_by(func.count(TaskTag.task_id).desc(), TaskTag.tag.asc()).all()
+        return [{"tag": tag, "count": count} for tag, count in rows]
+
     @staticmethod
     def _task_has_metric_hint(task: Task, metric_type: str) -> bool:
         tags = [t.lower() for t in TaskService._task_tags(task)]
@@ -338,21 +492,51 @@ class TaskService:
                 projected_prev = milestone.target_date
         return base
     
+    @staticmethod
+    def _user_project(
+        db: Session,
+        user: User,
+        project_id: Optional[str],
+        gate: Optional[MilestoneGateResolver] = None,
+    ) -> Optional[Project]:
+        if not project_id:
+            return None
+        if gate is not None:
+            project = gate.load_projects([project_id]).project(project_id)
+            return project if project and project.user_id == user.id else None
+        return db.query(Project).filter(
+            Project.id == project_id,
+            Project.user_id == user.id
+        ).first()
+
     @staticmethod
     def create_task(db: Session, user: User, task_data: TaskCreate) -> Task:
         """Create a new task."""
+        task = TaskService._build_task(db, user, task_data)
+        db.commit()
+        db.refresh(task)
+        deadline_wheel.track(task)
+        logger.info(f"Created task {task.id} for user {user.id}")
+        return task
+
+    @staticmethod
+    def _build_task(
+        db: Session,
+        user: User,
+        task_data: TaskCreate,
+        gate: Optional[MilestoneGateResolver] = None,
+        milestones: Optional[dict[str, Optional[Milestone]]] = None,
+    ) -> Task:
+        """Validate and add a new task to the session without committing."""
         milestone = TaskService._validate_task_project_milestone(
-            db, user, project_id=task_data.project_id, milestone_id=task_data.milestone_id
+            db, user, project_id=task_data.project_id, milestone_id=task_data.milestone_id, milestones=milestones
         )
         project_id = task_data.project_id or (milestone.project_id if milestone else None)
 
         project = None
         proposal_offset_days = None
         if project_id and task_data.deadline:
-            project = db.query(Project).filter(
-                Project.id == project_id,
-                Project.user_id == user.id
-            ).first()
+            project = TaskService._user_project(db, user, project_id, gate)
             if project and project.status == "PROPOSED":
                 if milestone:
                     anchor = TaskService._proposal_anchor_for_task(
@@ -371,10 +555,7 @@ class TaskService:
         )
         if project_id and proposal_offset_days is None:
             if project is None:
-                project = db.query(Project).filter(
-                    Project.id == project_id,
-                    Project.user_id == user.id
-                ).first()
+                project = TaskService._user_project(db, user, project_id, gate)
             if project and project.status == "PROPOSED":
                 if milestone:
                     anchor = TaskService._proposal_anchor_for_task(
@@ -401,25 +582,43 @@ class TaskService:
             scheduled_time=normalized_start,
             scheduled_date=normalized_start,
             duration=task_data.duration if (task_data.duration and task_data.duration > 0) else int((normalized_deadline - normalized_start).total_seconds() // 60),
-            is_time_blocked=True,
+            is_time_blocked=task_data.scheduled_time is not None,
             status="OPEN",
-            tags=json.dumps(task_data.tags, ensure_ascii=False) if task_data.tags else "[]"
         )
+        TaskService._set_task_tags(task, task_data.tags)
         db.add(task)
-        db.commit()
-        db.refresh(task)
-        logger.info(f"Created task {task.id} for user {user.id}")
         return task
     
+    LIST_MAX_LIMIT = 500
+    BOARD_LANES = {"IN_PROGRESS", "TODO"}
+
     @staticmethod
-    def get_tasks(
+    def encode_list_cursor(task_created_at: datetime, task_id: str) -> str:
+        payload = json.dumps([task_created_at.isoformat(), task_id]).encode("utf-8")
+        return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def decode_list_cursor(cursor: str) -> Tuple[datetime, str]:
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            created_at, task_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            return datetime.fromisoformat(created_at), str(task_id)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    @staticmethod
+    def _task_list_query(
         db: Session,
         user: User,
         filter_type: Optional[str] = None,
-        project_id: Optional[str] = None
-    ) -> List[Task]:
-        """Get user's tasks with optional filtering."""
-        TaskService.cleanup_stale_recurring_instances(db, user.id)
+        project_id: Optional[str] = None,
+        *,
+        cursor: Optional[str] = None,
+        tag: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        lane: Optional[str] = None,
+    ):
         query = db.query(Task).filter(Task.user_id == user.id)
         
         if project_id:
@@ -436,20 +635,86 @@ class TaskService:
         elif filter_type == "completed":
             # Completed: DONE, EXCUSED
             query = query.filter(Task.status.in_(["DONE", "EXCUSED"]))
-        
-        tasks = query.order_by(Task.created_at.desc()).all()
 
-        mutated = False
+        if tag:
+            tagged_ids = db.query(TaskTag.task_id).filter(
+                TaskTag.user_id == user.id,
+                TaskTag.tag == TaskService._normalize_tag(tag),
+            )
+            query = query.filter(Task.id.in_(tagged_ids.scalar_subquery()))
+        # Date range: tasks whose [scheduled_time, deadline] window overlaps [date_from, date_to].
+        if date_from:
+            query = query.filter(Task.deadline >= date_from)
+        if date_to:
+            query = query.filter(Task.scheduled_time <= date_to)
+        if lane:
+            if lane == "AUTO":
+                query = query.filter(Task.board_lane.is_(None))
+            elif lane in TaskService.BOARD_LANES:
+                query = query.filter(Task.board_lane == lane)
+            else:
+                raise HTTPException(status_code=400, detail="lane must be IN_PROGRESS, TODO or AUTO")
+
+        if cursor:
+            cursor_created_at, cursor_id = TaskService.decode_list_cursor(cursor)
+            query = query.filter(or_(
+                Task.created_at < cursor_created_at,
+                and_(Task.created_at == cursor_created_at, Task.id < cursor_id),
+            ))
+
+        return query.order_by(Task.created_at.desc(), Task.id.desc())
+
+    @staticmethod
+    def _next_list_cursor(rows: list, limit: Optional[int]) -> Tuple[list, Optional[str]]:
+        """Trim the look-ahead row fetched for pagination and build the next cursor."""
+        if not limit or len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, TaskService.encode_list_cursor(last.created_at, last.id)
+
+    @staticmethod
+    def get_tasks(
+        db: Session,
+        user: User,
+        filter_type: Optional[str] = None,
+        project_id: Optional[str] = None
+    ) -> List[Task]:
+        """Get user's tasks with optional filtering."""
+        return TaskService.get_tasks_page(db, user, filter_type, project_id)[0]
+
+    @staticmethod
+    def get_tasks_page(
+        db: Session,
+        user: User,
+        filter_type: Optional[str] = None,
+        project_id: Optional[str] = None,
+        *,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        tag: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        lane: Optional[str] = None,
+    ) -> Tuple[List[Task], Optional[str]]:
+        """
+        Get one page of the user's tasks, newest first.
+
+        Keyset-paginated on (created_at, id); returns the page and the cursor
+        for the next one (None on the last page or when no limit is given).
+        """
+        query = TaskService._task_list_query(
+            db, user, filter_type, project_id,
+            cursor=cursor, tag=tag, date_from=date_from, date_to=date_to, lane=lane,
+        )
+        if limit:
+            query = query.limit(min(limit, TaskService.LIST_MAX_LIMIT) + 1)
+        tasks, next_cursor = TaskService._next_list_cursor(query.all(), limit and min(limit, TaskService.LIST_MAX_LIMIT))
+
+        # Read-only: lock state and missing windows are shown, never written here.
+        gate = MilestoneGateResolver(db).load(tasks)
         for task in tasks:
-            if TaskService._sync_task_locked_state(db, task):
-                mutated = True
-            if task.status in TaskService.TERMINAL_STATUSES:
-                continue
-            if task.deadline is None or task.scheduled_time is None:
-                TaskService._apply_task_window(task, task.scheduled_time, task.deadline)
-                mutated = True
-        if mutated:
-            db.commit()
+            TaskService._apply_display_state(gate, task)
 
         if project_id:
             project = db.query(Project).filter(
@@ -459,10 +724,96 @@ class TaskService:
             if project and project.status == "PROPOSED":
                 TaskService._apply_proposed_project_task_chain(db, tasks, project, date.today())
 
-        return tasks
-    
+        return tasks, next_cursor
+
+    DISPLAY_WINDOW_FIELDS = ("scheduled_time", "scheduled_date", "deadline", "is_time_blocked", "duration")
+
+    @staticmethod
+    def _apply_display_state(gate: MilestoneGateResolver, task: Task) -> None:
+        """
+        Show a task's effective lock status and time window without marking it dirty.
+
+        Values are set with ``set_committed_value``, so a later flush on the
+        same session does not persist them; the write paths and the window
+        backfill own those writes.
+        """
+        proxy = SimpleNamespace(status=task.status, project_id=task.project_id, milestone_id=task.milestone_id)
+        if gate.sync_locked_state(proxy):
+            set_committed_value(task, "status", proxy.status)
+        if task.status in TaskService.TERMINAL_STATUSES:
+            return
+        if task.deadline is None or task.scheduled_time is None:
+            window = SimpleNamespace()
+            TaskService._apply_task_window(window, task.scheduled_time, task.deadline)
+            for field in TaskService.DISPLAY_WINDOW_FIELDS:
+                set_committed_value(task, field, getattr(window, field))
+
+    @staticmethod
+    def get_task_fields_page(
+        db: Session,
+        user: User,
+        fields: List[str],
+        filter_type: Optional[str] = None,
+        project_id: Optional[str] = None,
+        **page_kwargs,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Sparse variant of get_tasks_page: SELECT only the requested columns.
+
+        Lock state is computed for display without writing. PROPOSED project
+        views need the projected deadline chain, so they load full rows.
+        """
+        limit = page_kwargs.pop("limit", None)
+        if limit:
+            limit = min(limit, TaskService.LIST_MAX_LIMIT)
+
+        if project_id:
+            project = db.query(Project).filter(
+                Project.id == project_id,
+                Project.user_id == user.id
+            ).first()
+            if project and project.status == "PROPOSED":
+                tasks, next_cursor = TaskService.get_tasks_page(
+                    db, user, filter_type, project_id, limit=limit, **page_kwargs
+                )
+                rows = [
+                    {field: getattr(task, field) for field in fields}
+                    for task in tasks
+                ]
+                return TaskService._with_parsed_tags(rows), next_cursor
+
+        gate_columns = {"status", "project_id", "milestone_id"} if "status" in fields else set()
+        columns = list(dict.fromkeys(["id", "created_at", *fields, *gate_columns]))
+        query = TaskService._task_list_query(db, user, filter_type, project_id, **page_kwargs)
+        query = query.with_entities(*(getattr(Task, c) for c in columns))
+        if limit:
+            query = query.limit(limit + 1)
+        rows, next_cursor = TaskService._next_list_cursor(query.all(), limit)
+
+        if gate_columns:
+            gate = MilestoneGateResolver(db).load(rows)
+            for index, row in enumerate(rows):
+                proxy = SimpleNamespace(**row._asdict())
+                gate.sync_locked_state(proxy)
+                rows[index] = proxy
+        result = [{field: getattr(row, field) for field in fields} for row in rows]
+        return TaskService._with_parsed_tags(result), next_cursor
+
+    @staticmethod
+    def _with_parsed_tags(rows: List[dict]) -> List[dict]:
+        for row in rows:
+            if "tags" in row:
+                row["tags"] = TaskService._task_tags(SimpleNamespace(tags=row["tags"]))
+        return rows
+
     @staticmethod
-    def get_task(db: Session, task_id: str, user: User) -> Task:
+    def get_task(
+        db: Session,
+        task_id: str,
+        user: User,
+        gate: Optional[MilestoneGateResolver] = None,
+        commit: bool = True,
+    ) -> Task:
         """Get a specific task."""
         task = db.query(Task).filter(
             Task.id == task_id,
@@ -473,11 +824,11 @@ class TaskService:
             raise HTTPException(status_code=404, detail="Task not found")
 
         if task.project_id:
-            project = db.query(Project).filter(
-                Project.id == task.project_id,
-                Project.user_id == user.id
-            ).first()
-            if TaskService._sync_task_locked_state(db, task):
+            gate = (gate or MilestoneGateResolver(db)).load([task])
+            project = gate.project(task.project_id)
+            if project and project.user_id != user.id:
+                project = None
+            if gate.sync_locked_state(task) and commit:
                 db.commit()
                 db.refresh(task)
             if project and project.status == "PROPOSED":
@@ -491,8 +842,18 @@ class TaskService:
         
         Enforces: Task can only be completed this way if it doesn't require evidence.
         """
-        task = TaskService.get_task(db, task_id, user)
+        gate = MilestoneGateResolver(db)
+        task = TaskService.get_task(db, task_id, user, gate)
+        TaskService._apply_complete(db, task, gate)
+        db.commit()
+        db.refresh(task)
         
+        logger.info(f"Task {task_id} completed")
+        return task
+
+    @staticmethod
+    def _apply_complete(db: Session, task: Task, gate: MilestoneGateResolver) -> None:
+        """Validate and mark a task DONE without committing."""
         # Only allow direct completion for tasks without evidence requirement
         if task.evidence_type and task.evidence_type != "none":
             raise HTTPException(
@@ -506,35 +867,50 @@ class TaskService:
                 detail=f"任务当前状态 {task.status} 不允许完成"
             )
         
-        if task.status == "LOCKED" or not TaskService._is_task_milestone_unlocked(db, task):
+        if task.status == "LOCKED" or not gate.load([task]).is_unlocked(task):
             raise HTTPException(status_code=400, detail="Task is locked until the previous milestone is completed")
 
         task.status = "DONE"
         task.completed_at = datetime.utcnow()
         TaskService._sync_project_milestone_status_from_task(db, task)
-        db.commit()
-        db.refresh(task)
-        
-        logger.info(f"Task {task_id} completed")
-        return task
+        gate.invalidate(task.project_id)
 
     @staticmethod
-    def update_task(db: Session, task_id: str, user: User, updates: dict) -> Task:
-        """Update task details (for PROPOSED project tasks)."""
+    def update_task(
+        db: Session, task_id: str, user: User, updates: dict, strict: bool = False
+    ) -> Tuple[Task, List[BusyInterval]]:
+        """Update task details (for PROPOSED project tasks); returns the task and its schedule overlaps."""
         task = TaskService.get_task(db, task_id, user)
+        TaskService._apply_updates(db, task, user, updates)
+        conflicts = []
+        if TaskService.WINDOW_FIELDS.intersection(updates):
+            conflicts = TaskService._check_conflicts(db, task, occupancy.get(db, user.id, cached=False), strict)
+        db.commit()
+        db.refresh(task)
+        deadline_wheel.track(task)
+        logger.info(f"Updated task {task_id}")
+        return task, conflicts
 
+    @staticmethod
+    def _apply_updates(
+        db: Session,
+        task: Task,
+        user: User,
+        updates: dict,
+        gate: Optional[MilestoneGateResolver] = None,
+        milestones: Optional[dict[str, Optional[Milestone]]] = None,
+    ) -> None:
+        """Validate and apply field updates to a task without committing."""
         project = None
         if task.project_id:
-            project = db.query(Project).filter(
-                Project.id == task.project_id,
-                Project.user_id == user.id
-            ).first()
+            project = TaskService._user_project(db, user, task.project_id, gate)
             if project and project.status != "PROPOSED":
                 restricted_fields = {"title", "description", "evidence_type", "evidence_criteria", "tags", "milestone_id"}
                 if any(field in updates for field in restricted_fields):
                     raise HTTPException(status_code=400, detail="Active project tasks only allow scheduling changes")
 
-        pending_start = task.scheduled_time
+        # A derived start follows the deadline; a chosen one stays put.
+        pending_start = task.scheduled_time if task.is_time_blocked else None
         pending_deadline = task.deadline
 
         if "title" in updates and updates["title"] is not None:
@@ -553,7 +929,7 @@ class TaskService:
                 anchor = TaskService._proposal_anchor_for_task(db, task, project, date.today())
                 task.proposal_offset_days = max((updates["deadline"].date() - anchor).days, 0)
         if "tags" in updates and updates["tags"] is not None:
-            task.tags = json.dumps(updates["tags"], ensure_ascii=False)
+            TaskService._set_task_tags(task, updates["tags"])
         if "scheduled_time" in updates:
             pending_start = updates["scheduled_time"]
         if "duration" in updates and updates["duration"] is not None:
@@ -567,7 +943,7 @@ class TaskService:
                 task.milestone_id = None
             else:
                 milestone = TaskService._validate_task_project_milestone(
-                    db, user, project_id=task.project_id, milestone_id=milestone_id
+                    db, user, project_id=task.project_id, milestone_id=milestone_id, milestones=milestones
                 )
                 task.milestone_id = milestone.id if milestone else None
             if project and project.status == "PROPOSED" and task.deadline:
@@ -576,12 +952,214 @@ class TaskService:
 
         if "deadline" in updates or "scheduled_time" in updates:
             TaskService._apply_task_window(task, pending_start, pending_deadline)
+    
+    @staticmethod
+    def schedule_task(
+        db: Session, task_id: str, user: User, request: ScheduleTaskRequest, strict: bool = False
+    ) -> Tuple[Task, List[BusyInterval]]:
+        """Place a task on a time block; returns the task and the blocks it overlaps."""
+        task = db.query(Task).filter(
+            Task.id == task_id,
+            Task.user_id == user.id
+        ).first()
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        TaskService._apply_schedule(db, task, user, request)
+        conflicts = TaskService._check_conflicts(db, task, occupancy.get(db, user.id, cached=False), strict)
+        db.commit()
+        logger.info(f"Task {task_id} scheduled to {task.scheduled_time}")
+        return task, conflicts
+
+    WINDOW_FIELDS = frozenset({"scheduled_time", "deadline", "duration"})
+
+    @staticmethod
+    def _check_conflicts(db: Session, task: Task, index: UserOccupancy, strict: bool = False) -> List[BusyInterval]:
+        """
+        Find what the task's time block overlaps and record the new block in ``index``.
+
+        Fixed blocks, habit/long-task windows and other tasks count; in strict
+        mode any overlap is a 409. ``index`` must be private to this write
+        (``occupancy.get(..., cached=False)``).
+        """
+        if task.scheduled_time is None:
+            index.place_task(task.id, task.title, None, None)
+            return []
+        end_at = task.scheduled_time + timedelta(minutes=task.duration or 60)
+        index.ensure_days(db, task.scheduled_time.date(), max(end_at - timedelta(microseconds=1), task.scheduled_time).date())
+        conflicts = [
+            BusyInterval(
+                start=item.start_at,
+                end=item.end_at,
+                source_type=item.source_type,
+                source_id=item.source_id,
+                title=item.title,
+            )
+            for item in index.conflicts(task.scheduled_time, end_at, exclude_task_id=task.id)
+        ]
+        if conflicts and strict:
+            raise HTTPException(status_code=409, detail={
+                "message": "Time block overlaps the existing schedule",
+                "conflicts": [conflict.model_dump(mode="json") for conflict in conflicts],
+            })
+        index.place_task(task.id, task.title, task.scheduled_time, task.duration)
+        return conflicts
+
+    @staticmethod
+    def _apply_schedule(
+        db: Session,
+        task: Task,
+        user: User,
+        request: ScheduleTaskRequest,
+        gate: Optional[MilestoneGateResolver] = None,
+    ) -> None:
+        if task.project_id:
+            project = TaskService._user_project(db, user, task.project_id, gate)
+            if project and project.status == "PROPOSED":
+                raise HTTPException(status_code=400, detail="提案中的项目任务暂不能安排时间")
+
+        scheduled_datetime = datetime.combine(request.scheduled_date, request.scheduled_time)
+        task.scheduled_date = scheduled_datetime
+        task.scheduled_time = scheduled_datetime
+        task.duration = request.duration
+        task.is_time_blocked = True
+
+    _BATCH_PAYLOADS = {"create": TaskCreate, "update": TaskUpdate, "schedule": ScheduleTaskRequest}
+
+    @staticmethod
+    def _batch_error(index: int, op: str, status_code: int, detail, task_id: Optional[str] = None) -> dict:
+        return {"index": index, "op": op, "ok": False, "status_code": status_code, "task_id": task_id, "error": detail}
+
+    @staticmethod
+    def _begin_outer_transaction(db: Session) -> None:
+        # pysqlite only emits BEGIN before DML, so a leading SAVEPOINT would open
+        # its own transaction and its RELEASE would commit it.
+        if settings.database_url.startswith("sqlite"):
+            connection = db.connection()
+            if not connection.connection.dbapi_connection.in_transaction:
+                connection.exec_driver_sql("BEGIN")
+
+    @staticmethod
+    def apply_batch(
+        db: Session, user: User, operations: list, atomic: bool = False, strict: bool = False
+    ) -> Tuple[List[dict], bool]:
+        """
+        Apply many create/update/schedule/complete operations in one transaction.
+
+        Referenced tasks, projects and milestones are loaded up front in a few
+        queries. Each operation runs inside a SAVEPOINT, so a failing one is
+        reported in its result without undoing the others; with ``atomic`` the
+        first failure rolls back the whole batch instead. Operations that move
+        a time block are checked for overlaps against one occupancy index kept
+        up to date across the batch; ``strict`` turns an overlap into a 409.
+        Returns the per-item results and whether anything was committed.
+        """
+        results: List[Optional[dict]] = [None] * len(operations)
+        payloads: dict[int, object] = {}
+        for index, operation in enumerate(operations):
+            schema = TaskService._BATCH_PAYLOADS.get(operation.op)
+            if operation.op != "create" and not operation.task_id:
+                results[index] = TaskService._batch_error(index, operation.op, 422, "task_id is required")
+            elif schema is not None:
+                try:
+                    payloads[index] = schema.model_validate(operation.data or {})
+                except ValidationError as e:
+                    errors = [{"loc": list(err["loc"]), "msg": err["msg"]} for err in e.errors()]
+                    results[index] = TaskService._batch_error(index, operation.op, 422, errors, operation.task_id)
+
+        # Bulk-load everything the operations reference.
+        task_ids = {op.task_id for op in operations if op.task_id}
+        tasks_by_id = {
+            task.id: task
+            for task in db.query(Task).filter(Task.id.in_(task_ids), Task.user_id == user.id).all()
+        } if task_ids else {}
+        gate = MilestoneGateResolver(db).load(list(tasks_by_id.values()))
+        gate.load_projects(p.project_id for p in payloads.values() if isinstance(p, TaskCreate))
+
+        milestone_ids = {getattr(p, "milestone_id", None) for p in payloads.values()} - {None}
+        milestones: dict[str, Optional[Milestone]] = dict.fromkeys(milestone_ids)
+        if milestone_ids:
+            for milestone in db.query(Milestone).join(Project, Milestone.project_id == Project.id).filter(
+                Milestone.id.in_(milestone_ids), Project.user_id == user.id
+            ).all():
+                milestones[milestone.id] = milestone
+        gate.load_projects(m.project_id for m in milestones.values() if m)
+
+        changed: dict[str, Task] = {}
+        failed = False
+        TaskService._begin_outer_transaction(db)
+        busy_index = occupancy.get(db, user.id, cached=False)
+        for index, operation in enumerate(operations):
+            if results[index] is not None:
+                failed = True
+                if atomic:
+                    break
+                continue
+
+            try:
+                with db.begin_nested():
+                    if operation.op == "create":
+                        task = TaskService._build_task(db, user, payloads[index], gate, milestones)
+                    else:
+                        task = tasks_by_id.get(operation.task_id)
+                        if task is None:
+                            raise HTTPException(status_code=404, detail="Task not found")
+                        gate.load([task])
+                        gate.sync_locked_state(task)
+                        if operation.op == "update":
+                            TaskService._apply_updates(
+                                db, task, user, payloads[index].model_dump(exclude_unset=True), gate, milestones
+                            )
+                        elif operation.op == "schedule":
+                            TaskService._apply_schedule(db, task, user, payloads[index], gate)
+                        else:
+                            TaskService._apply_complete(db, task, gate)
+                    db.flush()
+                    conflicts = []
+                    if operation.op in ("create", "schedule") or (
+                        operation.op == "update" and TaskService.WINDOW_FIELDS.intersection(operation.data or {})
+                    ):
+                        conflicts = TaskService._check_conflicts(db, task, busy_index, strict)
+            except HTTPException as e:
+                results[index] = TaskService._batch_error(index, operation.op, e.status_code, e.detail, operation.task_id)
+                failed = True
+                if atomic:
+                    break
+                continue
+
+            changed[task.id] = task
+            results[index] = {
+                "index": index,
+                "op": operation.op,
+                "ok": True,
+                "status_code": 201 if operation.op == "create" else 200,
+                "task_id": task.id,
+                "conflicts": conflicts,
+            }
+
+        if atomic and failed:
+            db.rollback()
+            for index, operation in enumerate(operations):
+                if results[index] is None or results[index]["ok"]:
+                    results[index] = TaskService._batch_error(
+                        index, operation.op, 424, "Not applied: batch rolled back", operation.task_id
+                    )
+            return results, False
 
         db.commit()
-        db.refresh(task)
-        logger.info(f"Updated task {task_id}")
-        return task
-    
+        if changed:
+            # Reload every touched row in one query instead of one refresh per task.
+            db.query(Task).filter(Task.id.in_(list(changed))).all()
+        for result in results:
+            if result["ok"]:
+                task = changed[result["task_id"]]
+                result["task"] = task
+                deadline_wheel.track(task)
+        logger.info(
+            "Applied task batch for user %s: %s ok, %s failed",
+            user.id, len(changed), sum(1 for r in results if not r["ok"]),
+        )
+        return results, True
+
     @staticmethod
     async def submit_evidence(
         db: Session,
@@ -591,11 +1169,18 @@ class TaskService:
         image_file: Optional[UploadFile] = None
     ) -> TaskEvidence:
         """
-        Submit evidence for a task and trigger AI judgment.
-        
+        Submit evidence for a task and queue it for AI judgment.
+
         This enforces the rule that tasks must go through evidence verification.
+        The evidence is stored as ``pending`` and the task moves to
+        EVIDENCE_SUBMITTED; a background worker judges it and applies the
+        DONE/OPEN transition (poll ``GET /tasks/{id}/evidence/{eid}``). When the
+        judging workers are not running (scripts), the evidence is judged inline.
         """
-        task = TaskService.get_task(db, task_id, user)
+        from app.services.evidence_queue import evidence_queue
+
+        gate = MilestoneGateResolver(db)
+        task = TaskService.get_task(db, task_id, user, gate)
         
         if task.status not in ["OPEN", "OVERDUE", "EVIDENCE_SUBMITTED"]:
             raise HTTPException(
@@ -603,115 +1188,106 @@ class TaskService:
                 detail=f"任务当前状态 {task.status} 不允许提交证据"
             )
         
-        if task.status == "LOCKED" or not TaskService._is_task_milestone_unlocked(db, task):
+        if task.status == "LOCKED" or not gate.load([task]).is_unlocked(task):
             raise HTTPException(status_code=400, detail="Task is locked until the previous milestone is completed")
 
+        # Back-pressure: refuse before anything is written
+        evidence_queue.check_capacity()
+
         # Handle image upload if provided
         image_path = None
         if image_file and evidence_data.evidence_type == "image":
-            import os
-            import uuid
-            
-            # Save image
-            upload_dir = "uploads"
-            os.makedirs(upload_dir, exist_ok=True)
-            file_extension = image_file.filename.split(".")[-1]
-            image_filename = f"{uuid.uuid4()}.{file_extension}"
-            image_path = os.path.join(upload_dir, image_filename)
-            
-            with open(image_path, "wb") as f:
-                content = await image_file.read()
-                f.write(content)
+            image_path = (await save_image_upload(image_file)).path
         
         # Create evidence record
         evidence = TaskEvidence(
             task_id=task.id,
             evidence_type=evidence_data.evidence_type,
             content=evidence_data.content,
-            image_path=image_path
+            image_path=image_path,
+            ai_result="pending",
         )
         db.add(evidence)
-        db.flush()
         
         # Update task status to EVIDENCE_SUBMITTED
         task.status = "EVIDENCE_SUBMITTED"
+        db.commit()
+        db.refresh(evidence)
+
+        if not evidence_queue.enqueue(evidence.id):
+            evidence.judge_attempts = 1
+            try:
+                await TaskService.judge_evidence(db, evidence)
+            except Exception as e:
+                db.rollback()
+                TaskService.record_judgment_error(db, evidence, e)
+            db.commit()
+            db.refresh(evidence)
         
-        # Call AI service to judge evidence
-        try:
-            ai_result = await ai_service.judge_evidence(
-                task_title=task.title,
-                evidence_type=evidence_data.evidence_type,
-                evidence_criteria=task.evidence_criteria or "",
-                evidence_content=evidence_data.content,
-                image_path=image_path
-            )
-            
-            evidence.ai_result = ai_result["result"]
-            evidence.ai_reason = ai_result["reason"]
-            evidence.extracted_values = json.dumps(ai_result.get("extracted_values", {}))
-            
-            # Update task status based on AI result
-            if ai_result["result"] == "pass":
-                task.status = "DONE"
-                task.completed_at = datetime.utcnow()
-                TaskService._sync_project_milestone_status_from_task(db, task)
-                logger.info(f"Task {task_id} evidence passed, marked as DONE")
-            else:
-                task.status = "OPEN"  # Return to OPEN if failed
-                logger.info(f"Task {task_id} evidence failed, returned to OPEN")
-
-            # ---------------------------------------------------------
-            # Auto-create metrics from AI result / task semantics
-            # ---------------------------------------------------------
-            if ai_result["result"] == "pass":
-                values = ai_result.get("extracted_values") or {}
-                created_weight_metric = False
-                created_bodyfat_metric = False
-
-                # 1) Structured extraction from AI judgment
-                if isinstance(values, dict):
-                    if "weight" in values or "kg" in values:
-                        try:
-                            val = float(values.get("weight") or values.get("kg"))
-                            TaskService._upsert_task_metric(
-                                db,
-                                user_id=user.id,
-                                task_id=task.id,
-                                evidence_id=evidence.id,
-                                metric_type="weight",
-                                value=val,
-                                unit="kg",
-                                notes=f"Auto-extracted from task: {task.title}",
-                            )
-                            created_weight_metric = True
-                        except (TypeError, ValueError):
-                            pass
-
-                    if "bodyfat" in values or "body_fat" in values:
-                        try:
-                            val = float(values.get("bodyfat") or values.get("body_fat"))
-                            TaskService._upsert_task_metric(
-                                db,
-                                user_id=user.id,
-                                task_id=task.id,
-                                evidence_id=evidence.id,
-                                metric_type="bodyfat",
-                                value=val,
-                                unit="%",
-                                notes=f"Auto-extracted from task: {task.title}",
-                            )
-                            created_bodyfat_metric = True
-                        except (TypeError, ValueError):
-                            pass
-
-                # 2) Fallback for weight tasks (manual/system text/number entry)
-                if (
-                    not created_weight_metric
-                    and evidence.content
-                    and TaskService._task_has_metric_hint(task, "weight")
-                ):
+        return evidence
+
+    @staticmethod
+    def get_evidence(db: Session, task_id: str, evidence_id: str, user: User) -> TaskEvidence:
+        evidence = db.query(TaskEvidence).join(Task, Task.id == TaskEvidence.task_id).filter(
+            TaskEvidence.id == evidence_id,
+            TaskEvidence.task_id == task_id,
+            Task.user_id == user.id,
+        ).first()
+        if not evidence:
+            raise HTTPException(status_code=404, detail="Evidence not found")
+        return evidence
+
+    @staticmethod
+    async def judge_evidence(db: Session, evidence: TaskEvidence) -> None:
+        """
+        Judge a pending evidence and apply the result to its task (caller commits).
+
+        Provider errors propagate so the caller can retry. The task only moves
+        to DONE/OPEN if it is still EVIDENCE_SUBMITTED, so a late judgment does
+        not undo a later manual change.
+        """
+        task = evidence.task
+        user = task.user
+        ai_result = await ai_service.judge_evidence(
+            task_title=task.title,
+            evidence_type=evidence.evidence_type,
+            evidence_criteria=task.evidence_criteria or "",
+            evidence_content=evidence.content,
+            image_path=evidence.image_path,
+            raise_errors=True,
+        )
+
+        evidence.ai_result = ai_result["result"]
+        evidence.ai_reason = ai_result["reason"]
+        evidence.extracted_values = json.dumps(ai_result.get("extracted_values", {}))
+        evidence.judged_at = datetime.utcnow()
+        if task.status != "EVIDENCE_SUBMITTED":
+            logger.info(f"Task {task.id} left EVIDENCE_SUBMITTED before judgment; status kept")
+            return
+
+        # Update task status based on AI result
+        if ai_result["result"] == "pass":
+            task.status = "DONE"
+            task.completed_at = datetime.utcnow()
+            TaskService._sync_project_milestone_status_from_task(db, task)
+            logger.info(f"Task {task.id} evidence passed, marked as DONE")
+        else:
+            task.status = "OPEN"  # Return to OPEN if failed
+            logger.info(f"Task {task.id} evidence failed, returned to OPEN")
+
+        # ---------------------------------------------------------
+        # Auto-create metrics from AI result / task semantics
+        # ---------------------------------------------------------
+        if ai_result["result"] == "pass":
+            values = ai_result.get("extracted_values") or {}
+            created_weight_metric = False
+            created_bodyfat_metric = False
+
+            # 1) Structured extraction from AI judgment
+            if isinstance(values, dict):
+                if "weight" in values or "kg" in values:
                     try:
-                        val = float(str(evidence.content).strip())
+                        val = float(values.get("weight") or values.get("kg"))
                         TaskService._upsert_task_metric(
                             db,
                             user_id=user.id,
@@ -720,75 +1296,160 @@ class TaskService:
                             metric_type="weight",
                             value=val,
                             unit="kg",
-                            notes=f"Weight task fallback parse: {task.title}",
+                            notes=f"Auto-extracted from task: {task.title}",
                         )
                         created_weight_metric = True
                     except (TypeError, ValueError):
                         pass
 
-                # 3) Fallback for bodyfat photo tasks (system weekly + dashboard + button-created tasks)
-                if (
-                    not created_bodyfat_metric
-                    and image_path
-                    and evidence_data.evidence_type == "image"
-                    and TaskService._task_has_metric_hint(task, "bodyfat")
-                ):
+                if "bodyfat" in values or "body_fat" in values:
                     try:
-                        fat_result = await ai_service.estimate_bodyfat(image_path, user.username)
-                        estimated = fat_result.get("estimated_bodyfat")
-                        if estimated is not None:
-                            TaskService._upsert_task_metric(
-                                db,
-                                user_id=user.id,
-                                task_id=task.id,
-                                evidence_id=evidence.id,
-                                metric_type="bodyfat",
-                                value=float(estimated),
-                                unit="%",
-                                notes=f"AI Visual Estimation: {fat_result.get('analysis', '')}",
-                            )
-                            created_bodyfat_metric = True
-                            logger.info("Created bodyfat metric from bodyfat photo task: task_id=%s value=%s", task.id, estimated)
-                    except Exception as e:
-                        logger.error(f"Failed to estimate bodyfat in task submission: {e}")
-            # ---------------------------------------------------------
-        
-        except Exception as e:
-            logger.error(f"Error in AI judgment: {e}")
-            evidence.ai_result = "fail"
-            evidence.ai_reason = f"AI判定出错: {str(e)}"
-            task.status = "OPEN"
-        
-        db.commit()
-        db.refresh(evidence)
-        
-        return evidence
+                        val = float(values.get("bodyfat") or values.get("body_fat"))
+                        TaskService._upsert_task_metric(
+                            db,
+                            user_id=user.id,
+                            task_id=task.id,
+                            evidence_id=evidence.id,
+                            metric_type="bodyfat",
+                            value=val,
+                            unit="%",
+                            notes=f"Auto-extracted from task: {task.title}",
+                        )
+                        created_bodyfat_metric = True
+                    except (TypeError, ValueError):
+                        pass
+
+            # 2) Fallback for weight tasks (manual/system text/number entry)
+            if (
+                not created_weight_metric
+                and evidence.content
+                and TaskService._task_has_metric_hint(task, "weight")
+            ):
+                try:
+                    val = float(str(evidence.content).strip())
+                    TaskService._upsert_task_metric(
+                        db,
+                        user_id=user.id,
+                        task_id=task.id,
+                        evidence_id=evidence.id,
+                        metric_type="weight",
+                        value=val,
+                        unit="kg",
+                        notes=f"Weight task fallback parse: {task.title}",
+                    )
+                    created_weight_metric = True
+                except (TypeError, ValueError):
+                    pass
+
+            # 3) Fallback for bodyfat photo tasks (system weekly + dashboard + button-created tasks)
+            if (
+                not created_bodyfat_metric
+                and evidence.image_path
+                and evidence.evidence_type == "image"
+                and TaskService._task_has_metric_hint(task, "bodyfat")
+            ):
+                try:
+                    fat_result = await ai_service.estimate_bodyfat(evidence.image_path, user.username)
+                    estimated = fat_result.get("estimated_bodyfat")
+                    if estimated is not None:
+                        TaskService._upsert_task_metric(
+                            db,
+                            user_id=user.id,
+                            task_id=task.id,
+                            evidence_id=evidence.id,
+                            metric_type="bodyfat",
+                            value=float(estimated),
+                            unit="%",
+                            notes=f"AI Visual Estimation: {fat_result.get('analysis', '')}",
+                        )
+                        created_bodyfat_metric = True
+                        logger.info("Created bodyfat metric from bodyfat photo task: task_id=%s value=%s", task.id, estimated)
+                except Exception as e:
+                    logger.error(f"Failed to estimate bodyfat in task submission: {e}")
+        # ---------------------------------------------------------
+
+    @staticmethod
+    def record_judgment_error(db: Session, evidence: TaskEvidence, error: Exception) -> None:
+        """Give up on judging: fail the evidence and reopen its task (caller commits)."""
+        logger.error(f"Error in AI judgment for evidence {evidence.id}: {error}")
+        evidence.ai_result = "fail"
+        evidence.ai_reason = f"AI判定出错: {str(error)}"
+        evidence.judged_at = datetime.utcnow()
+        if evidence.task.status == "EVIDENCE_SUBMITTED":
+            evidence.task.status = "OPEN"
     
+    OVERDUE_SWEEP_CHUNK_SIZE = 5000
+
     @staticmethod
-    def update_overdue_tasks(db: Session):
+    def _overdue_candidate_filter(now: datetime):
+        """OPEN, past deadline, not in a PROPOSED project, no day pass today."""
+        from app.models.exemption import ExemptionQuota
+
+        today = now.date()
+        week_start = today - timedelta(days=today.weekday())
+        day_pass_active = exists().where(
+            ExemptionQuota.user_id == Task.user_id,
+            ExemptionQuota.week_start == week_start,
+            ExemptionQuota.day_pass_date == today,
+        )
+        project_not_proposed = exists().where(
+            Project.id == Task.project_id,
+            Project.status != "PROPOSED",
+        )
+        return and_(
+            Task.status == "OPEN",
+            Task.deadline.isnot(None),
+            Task.deadline < now,
+            or_(Task.project_id.is_(None), project_not_proposed),
+            ~day_pass_active,
+        )
+
+    @staticmethod
+    def update_overdue_tasks(db: Session, now: Optional[datetime] = None) -> dict[str, int]:
         """
         Background job to update overdue tasks.
         Called by scheduler periodically.
+
+        Set-based sweep: each chunk is one keyset SELECT of candidate ids and
+        one UPDATE over that key range, with the day-pass exemption evaluated
+        in SQL. Returns the number of tasks the UPDATEs marked OVERDUE per user.
         """
-        now = datetime.utcnow()
-        TaskService.cleanup_stale_recurring_instances(db, now=now)
-        
-        # Find tasks that are OPEN and past deadline (exclude PROPOSED project tasks)
-        overdue_tasks = db.query(Task).outerjoin(Project, Task.project_id == Project.id).filter(
-            Task.status == "OPEN",
-            Task.deadline.isnot(None),
-            Task.deadline < now,
-            or_(Task.project_id.is_(None), Project.status != "PROPOSED")
-        ).all()
-        
-        for task in overdue_tasks:
-            # Check if day pass is active for this task's user
-            from app.services.exemption_service import ExemptionService
-            if not ExemptionService.is_day_pass_active(db, task.user_id, now.date()):
-                task.status = "OVERDUE"
-        
-        db.commit()
-        logger.info(f"Updated {len(overdue_tasks)} overdue tasks")
+        started = monotonic()
+        now = now or datetime.utcnow()
+        # Catch-up in case the daily cleanup job was missed; no-op once run today.
+        TaskService.run_daily_recurring_cleanup(db)
+
+        candidate_filter = TaskService._overdue_candidate_filter(now)
+        per_user: Counter = Counter()
+        last_id = ""
+        while True:
+            rows = db.query(Task.id, Task.user_id).filter(
+                candidate_filter,
+                Task.id > last_id,
+            ).order_by(Task.id.asc()).limit(TaskService.OVERDUE_SWEEP_CHUNK_SIZE).all()
+            if not rows:
+                break
+
+            first_id, last_id = rows[0][0], rows[-1][0]
+            flipped = db.execute(
+                update(Task)
+                .where(Task.id.between(first_id, last_id), candidate_filter)
+                .values(status="OVERDUE", updated_at=now)
+                .returning(Task.user_id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+            db.commit()
+            per_user.update(flipped)
+            if len(rows) < TaskService.OVERDUE_SWEEP_CHUNK_SIZE:
+                break
+
+        logger.info(
+            "Updated %s overdue tasks for %s user(s) in %.3fs",
+            sum(per_user.values()),
+            len(per_user),
+            monotonic() - started,
+        )
+        return dict(per_user)
 
 
 class PlanTemplateService:
@@ -0,0 +1,96 @@
+"""Streaming storage of uploaded images.
+
+``save_image_upload`` copies an ``UploadFile`` to ``uploads/`` in
+``CHUNK_SIZE`` pieces, so memory per upload stays at one chunk however
+large the file. While copying it hashes the content, stops at
+``settings.upload_max_bytes`` (413), and checks the leading magic bytes
+(415 for anything that is not a supported image). The file extension comes
+from the detected type, not the client's filename. Data goes to a temp file
+in the same directory and is renamed into place only once complete, so a
+failed or aborted upload never leaves a partial file under a real name.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import uuid
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+
+from app.config import settings
+from app.services.ai_cache import remember_file_digest
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = "uploads"
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass(frozen=True)
+class StoredUpload:
+    path: str
+    size: int
+    sha256: str
+    mime_type: str
+
+
+def detect_image_type(head: bytes) -> Optional[Tuple[str, str]]:
+    """``(mime_type, extension)`` from an image's leading bytes, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg", "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png", "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", "webp"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif", "gif"
+    if head.startswith(b"BM"):
+        return "image/bmp", "bmp"
+    return None
+
+
+async def save_image_upload(upload: UploadFile, prefix: str = "") -> StoredUpload:
+    """Stream an uploaded image to ``UPLOAD_DIR`` and return where it landed."""
+    max_bytes = settings.upload_max_bytes
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"文件过大，最大 {max_bytes // (1024 * 1024)} MB")
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, prefix=".upload-", suffix=".part")
+    sha = hashlib.sha256()
+    size = 0
+    detected = None
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if detected is None:
+                    detected = detect_image_type(chunk)
+                    if detected is None:
+                        raise HTTPException(status_code=415, detail="仅支持 JPEG/PNG/WebP/GIF/BMP 图片")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"文件过大，最大 {max_bytes // (1024 * 1024)} MB")
+                sha.update(chunk)
+                out.write(chunk)
+        if detected is None:
+            raise HTTPException(status_code=400, detail="上传的文件为空")
+
+        mime_type, extension = detected
+        path = os.path.join(UPLOAD_DIR, f"{prefix}{uuid.uuid4()}.{extension}")
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    digest = sha.hexdigest()
+    remember_file_digest(path, digest)
+    logger.info(f"Stored upload {path} ({size} bytes, {mime_type})")
+    return StoredUpload(path=path, size=size, sha256=digest, mime_type=mime_type)
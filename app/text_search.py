@@ -0,0 +1,76 @@
+"""Text normalization shared by the full-text search index and its queries.
+
+Neither SQLite's ``unicode61`` tokenizer nor Postgres' ``simple`` text search
+config can segment Chinese, so text is rewritten before indexing: runs of CJK
+characters become overlapping character bigrams (``学习计划`` -> ``学习 习计
+计划``) and everything else is kept as lower-cased words. Queries go through
+the matching ``query_tokens``, so a match on every query token is a substring
+match for CJK text.
+
+Postgres has plpgsql ports of ``bigram_text`` and ``message_text`` (see
+``app.services.search_service``); on SQLite they run in Python.
+"""
+import json
+import re
+from typing import List, Tuple
+
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_CJK_RE = re.compile(rf"[{_CJK}]")
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W{_CJK}]+")
+
+
+def bigram_tokens(text) -> List[str]:
+    """Split text into index tokens: CJK character bigrams and plain words.
+
+    A CJK run also emits its last character on its own, so every character is
+    the start of some token and single-character queries can prefix-match.
+    """
+    if not text:
+        return []
+    tokens = []
+    for run in _TOKEN_RE.findall(str(text).lower()):
+        if _CJK_RE.match(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def query_tokens(text) -> List[Tuple[str, bool]]:
+    """Split a search query into ``(token, is_prefix)`` pairs.
+
+    Single CJK characters and a trailing latin word (type-ahead) are prefix
+    matches; everything else must match a whole index token.
+    """
+    runs = _TOKEN_RE.findall(str(text or "").lower())
+    tokens: List[Tuple[str, bool]] = []
+    for position, run in enumerate(runs):
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append((run, True))
+            else:
+                tokens.extend((run[i:i + 2], False) for i in range(len(run) - 1))
+        else:
+            tokens.append((run, position == len(runs) - 1 and run.isascii()))
+    return list(dict.fromkeys(tokens))
+
+
+def bigram_text(text) -> str:
+    return " ".join(bigram_tokens(text))
+
+
+def message_text(messages) -> str:
+    """Concatenate the ``content`` of a JSON-encoded conversation message list."""
+    if not messages:
+        return ""
+    try:
+        items = json.loads(messages)
+    except (TypeError, ValueError):
+        return ""
+    if not isinstance(items, list):
+        return ""
+    return "\n".join(
+        str(item.get("content") or "") for item in items if isinstance(item, dict)
+    )
+
@@ -0,0 +1,102 @@
+"""
+Benchmark concurrent SQLite write throughput: stock engine vs. production profile.
+
+Simulates several gunicorn workers (separate processes) each committing small
+write transactions, the shape of typical API mutations. Run from the repo root:
+
+    python scripts/bench_sqlite_writes.py --workers 4 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, event, text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+
+def _make_engine(path: str, profile: bool):
+    url = f"sqlite:///{path}"
+    if not profile:
+        return create_engine(url, connect_args={"check_same_thread": False})
+
+    from app.config import settings
+    from app.database import _sqlite_pragmas
+
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": settings.sqlite_busy_timeout_ms / 1000},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in _sqlite_pragmas():
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+
+def _writer(path: str, profile: bool, seconds: float, results):
+    engine = _make_engine(path, profile)
+    commits = 0
+    locked = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("INSERT INTO bench (id, payload) VALUES (:id, :payload)"),
+                    {"id": str(uuid.uuid4()), "payload": "x" * 200},
+                )
+                conn.execute(text("SELECT COUNT(*) FROM bench WHERE id < :id"), {"id": "8"}).scalar()
+            commits += 1
+        except OperationalError:
+            locked += 1
+    engine.dispose()
+    results.put((commits, locked))
+
+
+def run(profile: bool, workers: int, seconds: float) -> tuple[float, int]:
+    directory = tempfile.mkdtemp(prefix="bench_sqlite_")
+    path = os.path.join(directory, "bench.db")
+    engine = _make_engine(path, profile)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE bench (id VARCHAR PRIMARY KEY, payload TEXT)"))
+    engine.dispose()
+
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=_writer, args=(path, profile, seconds, results))
+        for _ in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    totals = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    commits = sum(c for c, _ in totals)
+    locked = sum(lk for _, lk in totals)
+    return commits / seconds, locked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    for label, profile in (("default", False), ("profile", True)):
+        rate, locked = run(profile, args.workers, args.seconds)
+        print(f"{label:>8}: {rate:8.1f} commits/s   'database is locked' errors: {locked}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Fail if the hot `tasks` queries regress to full table scans.
+
+Builds a throwaway SQLite database, applies all migrations, then runs
+EXPLAIN QUERY PLAN on the same query shapes the routers and services use.
+Exits non-zero if any plan contains a `SCAN tasks` step. Run from the repo root:
+
+    python scripts/check_task_query_plans.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+_tmpdir = tempfile.mkdtemp(prefix="plan_check_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'plans.db')}"
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import or_, text  # noqa: E402
+
+from app.database import SessionLocal, engine  # noqa: E402
+from app.migrations import run_migrations  # noqa: E402
+from app.models.project import Project  # noqa: E402
+from app.models.task import Task, TaskTag  # noqa: E402
+
+
+def _queries(db):
+    user_id = "user-1"
+    now = datetime(2026, 1, 1, 12, 0)
+    not_proposed = or_(Task.project_id.is_(None), Project.status != "PROPOSED")
+    with_project = db.query(Task).outerjoin(Project, Task.project_id == Project.id)
+
+    return {
+        "TaskService.get_tasks": with_project.filter(
+            Task.user_id == user_id, not_proposed
+        ).order_by(Task.created_at.desc()),
+        "TaskService.get_tasks(active)": with_project.filter(
+            Task.user_id == user_id,
+            not_proposed,
+            Task.status.in_(["OPEN", "EVIDENCE_SUBMITTED", "OVERDUE"]),
+        ).order_by(Task.created_at.desc()),
+        "schedule scheduled window": with_project.filter(
+            Task.user_id == user_id,
+            Task.scheduled_time >= now,
+            Task.scheduled_time <= now + timedelta(days=7),
+            not_proposed,
+        ),
+        "schedule due window": with_project.filter(
+            Task.user_id == user_id,
+            Task.deadline >= now,
+            Task.deadline <= now + timedelta(days=7),
+            Task.status.in_(["OPEN", "EVIDENCE_SUBMITTED"]),
+            not_proposed,
+        ),
+        "dashboard_v2 incomplete": with_project.filter(
+            Task.user_id == user_id,
+            Task.status.in_(["OPEN", "EVIDENCE_SUBMITTED"]),
+            not_proposed,
+        ),
+        "reminder base query": with_project.filter(
+            Task.user_id == user_id,
+            Task.status != "DONE",
+            Task.status != "LOCKED",
+            not_proposed,
+        ),
+        "overdue sweep": with_project.filter(
+            Task.status == "OPEN",
+            Task.deadline.isnot(None),
+            Task.deadline < now,
+            not_proposed,
+        ),
+        "TaskService.get_tasks(tag)": with_project.filter(
+            Task.user_id == user_id,
+            not_proposed,
+            Task.id.in_(
+                db.query(TaskTag.task_id)
+                .filter(TaskTag.user_id == user_id, TaskTag.tag == "focus")
+                .scalar_subquery()
+            ),
+        ).order_by(Task.created_at.desc()),
+        "milestone rollup": db.query(Task).filter(Task.milestone_id == "milestone-1"),
+        "project status rollup": db.query(Task).filter(
+            Task.project_id == "project-1", Task.status.in_(["DONE", "EXCUSED"])
+        ),
+    }
+
+
+def main() -> int:
+    run_migrations()
+    db = SessionLocal()
+    failures = []
+    try:
+        for name, query in _queries(db).items():
+            sql = str(query.statement.compile(engine, compile_kwargs={"literal_binds": True}))
+            with engine.connect() as conn:
+                plan = [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+            scans = [step for step in plan if step.startswith(("SCAN tasks", "SCAN TABLE tasks"))]
+            status = "FULL SCAN" if scans else "ok"
+            print(f"[{status:>9}] {name}: {' | '.join(plan)}")
+            if scans:
+                failures.append(name)
+    finally:
+        db.close()
+
+    if failures:
+        print(f"\n{len(failures)} query plan(s) regressed to full scans: {', '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -27,7 +27,7 @@ async def test_ai():
         collected_info = {"goal": "Become Ultraman"}
         history = [{"role": "user", "content": "我要三个月成为奥特曼"}]
         
-        info_complete, message = conversation_service.gather_information(collected_info, history)
+        info_complete, message = await conversation_service.gather_information(collected_info, history)
         print(f"Result: Complete={info_complete}, Message={message}")
         
         if message == "好的，让我开始规划。":